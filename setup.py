@@ -49,6 +49,7 @@ setup(
     entry_points={
         "console_scripts": [
             "whisper-ctranslate2=whisper_ctranslate2.whisper_ctranslate2:main",
+            "whisper-ctranslate2-bench=whisper_ctranslate2.bench:main",
         ]
     },
 )
@@ -0,0 +1,231 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import platform
+import time
+import warnings
+
+from typing import List, Optional
+
+DEFAULT_PROFILE = "whisper-ctranslate2-profile.json"
+SAMPLING_RATE = 16000
+# Long enough to have several speech chunks when using batched transcription
+SAMPLE_DURATION = 60
+WARMUP_DURATION = 5
+COMPUTE_TYPES = [
+    "int8",
+    "int8_float32",
+    "int8_bfloat16",
+    "int16",
+    "bfloat16",
+    "float32",
+]
+BATCH_SIZES = [0, 4, 8, 16]
+WORKERS = [1, 2, 4]
+
+
+def get_cpu_info() -> dict:
+    cpu_model = None
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+
+    return dict(
+        cpu_model=cpu_model or platform.processor() or platform.machine(),
+        cpu_count=os.cpu_count() or 1,
+    )
+
+
+def save_profile(profile: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+        f.write("\n")
+
+
+def load_profile(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+
+    if not isinstance(profile, dict):
+        raise ValueError("the profile is not a JSON object")
+
+    return profile
+
+
+def get_profile_defaults(profile: dict, mode: str, model: str) -> dict:
+    """
+    Command line defaults from the configuration of the profile for the given mode
+    ('latency' or 'throughput'). Warns if the profile was created in a different
+    host or for a different model, since the configuration may not be the best one.
+    """
+    cpu_info = get_cpu_info()
+    for key, value in cpu_info.items():
+        if profile.get(key) != value:
+            warnings.warn(
+                f"Performance profile created for {key} '{profile.get(key)}' but this host has '{value}'. Run --autotune in this host to get optimal settings"
+            )
+
+    if profile.get("model") != model:
+        warnings.warn(
+            f"Performance profile created for model '{profile.get('model')}' but using '{model}'"
+        )
+
+    configuration = profile[mode]
+    return dict(
+        compute_type=configuration["compute_type"],
+        threads=configuration["threads"],
+        workers=configuration["workers"],
+        batched=configuration["batch_size"] > 0,
+        batch_size=configuration["batch_size"] or None,
+    )
+
+
+class AutoTuner:
+    """
+    Finds the fastest configuration for this CPU and model using short
+    microbenchmarks with a sample of the given audio. Each parameter is tuned in
+    turn keeping the best value of the previous ones: the quantization type and
+    threads for the single file latency and then the number of workers and batch
+    size for the throughput when transcribing several files in parallel.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        cache_directory: str,
+        local_files_only: bool,
+        task: str,
+        language: Optional[str],
+        options,
+    ):
+        self.model_path = model_path
+        self.cache_directory = cache_directory
+        self.local_files_only = local_files_only
+        self.task = task
+        self.language = language
+        self.options = options
+        self.cpu_info = get_cpu_info()
+        self.transcribe = None
+        self.loaded = None
+
+    def _load(self, compute_type: str, threads: int, workers: int):
+        from .transcribe import Transcribe
+
+        if self.loaded != (compute_type, threads, workers):
+            # Release the previous model before loading the next one
+            self.transcribe = None
+            self.transcribe = Transcribe(
+                self.model_path,
+                "cpu",
+                0,
+                compute_type,
+                max(1, threads // workers),
+                self.cache_directory,
+                self.local_files_only,
+                False,
+                None,
+                workers,
+            )
+            self.loaded = (compute_type, threads, workers)
+            self._inference(self.audio[: WARMUP_DURATION * SAMPLING_RATE])
+
+        return self.transcribe
+
+    def _inference(self, audio):
+        return self.transcribe.inference(
+            audio, self.task, self.language, False, True, self.options
+        )
+
+    def _measure(
+        self, compute_type: str, threads: int, workers: int, batch_size: int
+    ) -> float:
+        """Seconds of audio transcribed per second"""
+        transcribe = self._load(compute_type, threads, workers)
+        transcribe.batched = batch_size > 0
+        transcribe.batch_size = batch_size or None
+
+        start_time = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(self._inference, [self.audio] * workers))
+        elapsed = time.perf_counter() - start_time
+
+        speed = workers * len(self.audio) / SAMPLING_RATE / elapsed
+        print(
+            f"compute_type={compute_type} threads={threads} workers={workers} batch_size={batch_size}: {speed:.2f}x real time"
+        )
+        return speed
+
+    def _get_best(self, candidates: List[dict], configuration: dict) -> dict:
+        best, best_speed = None, 0.0
+        for candidate in candidates:
+            candidate = dict(configuration, **candidate)
+            try:
+                speed = self._measure(**candidate)
+            except (RuntimeError, ValueError) as e:
+                # For example, a quantization type not supported by this CPU
+                print(f"{candidate}: failed ({e})")
+                continue
+
+            if speed > best_speed:
+                best, best_speed = candidate, speed
+
+        if best is None:
+            raise RuntimeError("No configuration could be measured")
+
+        return best
+
+    def _get_compute_types(self) -> List[str]:
+        import ctranslate2
+
+        supported = ctranslate2.get_supported_compute_types("cpu")
+        return [
+            compute_type for compute_type in COMPUTE_TYPES if compute_type in supported
+        ]
+
+    def tune(self, audio_path: str, model: str) -> dict:
+        from faster_whisper.audio import decode_audio
+
+        self.audio = decode_audio(audio_path, sampling_rate=SAMPLING_RATE)[
+            : SAMPLE_DURATION * SAMPLING_RATE
+        ]
+        cpu_count = self.cpu_info["cpu_count"]
+        compute_types = self._get_compute_types()
+        if not compute_types:
+            raise RuntimeError(
+                f"None of the compute types {', '.join(COMPUTE_TYPES)} is supported in this CPU"
+            )
+
+        latency = dict(
+            compute_type=compute_types[0], threads=cpu_count, workers=1, batch_size=0
+        )
+        latency = self._get_best(
+            [dict(compute_type=value) for value in compute_types], latency
+        )
+        threads = sorted({cpu_count, max(1, cpu_count // 2), max(1, cpu_count // 4)})
+        latency = self._get_best([dict(threads=value) for value in threads], latency)
+        latency = self._get_best(
+            [dict(batch_size=value) for value in BATCH_SIZES], latency
+        )
+
+        throughput = self._get_best(
+            [dict(workers=value) for value in WORKERS if value <= cpu_count],
+            dict(latency, batch_size=0),
+        )
+        throughput = self._get_best(
+            [dict(batch_size=value) for value in BATCH_SIZES], throughput
+        )
+
+        self.transcribe = None
+        return dict(
+            self.cpu_info,
+            model=model,
+            created=datetime.datetime.now().isoformat(timespec="seconds"),
+            latency=latency,
+            throughput=throughput,
+        )
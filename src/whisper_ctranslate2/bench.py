@@ -0,0 +1,352 @@
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+from typing import List, Optional
+
+from .commandline import CommandLine
+from .inputs import iterate_audio_files
+from .version import __version__
+
+
+def _list(value_type):
+    def parse(string):
+        return [value_type(value.strip()) for value in string.split(",")]
+
+    return parse
+
+
+def get_configurations(
+    compute_types: List[str],
+    threads: List[int],
+    beam_sizes: List[int],
+    batch_sizes: List[int],
+    vad_filters: List[bool],
+    word_timestamps: List[bool],
+) -> List[dict]:
+    """All the combinations of the given values. A batch size of 0 means not batched"""
+    return [
+        dict(
+            compute_type=compute_type,
+            threads=thread_count,
+            beam_size=beam_size,
+            batch_size=batch_size,
+            vad_filter=vad_filter,
+            word_timestamps=word_timestamp,
+        )
+        for compute_type, thread_count, beam_size, batch_size, vad_filter, word_timestamp in itertools.product(
+            compute_types,
+            threads,
+            beam_sizes,
+            batch_sizes,
+            vad_filters,
+            word_timestamps,
+        )
+    ]
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+
+def get_host() -> dict:
+    import ctranslate2
+    import faster_whisper
+
+    return dict(
+        platform=platform.platform(),
+        processor=platform.processor() or platform.machine(),
+        cpu_count=os.cpu_count(),
+        python=platform.python_version(),
+        whisper_ctranslate2=__version__,
+        faster_whisper=faster_whisper.__version__,
+        ctranslate2=ctranslate2.__version__,
+    )
+
+
+def run_configuration(
+    configuration: dict,
+    audio: List[str],
+    model: str,
+    device: str,
+    cache_directory: Optional[str],
+    local_files_only: bool,
+    language: Optional[str],
+    repeat: int,
+    warmup: bool,
+) -> dict:
+    # Executed in a new process for each configuration to measure the model load
+    # time and the peak memory of the configuration alone
+    from .metrics import collect_metrics
+    from .transcribe import Transcribe
+    from .whisper_ctranslate2 import get_transcription_options
+
+    args = CommandLine.read_command_line(
+        [
+            "--beam_size",
+            str(configuration["beam_size"]),
+            "--vad_filter",
+            str(configuration["vad_filter"]),
+            "--word_timestamps",
+            str(configuration["word_timestamps"]),
+        ]
+    )
+    options = get_transcription_options(args)
+
+    start_time = time.perf_counter()
+    transcribe = Transcribe(
+        model,
+        device,
+        0,
+        configuration["compute_type"],
+        configuration["threads"],
+        cache_directory,
+        local_files_only,
+        configuration["batch_size"] > 0,
+        configuration["batch_size"] or None,
+        metrics=True,
+    )
+    model_load_time = time.perf_counter() - start_time
+
+    if warmup:
+        transcribe.inference(audio[0], "transcribe", language, False, True, options)
+
+    wall_time = 0.0
+    audio_duration = 0.0
+    tokens = 0
+    stages = {}
+    for _ in range(repeat):
+        for audio_path in audio:
+            with collect_metrics() as metrics:
+                result = transcribe.inference(
+                    audio_path, "transcribe", language, False, True, options
+                )
+
+            wall_time += metrics.total_time
+            audio_duration += metrics.audio_duration or 0
+            tokens += sum(len(segment["tokens"]) for segment in result["segments"])
+            for stage, stage_time in metrics.stages.items():
+                stages[stage] = stages.get(stage, 0.0) + stage_time
+
+    return dict(
+        configuration,
+        model_load_time=model_load_time,
+        wall_time=wall_time,
+        audio_duration=audio_duration,
+        real_time_factor=wall_time / audio_duration if audio_duration else None,
+        tokens=tokens,
+        tokens_per_second=tokens / wall_time if wall_time else None,
+        peak_rss_mb=get_peak_rss_mb(),
+        stages=stages,
+    )
+
+
+def write_csv(results: List[dict], output):
+    rows = []
+    for result in results:
+        row = {key: value for key, value in result.items() if key != "stages"}
+        for stage, stage_time in result.get("stages", {}).items():
+            row[f"stage_{stage}"] = stage_time
+        rows.append(row)
+
+    fieldnames = []
+    for row in rows:
+        fieldnames += [key for key in row if key not in fieldnames]
+
+    writer = csv.DictWriter(output, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_json(host: dict, results: List[dict], output):
+    json.dump(dict(host=host, results=results), output, indent=2)
+    output.write("\n")
+
+
+def read_command_line():
+    parser = argparse.ArgumentParser(
+        description="Measures the transcription performance of several configurations",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "audio",
+        nargs="+",
+        type=str,
+        help="Audio files or directories to transcribe, e.g. the e2e-tests directory of the repository",
+    )
+    parser.add_argument(
+        "--model",
+        default="small",
+        help="Name of the Whisper model or directory of a CTranslate2 model",
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default=None,
+        help="The path to save model files",
+    )
+    parser.add_argument(
+        "--local_files_only",
+        type=CommandLine._str2bool,
+        default=False,
+        help="Use models in cache without connecting to Internet to check if there are newer versions",
+    )
+    parser.add_argument(
+        "--device",
+        choices=["auto", "cpu", "cuda"],
+        default="cpu",
+        help="Device to use",
+    )
+    parser.add_argument(
+        "--language",
+        type=str,
+        default=None,
+        help="Language spoken in the audio, detected if not specified",
+    )
+    parser.add_argument(
+        "--compute_types",
+        type=_list(str),
+        default=["int8"],
+        help="Comma separated list of quantization types to measure",
+    )
+    parser.add_argument(
+        "--threads",
+        type=_list(int),
+        default=[0],
+        help="Comma separated list of number of CPU threads to measure (0 for the CTranslate2 default)",
+    )
+    parser.add_argument(
+        "--beam_sizes",
+        type=_list(int),
+        default=[5],
+        help="Comma separated list of beam sizes to measure",
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=_list(int),
+        default=[0],
+        help="Comma separated list of batch sizes to measure (0 for not batched)",
+    )
+    parser.add_argument(
+        "--vad_filter",
+        type=_list(CommandLine._str2bool),
+        default=[False],
+        help="Comma separated list of VAD filter values to measure (True,False)",
+    )
+    parser.add_argument(
+        "--word_timestamps",
+        type=_list(CommandLine._str2bool),
+        default=[False],
+        help="Comma separated list of word timestamps values to measure (True,False)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Number of times that the audio files are transcribed for each configuration",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=CommandLine._str2bool,
+        default=True,
+        help="Transcribe the first file once before measuring",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="-",
+        help="File to write the results ('-' for stdout)",
+    )
+    parser.add_argument(
+        "--output_format",
+        choices=["json", "csv"],
+        default="json",
+        help="Format of the results",
+    )
+    return parser.parse_args().__dict__
+
+
+def main():
+    args = read_command_line()
+    for audio_path in args["audio"]:
+        if not os.path.exists(audio_path):
+            sys.stderr.write(f"'{audio_path}' does not exist\n")
+            return
+
+    audio = list(iterate_audio_files(args["audio"]))
+    audio = [audio_path for audio_path in audio if os.path.isfile(audio_path)]
+    if len(audio) == 0:
+        sys.stderr.write("There are no audio files to benchmark\n")
+        return
+
+    if args["repeat"] < 1:
+        sys.stderr.write("--repeat must be 1 or greater\n")
+        return
+
+    configurations = get_configurations(
+        args["compute_types"],
+        args["threads"],
+        args["beam_sizes"],
+        args["batch_sizes"],
+        args["vad_filter"],
+        args["word_timestamps"],
+    )
+
+    results = []
+    for i, configuration in enumerate(configurations):
+        sys.stderr.write(f"[{i + 1}/{len(configurations)}] {configuration}\n")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            future = executor.submit(
+                run_configuration,
+                configuration,
+                audio,
+                args["model"],
+                args["device"],
+                args["model_dir"],
+                args["local_files_only"],
+                args["language"],
+                args["repeat"],
+                args["warmup"],
+            )
+            try:
+                result = future.result()
+            except Exception as e:
+                # For example, a quantization type not supported by the device
+                sys.stderr.write(f"Configuration failed: {e}\n")
+                result = dict(configuration, error=f"{type(e).__name__}: {e}")
+
+        results.append(result)
+
+    output = sys.stdout
+    if args["output"] != "-":
+        output = open(args["output"], "w", encoding="utf-8", newline="")
+
+    try:
+        if args["output_format"] == "csv":
+            write_csv(results, output)
+        else:
+            write_json(get_host(), results, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
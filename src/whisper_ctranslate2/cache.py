@@ -0,0 +1,388 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from typing import TYPE_CHECKING, List, Optional, TextIO, Tuple
+
+from .rttm import Turn, read_rttm, write_rttm
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Seconds after which the temporary file of an entry being written is considered
+# left behind by a process that did not finish writing it
+STALE_TEMP_AGE = 3600
+# Comment line of the diarization cache entries with the VAD speech chunks
+SPEECH_CHUNKS_COMMENT = ";; speech_chunks "
+# Files whose hash is remembered, the caches of a run hash the same files
+MAX_FILE_HASHES = 65536
+
+
+def hash_file(path: str) -> str:
+    """
+    SHA-256 of the content of the file. It is computed once while the file does not
+    change, then the results, audio and diarization caches read the file only once
+    """
+    stat = os.stat(path)
+    return _hash_file(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=MAX_FILE_HASHES)
+def _hash_file(path: str, size: int, mtime_ns: int) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def hash_settings(**settings) -> str:
+    key = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # Already removed, or still open in Windows
+        pass
+
+
+def _touch(path: str):
+    """Marks a cache entry as recently used"""
+    try:
+        os.utime(path)
+    except OSError:
+        # e.g. a read-only cache, the entry is still valid
+        pass
+
+
+class SizeLimit:
+    """
+    Keeps the size of the entries of a cache directory below a maximum. When it is
+    exceeded, the least recently used entries (based on the modification time,
+    refreshed on every hit) are removed until the size is below 90% of the maximum.
+
+    The directory is scanned once and then the size is updated with the entries
+    written. The entries written by other processes are only accounted when the
+    directory is scanned again to evict entries. Scanning also removes the
+    temporary files left by processes that crashed while writing an entry.
+    """
+
+    # Fraction of the maximum size kept when evicting, then a full directory is
+    # not scanned again on every write
+    evict_to: float = 0.9
+
+    def __init__(self, directory: str, extension: str, max_size: int):
+        self.directory = directory
+        self.extension = extension
+        self.max_size = max_size
+        self.size: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def add(self, size: int):
+        """Accounts an entry of 'size' bytes written to the directory"""
+        with self.lock:
+            if self.size is None:
+                self.size = self._evict(self.max_size)
+            else:
+                self.size += size
+
+            if self.size > self.max_size:
+                self.size = self._evict(int(self.max_size * self.evict_to))
+
+    def _evict(self, max_size: int) -> int:
+        """Removes the least recently used entries until the size is below
+        max_size. Returns the size of the entries left"""
+        entries = []
+        total_size = 0
+        stale_time = time.time() - STALE_TEMP_AGE
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                is_temp = entry.name.endswith(".tmp")
+                if not is_temp and not entry.name.endswith(self.extension):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                if is_temp:
+                    if stat.st_mtime < stale_time:
+                        _remove(entry.path)
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= max_size:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already removed by another process
+                pass
+            except OSError:
+                # In use, memory mapped files cannot be removed in Windows
+                continue
+
+            total_size -= size
+
+        return total_size
+
+
+class ResultCache:
+    """
+    On-disk cache of transcription results keyed by the content of the audio file
+    and all the settings that affect the transcription.
+
+    Each entry is stored in its own JSON file. Entries are written to a temporary
+    file and then renamed, then several processes can share the same directory.
+    The least recently used entries are removed when the size of the directory
+    exceeds the maximum, see SizeLimit.
+    """
+
+    extension: str = ".json"
+
+    def __init__(self, directory: str, max_size_mb: int):
+        self.directory = directory
+        self.size_limit = SizeLimit(
+            directory, self.extension, max_size_mb * 1024 * 1024
+        )
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, audio_path: str, **settings) -> str:
+        return hash_settings(audio=hash_file(audio_path), **settings)
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.extension)
+
+    def _read(self, f: TextIO):
+        return json.load(f)
+
+    def _write(self, result, f: TextIO):
+        json.dump(result, f, ensure_ascii=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._get_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = self._read(f)
+        except (OSError, ValueError):
+            result = None
+        else:
+            _touch(path)
+
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return result
+
+    def put(self, key: str, result: dict):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                self._write(result, f)
+
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, self._get_path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        self.size_limit.add(size)
+
+
+class DiarizationCache(ResultCache):
+    """
+    On-disk cache of the speaker turns of the diarization keyed by the content of
+    the audio file, the number of speakers, the diarization pipeline and the VAD
+    parameters if only the speech is diarized. Entries are stored as RTTM files,
+    with the speech chunks found by the VAD in a comment line, then the runs that
+    use the cached turns do not run the VAD again to transcribe.
+    """
+
+    extension: str = ".rttm"
+
+    def __init__(
+        self,
+        directory: str,
+        num_speakers: int,
+        pipeline: str,
+        vad_parameters: Optional[dict] = None,
+        max_size_mb: int = 100,
+    ):
+        super().__init__(directory, max_size_mb)
+        self.settings = dict(num_speakers=num_speakers, pipeline=pipeline)
+        if vad_parameters is not None:
+            self.settings["vad_parameters"] = vad_parameters
+
+    def get_key(self, audio_path: str) -> str:
+        return super().get_key(audio_path, **self.settings)
+
+    def get(self, key: str) -> Optional[List[Turn]]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[List[Turn], Optional[List[dict]]]]:
+        """Speaker turns and the speech chunks, if the speech was diarized"""
+        return super().get(key)
+
+    def put(
+        self, key: str, turns: List[Turn], speech_chunks: Optional[List[dict]] = None
+    ):
+        super().put(key, (turns, speech_chunks))
+
+    def _read(self, f: TextIO) -> Tuple[List[Turn], Optional[List[dict]]]:
+        speech_chunks = None
+        for line in f:
+            if line.startswith(SPEECH_CHUNKS_COMMENT):
+                speech_chunks = json.loads(line[len(SPEECH_CHUNKS_COMMENT) :])
+
+        f.seek(0)
+        # An entry without turns has no SPEAKER lines
+        return next(iter(read_rttm(f).values()), []), speech_chunks
+
+    def _write(self, entry: Tuple[List[Turn], Optional[List[dict]]], f: TextIO):
+        turns, speech_chunks = entry
+        if speech_chunks is not None:
+            f.write(SPEECH_CHUNKS_COMMENT + json.dumps(speech_chunks) + "\n")
+        write_rttm(turns, "audio", f)
+
+
+class AudioCache:
+    """
+    On-disk cache of decoded audio (16 kHz mono) keyed by the content of the audio
+    file, then files are decoded only once across runs and processes.
+
+    Entries are stored as .npy files that are memory mapped when loaded, then the
+    samples are read on demand and the pages are shared between the processes that
+    use the same file. With int16 entries take half of the size but the samples
+    have to be converted to float32 when loaded. The conversion is lossless since
+    the audio is decoded as 16-bit samples.
+
+    With max_size_mb the least recently used entries are removed when the size of
+    the directory exceeds it, see SizeLimit.
+    """
+
+    extension: str = ".npy"
+    sampling_rate: int = 16000
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: str = "float32",
+        max_size_mb: Optional[int] = None,
+    ):
+        self.directory = directory
+        self.dtype = dtype
+        self.size_limit = None
+        if max_size_mb is not None:
+            self.size_limit = SizeLimit(
+                directory, self.extension, max_size_mb * 1024 * 1024
+            )
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, audio_path: str) -> str:
+        key = hash_settings(
+            audio=hash_file(audio_path),
+            sampling_rate=self.sampling_rate,
+            dtype=self.dtype,
+        )
+        return os.path.join(self.directory, key + self.extension)
+
+    def _to_float32(self, audio: "np.ndarray") -> "np.ndarray":
+        import numpy as np
+
+        if audio.dtype == np.int16:
+            return audio.astype(np.float32) / 32768.0
+
+        return audio
+
+    def _store(self, audio_path: str, path: str) -> Tuple["np.ndarray", int]:
+        """Decoded audio and the size of the entry stored"""
+        import numpy as np
+
+        from faster_whisper.audio import decode_audio
+
+        audio = decode_audio(audio_path, sampling_rate=self.sampling_rate)
+        if self.dtype == "int16":
+            audio = np.round(audio * 32768.0).astype(np.int16)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, audio)
+
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        self.add_size(size)
+        return audio, size
+
+    def add_size(self, size: int):
+        """Accounts an entry of 'size' bytes stored, also by other processes"""
+        if self.size_limit:
+            self.size_limit.add(size)
+
+    def load(self, audio_path: str) -> "np.ndarray":
+        """Float32 samples of the audio, decoding and storing them if not cached"""
+        import numpy as np
+
+        path = self._get_path(audio_path)
+        try:
+            # Copy on write, consumers can modify the samples without changing the entry
+            audio = np.load(path, mmap_mode="c")
+            hit = True
+        except (OSError, ValueError):
+            audio, _ = self._store(audio_path, path)
+            hit = False
+        else:
+            _touch(path)
+
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return self._to_float32(audio)
+
+    def prepare(self, audio_path: str) -> int:
+        """Stores the decoded audio if not cached. Returns the size of the entry
+        stored, 0 if it was already cached"""
+        path = self._get_path(audio_path)
+        if os.path.exists(path):
+            _touch(path)
+            return 0
+
+        _, size = self._store(audio_path, path)
+        return size
+
+
+def prepare_audio_file(directory: str, dtype: str, audio_path: str) -> int:
+    # Entries are evicted by the calling process, which accounts the sizes of all
+    # the files prepared
+    return AudioCache(directory, dtype).prepare(audio_path)
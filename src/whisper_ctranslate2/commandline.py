@@ -1,5 +1,8 @@
 import argparse
+import os
 
+from .autotune import DEFAULT_PROFILE, get_profile_defaults, load_profile
+from .inputs import AUDIO_EXTENSIONS
 from .languages import LANGUAGES, TO_LANGUAGE_CODE
 from .version import __version__
 
@@ -43,12 +46,65 @@ class CommandLine:
         return None if string == "None" else float(string)
 
     @staticmethod
-    def read_command_line():
+    def _extensions(string):
+        return [
+            extension.strip().lstrip(".").lower() for extension in string.split(",")
+        ]
+
+    @staticmethod
+    def _shard(string):
+        index, count = (int(value) for value in string.split("/"))
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Expected i/N with 0 <= i < N, got {string}")
+        return index, count
+
+    @staticmethod
+    def read_command_line(argv=None):
         parser = argparse.ArgumentParser(
             formatter_class=argparse.ArgumentDefaultsHelpFormatter
         )
         parser.add_argument(
-            "audio", nargs="*", type=str, help="Audio file(s) to transcribe"
+            "audio",
+            nargs="*",
+            type=str,
+            help="Audio file(s) to transcribe. '-' reads the audio from stdin, which like named pipes is transcribed as it arrives",
+        )
+
+        input_args = parser.add_argument_group("Input options")
+
+        input_args.add_argument(
+            "--input_list",
+            type=str,
+            default=None,
+            help="File with the audio files to transcribe, one path per line ('-' to read from stdin). Files are read as they are processed",
+        )
+
+        input_args.add_argument(
+            "--input_extensions",
+            type=CommandLine._extensions,
+            default=AUDIO_EXTENSIONS,
+            help="Comma-separated list of file extensions to include when a directory is given as input (directories are traversed recursively)",
+        )
+
+        input_args.add_argument(
+            "--input_format",
+            choices=["auto", "s16le", "f32le"],
+            default="auto",
+            help="Format of the audio read from stdin or named pipes: any container that can be decoded without seeking (auto) or raw mono PCM samples",
+        )
+
+        input_args.add_argument(
+            "--input_sample_rate",
+            type=int,
+            default=16000,
+            help="Sample rate of the raw PCM audio read from stdin or named pipes",
+        )
+
+        input_args.add_argument(
+            "--shard",
+            type=CommandLine._shard,
+            default=None,
+            help="Process only the shard i/N of the input files (e.g. 0/4) to split the same input between several machines",
         )
 
         model_args = parser.add_argument_group("Model selection options")
@@ -83,6 +139,48 @@ class CommandLine:
             help="Use only models in cache without connecting to Internet to check for newer versions",
         )
 
+        caching_args.add_argument(
+            "--result_cache_dir",
+            type=str,
+            default=None,
+            help="Directory where to cache the transcription results. Files already transcribed with the same audio content, model and options are not transcribed again",
+        )
+
+        caching_args.add_argument(
+            "--result_cache_max_size",
+            type=int,
+            default=1024,
+            help="Maximum size in megabytes of the transcription results cache. The least recently used results are removed when it is exceeded",
+        )
+
+        caching_args.add_argument(
+            "--audio_cache_dir",
+            type=str,
+            default=None,
+            help="Directory where to cache the decoded audio. Files with the same audio content are not decoded again, neither for transcription nor for diarization",
+        )
+
+        caching_args.add_argument(
+            "--audio_cache_max_size",
+            type=int,
+            default=10240,
+            help="Maximum size in megabytes of the decoded audio cache. The least recently used files are removed when it is exceeded",
+        )
+
+        caching_args.add_argument(
+            "--audio_cache_dtype",
+            choices=["float32", "int16"],
+            default="float32",
+            help="Type of the samples stored in the decoded audio cache. float32 is loaded without copies, int16 takes half of the space",
+        )
+
+        caching_args.add_argument(
+            "--prepare_audio",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Only decode the audio files into --audio_cache_dir in parallel, to transcribe them later",
+        )
+
         outputs_args = parser.add_argument_group(
             "Configuration options to control generated outputs"
         )
@@ -99,8 +197,8 @@ class CommandLine:
             "-f",
             type=str,
             default="all",
-            choices=["txt", "vtt", "srt", "tsv", "json", "all"],
-            help="Format of the output file; if not specified, all available formats will be produced",
+            choices=["txt", "vtt", "srt", "tsv", "json", "jsonl", "all"],
+            help="Format of the output file; if not specified, all available formats will be produced (except jsonl)",
         )
 
         outputs_args.add_argument(
@@ -118,6 +216,27 @@ class CommandLine:
             help="Print the transcribed text using an experimental color coding strategy to highlight words with high or low confidence",
         )
 
+        outputs_args.add_argument(
+            "--stream_output",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Write each segment to the output files as soon as it is transcribed instead of keeping the whole transcription in memory",
+        )
+
+        outputs_args.add_argument(
+            "--resume",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Record the status of every file in a manifest in the output directory and skip the files already completed with the same options when running again",
+        )
+
+        outputs_args.add_argument(
+            "--resume_max_retries",
+            type=int,
+            default=2,
+            help="When using --resume, maximum number of times that a file that failed is retried in later runs",
+        )
+
         outputs_args.add_argument(
             "--verbose",
             type=CommandLine._str2bool,
@@ -170,6 +289,62 @@ class CommandLine:
             help="Number of threads used for CPU inference",
         )
 
+        computing_args.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of files transcribed in parallel. The model is loaded once with this number of CTranslate2 workers and the threads are split between them",
+        )
+
+        computing_args.add_argument(
+            "--split_long_files",
+            type=float,
+            default=0,
+            help="Split the files longer than these seconds into --workers windows at silence boundaries that are transcribed in parallel (0 to disable)",
+        )
+
+        computing_args.add_argument(
+            "--prefetch",
+            type=int,
+            default=0,
+            help="Number of upcoming files to decode in background while the current one is being transcribed",
+        )
+
+        computing_args.add_argument(
+            "--sort_by_duration",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Transcribe the longest files first (durations are read from the file metadata) to avoid long files at the end when using several workers",
+        )
+
+        computing_args.add_argument(
+            "--show_eta",
+            type=CommandLine._str2bool,
+            default=False,
+            help="After each file, print the estimated completion time based on the real-time factor so far",
+        )
+
+        computing_args.add_argument(
+            "--metrics",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Measure the time used by each processing stage, add it to the JSON output under 'metrics' and print a summary at the end",
+        )
+
+        computing_args.add_argument(
+            "--autotune",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Measure the performance of several configurations on this CPU with the selected model using the first audio file and save the fastest ones in the --perf_profile file",
+        )
+
+        computing_args.add_argument(
+            "--perf_profile",
+            type=str,
+            default=None,
+            help=f"Performance profile created with --autotune (default '{DEFAULT_PROFILE}' when tuning). Its settings are used unless given in the command line",
+        )
+
         computing_args.add_argument(
             "--device_index",
             type=int,
@@ -365,6 +540,13 @@ class CommandLine:
             help="When using batched transcription, maximum number of parallel requests to model for decoding.",
         )
 
+        algorithm_args.add_argument(
+            "--batch_files",
+            type=int,
+            default=1,
+            help="When using batched transcription, number of files whose speech chunks are packed together in the same batches. Improves the throughput when transcribing many short files",
+        )
+
         algorithm_args.add_argument(
             "--multilingual",
             type=CommandLine._str2bool,
@@ -438,6 +620,85 @@ class CommandLine:
             help="Number of speakers to use for diarization.",
         )
 
+        diarization_args.add_argument(
+            "--word_speakers",
+            type=CommandLine._str2bool,
+            default=False,
+            help="With --word_timestamps True, assign the speaker of every word and split the segments where the speaker changes instead of assigning a speaker to the whole segment.",
+        )
+
+        diarization_args.add_argument(
+            "--concurrent_diarization",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Run the diarization in a separate process at the same time that the files are transcribed instead of diarizing all the files first.",
+        )
+
+        diarization_args.add_argument(
+            "--diarization_vad",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Diarize only the speech found by the VAD, using the --vad_* parameters. With --vad_filter True the transcription reuses the same speech timestamps when possible.",
+        )
+
+        diarization_args.add_argument(
+            "--diarization_cache_dir",
+            type=str,
+            default=None,
+            help="Directory where to cache the speaker turns of the diarization as RTTM files. Files with the same audio content and number of speakers are not diarized again.",
+        )
+
+        diarization_args.add_argument(
+            "--rttm_input",
+            type=str,
+            default=None,
+            help="RTTM file with the speaker turns of the audio files computed elsewhere, instead of running the diarization. Turns are matched by the name of the audio file without extension.",
+        )
+
+        server_args = parser.add_argument_group("Server options")
+
+        server_args.add_argument(
+            "--serve",
+            type=CommandLine._str2bool,
+            default=False,
+            help="Start a local server that keeps the model loaded and transcribes the audio sent by clients",
+        )
+
+        server_args.add_argument(
+            "--server_host",
+            type=str,
+            default="127.0.0.1",
+            help="Address where the server listens",
+        )
+
+        server_args.add_argument(
+            "--server_port",
+            type=int,
+            default=8765,
+            help="Port where the server listens",
+        )
+
+        server_args.add_argument(
+            "--server_socket",
+            type=str,
+            default=None,
+            help="Path of a Unix socket where the server listens instead of using a TCP port",
+        )
+
+        server_args.add_argument(
+            "--server_queue_size",
+            type=int,
+            default=16,
+            help="Maximum number of requests waiting for a free worker. Requests beyond this limit are rejected",
+        )
+
+        server_args.add_argument(
+            "--server_url",
+            type=str,
+            default=None,
+            help="Send the audio files to a running server (e.g. http://127.0.0.1:8765 or unix:///tmp/whisper.sock) instead of loading the model",
+        )
+
         live_args = parser.add_argument_group("Live transcribe options")
 
         live_args.add_argument(
@@ -468,4 +729,33 @@ class CommandLine:
             help="Set live sample rate of input device",
         )
 
-        return parser.parse_args().__dict__
+        args = parser.parse_args(argv)
+        if args.perf_profile and not args.autotune:
+            # The profile replaces the defaults, then explicit options take precedence
+            multiple_files = (
+                args.input_list is not None
+                or len(args.audio) > 1
+                or any(os.path.isdir(audio_path) for audio_path in args.audio)
+            )
+            try:
+                profile_defaults = get_profile_defaults(
+                    load_profile(args.perf_profile),
+                    "throughput" if multiple_files else "latency",
+                    args.model_directory or args.model,
+                )
+            except KeyError as e:
+                parser.error(f"--perf_profile '{args.perf_profile}' has no {e} setting")
+            except (OSError, ValueError, TypeError) as e:
+                parser.error(
+                    f"Unable to read --perf_profile '{args.perf_profile}': {e}"
+                )
+
+            batch_size = parser.get_default("batch_size")
+            parser.set_defaults(**profile_defaults)
+            args = parser.parse_args(argv)
+            if not args.batched and args.batch_size != batch_size:
+                # An explicit --batched False also disables the profile batch size
+                parser.set_defaults(batch_size=batch_size)
+                args = parser.parse_args(argv)
+
+        return args.__dict__
@@ -1,8 +1,23 @@
-from collections import OrderedDict
+import datetime
+import gc
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+
+from typing import List, Optional, Union
 
 import numpy as np
 
 from faster_whisper.audio import decode_audio
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+
+from .cache import AudioCache, DiarizationCache
+from .rttm import Turn
+from .speakers import SpeakerAssignment
+
+SAMPLING_RATE = 16000
 
 try:
     import torch
@@ -17,28 +32,76 @@ except Exception as e:
     )
 
 
-class Diarization:
+class SharedAudio:
+    """
+    Audio decoded into a temporary file mapped in memory. The diarization process
+    maps the same file, then both processes use the same buffer instead of
+    decoding the audio twice.
+    """
+
+    def __init__(self, audio_path: str):
+        audio = decode_audio(audio_path)
+        self.filename = None
+        self.audio = audio
+        if len(audio) == 0:
+            # Empty files cannot be mapped, the diarization decodes the file itself
+            return
+
+        # In Linux /dev/shm is in memory, otherwise the pages are in the disk cache
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, self.filename = tempfile.mkstemp(suffix=".f32", dir=directory)
+        os.close(fd)
+        try:
+            self.audio = np.memmap(
+                self.filename, dtype=np.float32, mode="w+", shape=audio.shape
+            )
+            self.audio[:] = audio
+            self.audio.flush()
+        except BaseException:
+            os.remove(self.filename)
+            raise
+
+    @staticmethod
+    def open(filename: str) -> np.ndarray:
+        # Copy-on-write, torch requires a writable array but never writes it
+        return np.memmap(filename, dtype=np.float32, mode="c")
+
+    def release(self):
+        """Removes the file, its memory is freed once no process maps it"""
+        self.audio = None
+        if self.filename:
+            os.remove(self.filename)
+            self.filename = None
+
+
+class Diarization(SpeakerAssignment):
+    model_name: str = "pyannote/speaker-diarization-community-1"
+
     def __init__(
         self,
         token=None,
         device: str = "cpu",
         num_speakers=2,
     ):
+        super().__init__()
         self.device = device
         self.token = token
         self.num_speakers = num_speakers
+        self.model = None
 
     def set_threads(self, threads):
         torch.set_num_threads(threads)
 
-    def unload_model(self):
-        del self.model
-        torch.cuda.empty_cache()
+    def load_model(self):
+        """
+        Loads the pipeline the first time that it is needed, then it is reused for
+        all the files until unload_model is called
+        """
+        if self.model is not None:
+            return
 
-    def _load_model(self):
-        model_name = "pyannote/speaker-diarization-community-1"
         device = torch.device(self.device)
-        model_handle = Pipeline.from_pretrained(model_name, token=self.token)
+        model_handle = Pipeline.from_pretrained(self.model_name, token=self.token)
         if model_handle is None:
             raise ValueError(
                 f"The token Hugging Face token '{self.token}' for diarization is not valid or you did not accept the EULAs for the necessary models. See https://github.com/Softcatala/whisper-ctranslate2#diarization-speaker-identification"
@@ -46,66 +109,220 @@ class Diarization:
 
         self.model = model_handle.to(device)
 
-    def run_model(self, audio: str):
-        self._load_model()
-        audio = decode_audio(audio)
+    def unload_model(self):
+        """Releases the pipeline and the GPU memory that it uses"""
+        if self.model is None:
+            return
+
+        self.model = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def run_model(
+        self,
+        audio: Union[str, np.ndarray],
+        speech_chunks: Optional[List[dict]] = None,
+    ):
+        """
+        Speaker turns of the audio. With speech_chunks only the speech is diarized,
+        concatenated, and the turns are mapped back to the timeline of the audio
+        """
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio)
+        if speech_chunks is not None:
+            if not speech_chunks:
+                return []
+            audio = np.concatenate(collect_chunks(audio, speech_chunks)[0])
+
+        self.load_model()
         audio_data = {
             "waveform": torch.from_numpy(audio[None, :]),
-            "sample_rate": 16000,
+            "sample_rate": SAMPLING_RATE,
         }
         segments = self.model(audio_data, num_speakers=self.num_speakers)
-        return segments
+        turns = [
+            Turn(turn.start, turn.end, speaker)
+            for turn, speaker in segments.speaker_diarization
+        ]
+        if speech_chunks is not None:
+            turns = restore_turn_timestamps(turns, speech_chunks)
+        return turns
 
-    def assign_speakers_to_segments(self, segments, transcript_result, speaker_name):
-        diarize_data = []
-        for turn, speaker in segments.speaker_diarization:
-            diarize_data.append((turn, None, speaker))
 
-        return self._do_assign_speakers_to_segments(
-            diarize_data, transcript_result, speaker_name
-        )
+def get_speech_chunks(audio: np.ndarray, vad_parameters: dict) -> List[dict]:
+    """Speech timestamps in samples found by the Silero VAD"""
+    return get_speech_timestamps(audio, VadOptions(**vad_parameters))
 
-    def _do_assign_speakers_to_segments(
-        self, diarize_data, transcript_result, speaker_name
-    ):
-        diarize_df = np.array(
-            diarize_data,
-            dtype=[("segment", object), ("label", object), ("speaker", object)],
+
+def restore_turn_timestamps(
+    turns: List[Turn], speech_chunks: List[dict], sampling_rate: int = SAMPLING_RATE
+) -> List[Turn]:
+    """
+    Maps the turns of the concatenated speech chunks back to the timeline of the
+    whole audio. Turns that span several chunks are split at the silences between.
+    """
+    starts = np.array([chunk["start"] for chunk in speech_chunks]) / sampling_rate
+    ends = np.array([chunk["end"] for chunk in speech_chunks]) / sampling_rate
+    # Position of each chunk in the concatenated audio
+    offsets = np.concatenate(([0], np.cumsum(ends - starts)))
+
+    restored = []
+    for turn in turns:
+        first = max(np.searchsorted(offsets, turn.start, side="right") - 1, 0)
+        last = min(np.searchsorted(offsets, turn.end, side="left"), len(starts))
+        for i in range(first, last):
+            start = max(turn.start, offsets[i]) - offsets[i] + starts[i]
+            end = min(turn.end, offsets[i + 1]) - offsets[i] + starts[i]
+            if end > start:
+                restored.append(Turn(float(start), float(end), turn.speaker))
+
+    return restored
+
+
+def _diarization_worker(
+    token,
+    device,
+    num_speakers,
+    threads,
+    verbose,
+    audio_cache_dir,
+    audio_cache_dtype,
+    audio_cache_max_size,
+    diarization_cache_dir,
+    vad_parameters,
+    requests,
+    results,
+):
+    diarize_model = Diarization(token=token, device=device, num_speakers=num_speakers)
+    if threads > 0:
+        diarize_model.set_threads(threads)
+
+    audio_cache = None
+    if audio_cache_dir:
+        audio_cache = AudioCache(
+            audio_cache_dir, audio_cache_dtype, audio_cache_max_size
         )
 
-        diarize_df = np.core.records.fromarrays(
-            [
-                diarize_df["segment"],
-                diarize_df["label"],
-                diarize_df["speaker"],
-                np.array([seg.start for seg in diarize_df["segment"]]),
-                np.array([seg.end for seg in diarize_df["segment"]]),
-                np.zeros(len(diarize_df)),
-            ],
-            names="segment, label, speaker, start, end, intersection",
+    diarization_cache = None
+    if diarization_cache_dir:
+        diarization_cache = DiarizationCache(
+            diarization_cache_dir, num_speakers, Diarization.model_name, vad_parameters
         )
 
-        for seg in transcript_result["segments"]:
-            intersection = np.minimum(diarize_df["end"], seg["end"]) - np.maximum(
-                diarize_df["start"], seg["start"]
-            )
-            diarize_df["intersection"] = intersection
-            dia_segment = diarize_df[diarize_df["intersection"] > 0]
-            if len(dia_segment) > 0:
-                speakers = {}
-                for item in dia_segment:
-                    speaker = item["speaker"]
-                    old_i = speakers.get(speaker, 0)
-                    speakers[speaker] = old_i + item["intersection"]
-
-                sorted_dict = OrderedDict(
-                    sorted(speakers.items(), key=lambda x: x[1], reverse=True)
+    while (request := requests.get()) is not None:
+        audio_path, audio_file = request
+        try:
+            start_time = datetime.datetime.now()
+            turns = None
+            if diarization_cache:
+                cache_key = diarization_cache.get_key(audio_path)
+                turns = diarization_cache.get(cache_key)
+
+            if turns is None:
+                if audio_file:
+                    audio = SharedAudio.open(audio_file)
+                elif audio_cache:
+                    audio = audio_cache.load(audio_path)
+                else:
+                    audio = decode_audio(audio_path)
+
+                speech_chunks = None
+                if vad_parameters is not None:
+                    speech_chunks = get_speech_chunks(audio, vad_parameters)
+
+                turns = diarize_model.run_model(audio, speech_chunks)
+                # Unmap the shared audio before the calling process releases it
+                del audio
+                if diarization_cache:
+                    diarization_cache.put(cache_key, turns, speech_chunks)
+
+            if verbose:
+                print(
+                    f"Time used for diarization of '{audio_path}': {datetime.datetime.now() - start_time}"
                 )
-                first_item = next(iter(sorted_dict.items()))
-                if first_item:
-                    speaker = first_item[0]
-                    if speaker_name:
-                        speaker = speaker.replace("SPEAKER", speaker_name)
-                    seg["speaker"] = speaker
-
-        return transcript_result
+            results.put((audio_path, turns, None))
+        except Exception as e:
+            results.put((audio_path, None, f"{type(e).__name__}: {e}"))
+
+
+class DiarizationProcess:
+    """
+    Runs the diarization in a separate process, with its own torch and CUDA context,
+    while the files are transcribed. Files are diarized in the order that they are
+    submitted and their speaker turns are streamed back to the calling process.
+    """
+
+    def __init__(
+        self,
+        token=None,
+        device: str = "cpu",
+        num_speakers=2,
+        threads: int = 0,
+        verbose: bool = False,
+        audio_cache_dir: Optional[str] = None,
+        audio_cache_dtype: str = "float32",
+        audio_cache_max_size: Optional[int] = None,
+        diarization_cache_dir: Optional[str] = None,
+        vad_parameters: Optional[dict] = None,
+    ):
+        """vad_parameters are set to diarize only the speech found by the VAD"""
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(
+            target=_diarization_worker,
+            args=(
+                token,
+                device,
+                num_speakers,
+                threads,
+                verbose,
+                audio_cache_dir,
+                audio_cache_dtype,
+                audio_cache_max_size,
+                diarization_cache_dir,
+                vad_parameters,
+                self.requests,
+                self.results,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        self.received = {}
+        self.lock = threading.Lock()
+
+    def submit(self, audio_path: str, audio_file: Optional[str] = None):
+        """audio_file is the file of a SharedAudio with the decoded audio, if any"""
+        self.requests.put((audio_path, audio_file))
+
+    def close(self):
+        """Signals that no more files will be submitted"""
+        self.requests.put(None)
+
+    def join(self):
+        self.process.join()
+
+    def get_turns(self, audio_path: str):
+        """Waits until the diarization of a submitted file is available"""
+        with self.lock:
+            while audio_path not in self.received:
+                try:
+                    path, turns, error = self.results.get(timeout=1)
+                except queue.Empty:
+                    if not self.process.is_alive():
+                        raise RuntimeError(
+                            f"Diarization process exited with code {self.process.exitcode}"
+                        )
+                    continue
+
+                self.received.setdefault(path, []).append((turns, error))
+
+            turns, error = self.received[audio_path].pop(0)
+            if not self.received[audio_path]:
+                del self.received[audio_path]
+
+        if error:
+            raise RuntimeError(f"Diarization failed: {error}")
+
+        return turns
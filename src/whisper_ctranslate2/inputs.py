@@ -0,0 +1,89 @@
+import itertools
+import os
+import stat
+import sys
+
+from typing import Iterable, Iterator, List, Optional
+
+STDIN = "-"
+AUDIO_EXTENSIONS = [
+    "aac",
+    "aiff",
+    "avi",
+    "flac",
+    "m4a",
+    "mkv",
+    "mov",
+    "mp3",
+    "mp4",
+    "oga",
+    "ogg",
+    "opus",
+    "wav",
+    "webm",
+    "wma",
+]
+
+
+def is_stream(path: str) -> bool:
+    """Standard input or a named pipe, which can only be read once as it arrives"""
+    if path == STDIN:
+        return True
+
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def _iterate_directory(directory: str, extensions: List[str]) -> Iterator[str]:
+    for root, dirnames, filenames in os.walk(directory):
+        # Sorted to always produce the same order, needed for sharding
+        dirnames.sort()
+        for filename in sorted(filenames):
+            extension = os.path.splitext(filename)[1][1:].lower()
+            if extension in extensions:
+                yield os.path.join(root, filename)
+
+
+def _iterate_input_list(input_list: str) -> Iterator[str]:
+    if input_list == STDIN:
+        lines = sys.stdin
+    else:
+        lines = open(input_list, "r", encoding="utf-8")
+
+    try:
+        for line in lines:
+            path = line.strip()
+            if path:
+                yield path
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def iterate_audio_files(
+    audio: Iterable[str],
+    input_list: Optional[str] = None,
+    extensions: Optional[List[str]] = None,
+) -> Iterator[str]:
+    """
+    Lazily enumerates the audio files to process from the paths given in the command
+    line and from a file with one path per line ('-' for stdin). Directories are
+    traversed recursively including only the files with the given extensions.
+    """
+    extensions = AUDIO_EXTENSIONS if extensions is None else extensions
+    paths = audio
+    if input_list:
+        paths = itertools.chain(audio, _iterate_input_list(input_list))
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _iterate_directory(path, extensions)
+        else:
+            yield path
+
+
+def shard(paths: Iterable[str], index: int, count: int) -> Iterator[str]:
+    """Selects the files of the shard 'index' out of 'count' shards"""
+    return itertools.islice(paths, index, None, count)
@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+
+from typing import List
+
+
+class Manifest:
+    """
+    Append-only journal (JSON lines) stored in the output directory that records
+    the status of every processed file. It is used to resume interrupted batch
+    jobs: files completed with the same options fingerprint are skipped and
+    failed files are retried until they reach the maximum number of retries.
+    """
+
+    filename: str = ".whisper-ctranslate2-manifest.jsonl"
+
+    def __init__(self, output_dir: str, fingerprint: str, max_retries: int):
+        self.path = os.path.join(output_dir, self.filename)
+        self.fingerprint = fingerprint
+        self.max_retries = max_retries
+        self.completed = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Incomplete line written when the process was killed
+                    continue
+
+                if record.get("fingerprint") != self.fingerprint:
+                    continue
+
+                audio = record["audio"]
+                if record["status"] == "done":
+                    self.completed[audio] = record["outputs"]
+                    self.failures.pop(audio, None)
+                elif record["status"] == "failed":
+                    self.completed.pop(audio, None)
+                    self.failures[audio] = self.failures.get(audio, 0) + 1
+
+    @staticmethod
+    def _get_key(audio_path: str) -> str:
+        return os.path.abspath(audio_path)
+
+    def is_completed(self, audio_path: str) -> bool:
+        outputs = self.completed.get(self._get_key(audio_path))
+        return outputs is not None and all(os.path.exists(path) for path in outputs)
+
+    def has_exhausted_retries(self, audio_path: str) -> bool:
+        return self.failures.get(self._get_key(audio_path), 0) > self.max_retries
+
+    def _append(self, record: dict):
+        record["fingerprint"] = self.fingerprint
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_done(self, audio_path: str, outputs: List[str]):
+        self._append(
+            {"audio": self._get_key(audio_path), "status": "done", "outputs": outputs}
+        )
+
+    def record_failed(self, audio_path: str, error: str):
+        self._append(
+            {"audio": self._get_key(audio_path), "status": "failed", "error": error}
+        )
@@ -0,0 +1,149 @@
+import contextlib
+import functools
+import threading
+import time
+
+from typing import Dict, List, Optional
+
+_local = threading.local()
+
+
+class FileMetrics:
+    """Time spent in each processing stage of a file"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.audio_duration: Optional[float] = None
+        self.start_time = time.perf_counter()
+        self.total_time = 0.0
+
+    def add_time(self, stage: str, stage_time: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + stage_time
+
+    def add_stages(self, metrics: "FileMetrics"):
+        for stage, stage_time in metrics.stages.items():
+            self.add_time(stage, stage_time)
+
+    def get_part(self, fraction: float, audio_duration: float) -> "FileMetrics":
+        """Part of the metrics of several files processed together"""
+        part = FileMetrics()
+        part.stages = {
+            stage: stage_time * fraction for stage, stage_time in self.stages.items()
+        }
+        part.total_time = self.total_time * fraction
+        part.audio_duration = audio_duration
+        return part
+
+    def add_part(self, part: "FileMetrics"):
+        self.add_stages(part)
+        self.audio_duration = part.audio_duration
+        # The total time is measured from the start time
+        self.start_time -= part.total_time
+
+    def stop(self):
+        self.total_time = time.perf_counter() - self.start_time
+
+    def as_dict(self) -> dict:
+        total_time = time.perf_counter() - self.start_time
+        return dict(
+            audio_duration=self.audio_duration,
+            total_time=total_time,
+            real_time_factor=(
+                total_time / self.audio_duration if self.audio_duration else None
+            ),
+            stages=dict(self.stages),
+        )
+
+
+def get_current_metrics() -> Optional[FileMetrics]:
+    return getattr(_local, "metrics", None)
+
+
+@contextlib.contextmanager
+def collect_metrics():
+    """Collects the stages measured in the current thread"""
+    metrics = FileMetrics()
+    _local.metrics = metrics
+    _local.stack = []
+    try:
+        yield metrics
+    finally:
+        metrics.stop()
+        _local.metrics = None
+
+
+@contextlib.contextmanager
+def measure(stage: str):
+    metrics = get_current_metrics()
+    if metrics is None:
+        yield
+        return
+
+    # Stages can be nested (e.g. the encoder is called during language detection),
+    # the time of inner stages is only accounted in the inner stage
+    stack = _local.stack
+    stack.append(0.0)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        inner_time = stack.pop()
+        metrics.add_time(stage, elapsed - inner_time)
+        if stack:
+            stack[-1] += elapsed
+
+
+def timed(function, stage: str):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with measure(stage):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    values = sorted(values)
+    index = round(percentile / 100 * (len(values) - 1))
+    return values[index]
+
+
+class RunSummary:
+    """Aggregates the metrics of all the files processed in a run"""
+
+    def __init__(self):
+        self.files: List[FileMetrics] = []
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add(self, metrics: FileMetrics):
+        with self.lock:
+            self.files.append(metrics)
+
+    def get_summary(self) -> str:
+        elapsed = time.perf_counter() - self.start_time
+        audio_duration = sum(metrics.audio_duration or 0 for metrics in self.files)
+        rtfs = [
+            metrics.total_time / metrics.audio_duration
+            for metrics in self.files
+            if metrics.audio_duration
+        ]
+        stages = {}
+        for metrics in self.files:
+            for stage, stage_time in metrics.stages.items():
+                stages[stage] = stages.get(stage, 0.0) + stage_time
+
+        lines = [
+            f"Files processed: {len(self.files)} in {elapsed:.2f} s ({len(self.files) / elapsed:.2f} files/s)",
+            f"Total audio: {audio_duration / 3600:.3f} hours",
+        ]
+        if rtfs:
+            lines.append(
+                f"Real-time factor: p50 {_percentile(rtfs, 50):.3f}, p95 {_percentile(rtfs, 95):.3f}"
+            )
+
+        for stage, stage_time in sorted(stages.items(), key=lambda x: -x[1]):
+            lines.append(f"  {stage}: {stage_time:.2f} s")
+
+        return "\n".join(lines)
@@ -0,0 +1,52 @@
+from typing import List, NamedTuple, Optional
+
+
+class TranscriptionOptions(NamedTuple):
+    beam_size: int
+    best_of: int
+    patience: float
+    length_penalty: float
+    repetition_penalty: float
+    no_repeat_ngram_size: int
+    log_prob_threshold: Optional[float]
+    no_speech_threshold: Optional[float]
+    compression_ratio_threshold: Optional[float]
+    condition_on_previous_text: bool
+    prompt_reset_on_temperature: float
+    temperature: List[float]
+    initial_prompt: Optional[str]
+    prefix: Optional[str]
+    hotwords: Optional[str]
+    suppress_blank: bool
+    suppress_tokens: Optional[List[int]]
+    #    max_initial_timestamp: float
+    word_timestamps: bool
+    print_colors: bool
+    prepend_punctuations: str
+    append_punctuations: str
+    hallucination_silence_threshold: Optional[float]
+    vad_filter: bool
+    vad_threshold: Optional[float]
+    vad_min_speech_duration_ms: Optional[int]
+    vad_max_speech_duration_s: Optional[int]
+    vad_min_silence_duration_ms: Optional[int]
+    multilingual: bool
+
+
+def get_vad_parameters(options: TranscriptionOptions) -> dict:
+    """Silero VAD parameters set by the user"""
+    vad_parameters = {}
+
+    if options.vad_threshold:
+        vad_parameters["threshold"] = options.vad_threshold
+
+    if options.vad_min_speech_duration_ms:
+        vad_parameters["min_speech_duration_ms"] = options.vad_min_speech_duration_ms
+
+    if options.vad_max_speech_duration_s:
+        vad_parameters["max_speech_duration_s"] = options.vad_max_speech_duration_s
+
+    if options.vad_min_silence_duration_ms:
+        vad_parameters["min_silence_duration_ms"] = options.vad_min_silence_duration_ms
+
+    return vad_parameters
@@ -0,0 +1,57 @@
+import os
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, TextIO, Tuple
+
+
+class Turn(NamedTuple):
+    start: float
+    end: float
+    speaker: str
+
+
+def get_file_id(audio_path: str) -> str:
+    """File identifier of the audio in RTTM files, as the name of the output files"""
+    audio_basename = "stdin" if audio_path == "-" else os.path.basename(audio_path)
+    return os.path.splitext(audio_basename)[0]
+
+
+def find_duplicate_file_id(audio_paths: Iterable[str]) -> Optional[Tuple[str, str]]:
+    """Two different files with the same file identifier, if any"""
+    paths = {}
+    for audio_path in audio_paths:
+        other_path = paths.setdefault(get_file_id(audio_path), audio_path)
+        if os.path.realpath(other_path) != os.path.realpath(audio_path):
+            return other_path, audio_path
+
+    return None
+
+
+def write_rttm(turns: List[Turn], file_id: str, f: TextIO):
+    for turn in turns:
+        f.write(
+            f"SPEAKER {file_id} 1 {turn.start} {turn.end - turn.start} "
+            f"<NA> <NA> {turn.speaker} <NA> <NA>\n"
+        )
+
+
+def read_rttm(f: TextIO) -> Dict[str, List[Turn]]:
+    """Speaker turns by file identifier. Only SPEAKER lines are used"""
+    turns = {}
+    for line_number, line in enumerate(f, 1):
+        fields = line.split()
+        if not fields or fields[0] != "SPEAKER":
+            continue
+
+        try:
+            file_id, start, duration, speaker = (
+                fields[1],
+                float(fields[3]),
+                float(fields[4]),
+                fields[7],
+            )
+        except (IndexError, ValueError):
+            raise ValueError(f"Invalid RTTM line {line_number}: '{line.strip()}'")
+
+        turns.setdefault(file_id, []).append(Turn(start, start + duration, speaker))
+
+    return turns
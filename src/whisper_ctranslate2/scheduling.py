@@ -0,0 +1,66 @@
+import concurrent.futures
+import datetime
+import threading
+import time
+
+from typing import Dict, List
+
+
+def get_duration(audio_path: str) -> float:
+    """Duration in seconds from the container metadata without decoding the audio,
+    0 if it cannot be determined"""
+    import av
+
+    try:
+        with av.open(audio_path, metadata_errors="ignore") as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+
+            for stream in container.streams.audio:
+                if stream.duration is not None and stream.time_base is not None:
+                    return float(stream.duration * stream.time_base)
+    except Exception:
+        pass
+
+    return 0.0
+
+
+def get_durations(audio: List[str]) -> Dict[str, float]:
+    # Reading the metadata is I/O bound, then use threads to probe several files at once
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return dict(zip(audio, executor.map(get_duration, audio)))
+
+
+def sort_longest_first(audio: List[str], durations: Dict[str, float]) -> List[str]:
+    """Longest files first, to avoid a long file at the end when transcribing in parallel"""
+    return sorted(audio, key=lambda audio_path: durations[audio_path], reverse=True)
+
+
+class EtaEstimator:
+    """Predicts the completion time of a batch job from the real-time factor
+    (wall time divided by audio time) measured so far"""
+
+    def __init__(self, total_duration: float):
+        self.total_duration = total_duration
+        self.processed_duration = 0.0
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, duration: float) -> str:
+        with self.lock:
+            self.processed_duration += duration
+            processed_duration = self.processed_duration
+
+        elapsed = time.monotonic() - self.start_time
+        if processed_duration <= 0:
+            return "Estimated completion time not available yet"
+
+        rtf = elapsed / processed_duration
+        remaining = max(0.0, self.total_duration - processed_duration) * rtf
+        completion = datetime.datetime.now() + datetime.timedelta(seconds=remaining)
+        return (
+            f"Processed {datetime.timedelta(seconds=round(processed_duration))} of "
+            f"{datetime.timedelta(seconds=round(self.total_duration))} of audio "
+            f"(real-time factor {rtf:.3f}), estimated completion at "
+            f"{completion:%Y-%m-%d %H:%M:%S} (in {datetime.timedelta(seconds=round(remaining))})"
+        )
@@ -0,0 +1,286 @@
+import http.client
+import http.server
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import traceback
+import urllib.parse
+
+from typing import TYPE_CHECKING, List, Optional
+
+from .options import TranscriptionOptions
+from .writers import format_timestamp, get_writer, make_safe
+
+if TYPE_CHECKING:
+    from .transcribe import Transcribe
+
+UNIX_SOCKET_SCHEME = "unix://"
+
+
+class Server:
+    """
+    Local HTTP server that keeps the model loaded between requests.
+
+    POST /transcribe transcribes the audio sent in the request body (any container
+    supported by faster-whisper, or raw 16 kHz float32 PCM using 'audio_format=f32le')
+    or, if the body is empty, the file given in the 'path' parameter. The optional
+    parameters 'task' and 'language' override the server defaults and 'output_format'
+    selects the response format (json, jsonl, txt, vtt, srt or tsv).
+
+    At most 'workers' requests are transcribed at the same time, each one mapped to a
+    CTranslate2 worker, and up to 'queue_size' requests wait for a free worker. Further
+    requests are rejected with 503 until there is room in the queue.
+    """
+
+    def __init__(
+        self,
+        transcribe: "Transcribe",
+        task: str,
+        language: str,
+        options: TranscriptionOptions,
+        writer_options: dict,
+        workers: int,
+        queue_size: int,
+        verbose: bool,
+    ):
+        self.transcribe = transcribe
+        self.task = task
+        self.language = language
+        self.options = options
+        self.writer_options = writer_options
+        self.verbose = verbose
+        self.accepted = threading.BoundedSemaphore(workers + queue_size)
+        self.running = threading.BoundedSemaphore(workers)
+
+    def inference(self, audio, task: str, language: str) -> dict:
+        if not self.accepted.acquire(blocking=False):
+            raise ServerBusyError()
+
+        try:
+            with self.running:
+                return self.transcribe.inference(
+                    audio, task, language, self.verbose, True, self.options
+                )
+        finally:
+            self.accepted.release()
+
+    def render(self, result: dict, output_format: str) -> str:
+        writer = get_writer(output_format, None)
+        output = io.StringIO()
+        writer.write_result(result, output, self.writer_options)
+        return output.getvalue()
+
+    def _get_handler(self):
+        server = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            def address_string(self):
+                # Unix sockets do not have a client address
+                return self.client_address[0] if self.client_address else "local"
+
+            def log_message(self, format, *args):
+                if server.verbose:
+                    super().log_message(format, *args)
+
+            def _send(self, status: int, body: str, content_type: str):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_error(self, status: int, message: str):
+                self._send(status, json.dumps({"error": message}), "application/json")
+
+            def do_GET(self):
+                if urllib.parse.urlparse(self.path).path == "/health":
+                    self._send(200, json.dumps({"status": "ok"}), "application/json")
+                else:
+                    self._send_error(404, "Not found")
+
+            def do_POST(self):
+                url = urllib.parse.urlparse(self.path)
+                if url.path != "/transcribe":
+                    self._send_error(404, "Not found")
+                    return
+
+                params = {
+                    key: values[0]
+                    for key, values in urllib.parse.parse_qs(url.query).items()
+                }
+                output_format = params.get("output_format", "json")
+                if output_format not in ["json", "jsonl", "txt", "vtt", "srt", "tsv"]:
+                    self._send_error(400, f"Unsupported format '{output_format}'")
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    self._send_error(400, "Invalid Content-Length")
+                    return
+
+                if length > 0:
+                    body = self.rfile.read(length)
+                    if params.get("audio_format") == "f32le":
+                        if len(body) % 4 != 0:
+                            self._send_error(
+                                400, "f32le audio must be a whole number of samples"
+                            )
+                            return
+
+                        import numpy as np
+
+                        audio = np.frombuffer(body, dtype=np.float32)
+                    else:
+                        audio = io.BytesIO(body)
+                elif "path" in params:
+                    audio = params["path"]
+                    if not os.path.isfile(audio):
+                        self._send_error(400, f"File '{audio}' does not exist")
+                        return
+                else:
+                    self._send_error(400, "No audio in the request body or path")
+                    return
+
+                try:
+                    result = server.inference(
+                        audio,
+                        params.get("task", server.task),
+                        params.get("language", server.language),
+                    )
+                except ServerBusyError:
+                    self._send_error(503, "Server busy, too many queued requests")
+                    return
+                except Exception as e:
+                    traceback.print_exc()
+                    self._send_error(500, f"{type(e).__name__}: {e}")
+                    return
+
+                if output_format == "json":
+                    self._send(200, json.dumps(result), "application/json")
+                else:
+                    self._send(200, server.render(result, output_format), "text/plain")
+
+        return RequestHandler
+
+    def create_http_server(
+        self, host: str, port: int, socket_path: Optional[str] = None
+    ) -> socketserver.BaseServer:
+        if socket_path:
+            if not hasattr(socket, "AF_UNIX"):
+                raise RuntimeError("Unix sockets are not supported in this platform")
+
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+            return ThreadingUnixHTTPServer(socket_path, self._get_handler())
+
+        return http.server.ThreadingHTTPServer((host, port), self._get_handler())
+
+    def serve(self, host: str, port: int, socket_path: Optional[str] = None):
+        httpd = self.create_http_server(host, port, socket_path)
+        if socket_path:
+            address = f"{UNIX_SOCKET_SCHEME}{socket_path}"
+        else:
+            address = f"http://{host}:{httpd.server_address[1]}"
+
+        print(f"Listening on {address} (Ctrl+C to Quit)")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+class ServerBusyError(Exception):
+    pass
+
+
+# Unix sockets are not available on Windows
+if hasattr(socketserver, "UnixStreamServer"):
+
+    class ThreadingUnixHTTPServer(
+        socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+    ):
+        daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class Client:
+    """
+    Thin client for a running server. It has the same inference method than
+    Transcribe then it can be used in its place without loading any model.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        if self.url.startswith(UNIX_SOCKET_SCHEME):
+            return UnixHTTPConnection(self.url[len(UNIX_SOCKET_SCHEME) :])
+
+        url = urllib.parse.urlparse(self.url)
+        return http.client.HTTPConnection(url.hostname, url.port)
+
+    def inference(
+        self,
+        audio,
+        task: str,
+        language: str,
+        verbose: bool,
+        live: bool,
+        options: TranscriptionOptions,
+        speech_chunks: Optional[List[dict]] = None,
+    ) -> dict:
+        # The server runs its own VAD, speech_chunks are not sent
+        params = {"task": task, "output_format": "json"}
+        if language:
+            params["language"] = language
+
+        if isinstance(audio, str):
+            with open(audio, "rb") as f:
+                body = f.read()
+        else:
+            # Decoded audio, numpy is only imported if the audio is decoded here
+            params["audio_format"] = "f32le"
+            body = audio.astype("float32").tobytes()
+
+        connection = self._get_connection()
+        try:
+            connection.request(
+                "POST",
+                f"/transcribe?{urllib.parse.urlencode(params)}",
+                body=body,
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            response = connection.getresponse()
+            data = json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise RuntimeError(f"Server error {response.status}: {data['error']}")
+
+        if verbose and not live:
+            for segment in data["segments"]:
+                start, end, text = segment["start"], segment["end"], segment["text"]
+                line = f"[{format_timestamp(start)} --> {format_timestamp(end)}] {text}"
+                print(make_safe(line))
+
+        return data
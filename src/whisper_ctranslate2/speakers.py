@@ -0,0 +1,242 @@
+from typing import List
+
+import numpy as np
+
+# Maximum number of segment and turn pairs intersected at once
+MAX_CANDIDATES = 1 << 20
+
+
+class SpeakerAssignment:
+    """Assigns the speakers of the diarization turns to the transcription"""
+
+    def __init__(self):
+        self._turn_index = (None, None)
+
+    def _get_turn_index(self, turns):
+        # When streaming the segments are assigned one by one with the same turns
+        cached_turns, index = self._turn_index
+        if cached_turns is not turns:
+            index = TurnIndex([(turn, None, turn.speaker) for turn in turns])
+            self._turn_index = (turns, index)
+
+        return index
+
+    def assign_speakers_to_segments(self, turns, transcript_result, speaker_name):
+        self._get_turn_index(turns).assign(transcript_result["segments"], speaker_name)
+        return transcript_result
+
+    def assign_speakers_to_words(self, turns, transcript_result, speaker_name):
+        """
+        Assigns the speaker of every word and splits the segments where the speaker
+        changes. Words that do not overlap any turn get the speaker of the segment.
+        Segments without words are assigned as a whole.
+        """
+        index = self._get_turn_index(turns)
+        segments = transcript_result["segments"]
+        index.assign(segments, speaker_name)
+        index.assign(
+            [word for segment in segments for word in segment.get("words") or []],
+            speaker_name,
+        )
+        transcript_result["segments"] = split_segments_by_speaker(segments)
+        return transcript_result
+
+    def _do_assign_speakers_to_segments(
+        self, diarize_data, transcript_result, speaker_name
+    ):
+        TurnIndex(diarize_data).assign(transcript_result["segments"], speaker_name)
+        return transcript_result
+
+
+def split_segments_by_speaker(segments: List[dict]) -> List[dict]:
+    """
+    Splits the segments into runs of consecutive words of the same speaker. The
+    first part keeps the tokens of the segment, the segments are numbered again
+    from the id of the first one.
+    """
+    result = []
+    for segment in segments:
+        words = segment.get("words") or []
+        for word in words:
+            speaker = word.get("speaker", segment.get("speaker"))
+            if speaker is not None:
+                word["speaker"] = speaker
+
+        runs = []
+        for word in words:
+            if runs and runs[-1][-1].get("speaker") == word.get("speaker"):
+                runs[-1].append(word)
+            else:
+                runs.append([word])
+
+        if len(runs) < 2:
+            result.append(segment)
+            continue
+
+        for i, run in enumerate(runs):
+            part = dict(
+                segment,
+                start=segment["start"] if i == 0 else run[0]["start"],
+                end=segment["end"] if i == len(runs) - 1 else run[-1]["end"],
+                text="".join(word["word"] for word in run),
+                tokens=segment.get("tokens", []) if i == 0 else [],
+                words=run,
+            )
+            part.pop("speaker", None)
+            if "speaker" in run[0]:
+                part["speaker"] = run[0]["speaker"]
+            result.append(part)
+
+    if result:
+        first_id = result[0].get("id", 1)
+        for i, segment in enumerate(result):
+            segment["id"] = first_id + i
+
+    return result
+
+
+class TurnIndex:
+    """
+    Diarization turns sorted by their start to find the turns that overlap each
+    segment with binary searches instead of intersecting every segment with every
+    turn. Each segment gets the speaker with the longest overlap; on ties, the
+    speaker of the first overlapping turn in the original order of the turns.
+    """
+
+    def __init__(self, diarize_data):
+        codes = {}
+        speakers = [
+            codes.setdefault(speaker, len(codes)) for _, _, speaker in diarize_data
+        ]
+        starts = np.array(
+            [segment.start for segment, _, _ in diarize_data], dtype=np.float64
+        )
+        ends = np.array(
+            [segment.end for segment, _, _ in diarize_data], dtype=np.float64
+        )
+
+        self.speakers = list(codes)
+        self.order = np.argsort(starts, kind="stable")
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        self.speaker_codes = np.array(speakers, dtype=np.int64)[self.order]
+
+        # Turns grouped by duration in powers of two. A turn can only overlap a
+        # segment if it starts less than the longest duration of its group before
+        # the segment, then a few long turns do not make every turn a candidate
+        durations = self.ends - self.starts
+        valid = np.flatnonzero(durations > 0)
+        duration_classes = np.floor(np.log2(durations[valid]))
+        self.groups = []
+        for duration_class in np.unique(duration_classes):
+            members = valid[duration_classes == duration_class]
+            # Padded for rounding, candidates are filtered by their actual overlap
+            max_duration = durations[members].max() * (1 + 1e-9)
+            self.groups.append((members, self.starts[members], max_duration))
+
+    def assign(self, segments, speaker_name):
+        if len(self.order) == 0 or len(segments) == 0:
+            return
+
+        segment_starts = np.array([seg["start"] for seg in segments], dtype=np.float64)
+        segment_ends = np.array([seg["end"] for seg in segments], dtype=np.float64)
+
+        # Candidate turns of each segment by group: [first, first + count)
+        candidates = []
+        counts = np.zeros(len(segments), dtype=np.int64)
+        for members, starts, max_duration in self.groups:
+            first = np.searchsorted(starts, segment_starts - max_duration, side="right")
+            last = np.searchsorted(starts, segment_ends, side="left")
+            group_counts = np.maximum(last - first, 0)
+            candidates.append((members, first, group_counts))
+            counts += group_counts
+
+        # Segments are processed in chunks to bound the memory used by the pairs
+        cumulative = np.cumsum(counts)
+        begin = 0
+        while begin < len(segments):
+            offset = cumulative[begin - 1] if begin > 0 else 0
+            end = int(
+                np.searchsorted(cumulative, offset + MAX_CANDIDATES, side="right")
+            )
+            end = max(end, begin + 1)
+            self._assign_chunk(
+                segments,
+                segment_starts,
+                segment_ends,
+                [
+                    (members, first[begin:end], group_counts[begin:end])
+                    for members, first, group_counts in candidates
+                ],
+                begin,
+                speaker_name,
+            )
+            begin = end
+
+    def _assign_chunk(
+        self, segments, segment_starts, segment_ends, candidates, begin, speaker_name
+    ):
+        segment_indexes = []
+        turn_indexes = []
+        for members, first, counts in candidates:
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.repeat(first, counts) + np.arange(total) - group_starts
+            segment_indexes.append(np.repeat(np.arange(len(counts)) + begin, counts))
+            turn_indexes.append(members[positions])
+
+        if not segment_indexes:
+            return
+
+        segment_index = np.concatenate(segment_indexes)
+        turn_index = np.concatenate(turn_indexes)
+
+        intersection = np.minimum(
+            self.ends[turn_index], segment_ends[segment_index]
+        ) - np.maximum(self.starts[turn_index], segment_starts[segment_index])
+        overlap = intersection > 0
+        segment_index = segment_index[overlap]
+        turn_index = turn_index[overlap]
+        intersection = intersection[overlap]
+        if len(intersection) == 0:
+            return
+
+        # Overlaps are added in the original order of the turns to get the same
+        # floating point sums as adding them one by one
+        original_index = self.order[turn_index]
+        by_turn = np.lexsort((original_index, segment_index))
+        segment_index = segment_index[by_turn]
+        original_index = original_index[by_turn]
+        intersection = intersection[by_turn]
+        speaker_codes = self.speaker_codes[turn_index[by_turn]]
+
+        keys = segment_index * len(self.speakers) + speaker_codes
+        groups, group_of_overlap = np.unique(keys, return_inverse=True)
+        totals = np.zeros(len(groups))
+        np.add.at(totals, group_of_overlap, intersection)
+        first_turn = np.full(len(groups), np.iinfo(np.int64).max)
+        np.minimum.at(first_turn, group_of_overlap, original_index)
+
+        group_segments = groups // len(self.speakers)
+        group_speakers = groups % len(self.speakers)
+        ranking = np.lexsort((first_turn, -totals, group_segments))
+        ranked_segments = group_segments[ranking]
+        best = ranking[
+            np.concatenate(([True], ranked_segments[1:] != ranked_segments[:-1]))
+        ]
+
+        names = {}
+        for segment, code in zip(
+            group_segments[best].tolist(), group_speakers[best].tolist()
+        ):
+            speaker = names.get(code)
+            if speaker is None:
+                speaker = self.speakers[code]
+                if speaker_name:
+                    speaker = speaker.replace("SPEAKER", speaker_name)
+                names[code] = speaker
+
+            segments[segment]["speaker"] = speaker
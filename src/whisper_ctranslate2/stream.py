@@ -0,0 +1,110 @@
+import sys
+
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+from .inputs import STDIN
+
+RAW_FORMATS = {"s16le": np.int16, "f32le": np.float32}
+SAMPLING_RATE = 16000
+# Audio read from the stream before it is handed to the transcription
+CHUNK_DURATION = 1
+
+
+def _open(path: str) -> BinaryIO:
+    if path == STDIN:
+        return sys.stdin.buffer
+
+    return open(path, "rb")
+
+
+def _read_samples(file: BinaryIO, dtype: np.dtype) -> Iterator[np.ndarray]:
+    chunk_size = CHUNK_DURATION * SAMPLING_RATE * dtype.itemsize
+    remainder = b""
+    while data := file.read(chunk_size):
+        data = remainder + data
+        # A read may end in the middle of a sample
+        usable = len(data) - len(data) % dtype.itemsize
+        remainder = data[usable:]
+        yield np.frombuffer(data[:usable], dtype=dtype)
+
+
+def _to_float32(samples: np.ndarray) -> np.ndarray:
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+
+    return samples
+
+
+def _resample(chunks: Iterator[np.ndarray], sample_rate: int):
+    import av
+
+    resampler = av.audio.resampler.AudioResampler(
+        format="s16", layout="mono", rate=SAMPLING_RATE
+    )
+    for chunk in chunks:
+        frame = av.AudioFrame.from_ndarray(
+            chunk.reshape(1, -1),
+            format="s16" if chunk.dtype == np.int16 else "flt",
+            layout="mono",
+        )
+        frame.sample_rate = sample_rate
+        yield from resampler.resample(frame)
+
+    yield from resampler.resample(None)
+
+
+def _decode_container(file: BinaryIO):
+    import av
+
+    resampler = av.audio.resampler.AudioResampler(
+        format="s16", layout="mono", rate=SAMPLING_RATE
+    )
+    with av.open(file, mode="r", metadata_errors="ignore") as container:
+        for frame in container.decode(audio=0):
+            yield from resampler.resample(frame)
+
+    yield from resampler.resample(None)
+
+
+def _group_frames(frames, duration: int = CHUNK_DURATION) -> Iterator[np.ndarray]:
+    chunk = []
+    samples = 0
+    for frame in frames:
+        array = frame.to_ndarray().reshape(-1)
+        chunk.append(array)
+        samples += len(array)
+        if samples >= duration * SAMPLING_RATE:
+            yield np.concatenate(chunk).astype(np.float32) / 32768.0
+            chunk = []
+            samples = 0
+
+    if chunk:
+        yield np.concatenate(chunk).astype(np.float32) / 32768.0
+
+
+def read_audio_stream(
+    path: str, input_format: str = "auto", sample_rate: int = SAMPLING_RATE
+) -> Iterator[np.ndarray]:
+    """
+    Reads the audio from standard input ('-') or a named pipe as it arrives and
+    yields it in chunks of mono 16 kHz float32 samples. The stream is either raw
+    mono PCM ('s16le' or 'f32le' samples at 'sample_rate') or any container that
+    can be decoded without seeking ('auto'), e.g. MP3, OGG, WAV or MPEG-TS.
+    """
+    file = _open(path)
+    try:
+        if input_format == "auto":
+            yield from _group_frames(_decode_container(file))
+            return
+
+        samples = _read_samples(file, np.dtype(RAW_FORMATS[input_format]))
+        if sample_rate == SAMPLING_RATE:
+            for chunk in samples:
+                yield _to_float32(chunk)
+        else:
+            yield from _group_frames(_resample(samples, sample_rate))
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
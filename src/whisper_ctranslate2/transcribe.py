@@ -1,58 +1,33 @@
-import sys
+import concurrent.futures
+import contextlib
 
-from typing import BinaryIO, List, NamedTuple, Optional, Union
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import tqdm
 
 from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import Segment
+from faster_whisper.transcribe import (
+    TranscriptionOptions as FasterWhisperTranscriptionOptions,
+)
+from faster_whisper.transcribe import (
+    Word,
+    get_suppressed_tokens,
+    restore_speech_timestamps,
+)
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
 
 from .languages import LANGUAGES
-from .writers import format_timestamp
-
-system_encoding = sys.getdefaultencoding()
-
-if system_encoding != "utf-8":
-
-    def make_safe(string):
-        return string.encode(system_encoding, errors="replace").decode(system_encoding)
-
-else:
-
-    def make_safe(string):
-        return string
-
-
-class TranscriptionOptions(NamedTuple):
-    beam_size: int
-    best_of: int
-    patience: float
-    length_penalty: float
-    repetition_penalty: float
-    no_repeat_ngram_size: int
-    log_prob_threshold: Optional[float]
-    no_speech_threshold: Optional[float]
-    compression_ratio_threshold: Optional[float]
-    condition_on_previous_text: bool
-    prompt_reset_on_temperature: float
-    temperature: List[float]
-    initial_prompt: Optional[str]
-    prefix: Optional[str]
-    hotwords: Optional[str]
-    suppress_blank: bool
-    suppress_tokens: Optional[List[int]]
-    #    max_initial_timestamp: float
-    word_timestamps: bool
-    print_colors: bool
-    prepend_punctuations: str
-    append_punctuations: str
-    hallucination_silence_threshold: Optional[float]
-    vad_filter: bool
-    vad_threshold: Optional[float]
-    vad_min_speech_duration_ms: Optional[int]
-    vad_max_speech_duration_s: Optional[int]
-    vad_min_silence_duration_ms: Optional[int]
-    multilingual: bool
+from .metrics import collect_metrics, get_current_metrics, measure, timed
+from .options import TranscriptionOptions, get_vad_parameters
+from .windows import get_window_boundaries, shift_segment, stitch_windows
+from .writers import format_timestamp, make_safe
+
+# Seconds of audio transcribed at once when reading the audio from a stream
+STREAM_WINDOW = 30
 
 
 class Transcribe:
@@ -81,27 +56,6 @@ class Transcribe:
 
         return text_words
 
-    def _get_vad_parameters_dictionary(self, options):
-        vad_parameters = {}
-
-        if options.vad_threshold:
-            vad_parameters["threshold"] = options.vad_threshold
-
-        if options.vad_min_speech_duration_ms:
-            vad_parameters["min_speech_duration_ms"] = (
-                options.vad_min_speech_duration_ms
-            )
-
-        if options.vad_max_speech_duration_s:
-            vad_parameters["max_speech_duration_s"] = options.vad_max_speech_duration_s
-
-        if options.vad_min_silence_duration_ms:
-            vad_parameters["min_silence_duration_ms"] = (
-                options.vad_min_silence_duration_ms
-            )
-
-        return vad_parameters
-
     def __init__(
         self,
         model_path: str,
@@ -113,6 +67,8 @@ class Transcribe:
         local_files_only: bool,
         batched: bool,
         batch_size: int = None,
+        num_workers: int = 1,
+        metrics: bool = False,
     ):
         self.model = WhisperModel(
             model_path,
@@ -120,15 +76,27 @@ class Transcribe:
             device_index=device_index,
             compute_type=compute_type,
             cpu_threads=threads,
+            num_workers=num_workers,
             download_root=cache_directory,
             local_files_only=local_files_only,
         )
 
         self.batch_size = batch_size
-        if batched:
-            self.batched_model = BatchedInferencePipeline(model=self.model)
-        else:
-            self.batched_model = None
+        self.batched = batched
+        self.metrics = metrics
+        if metrics:
+            self._install_stage_timers()
+
+    def _install_stage_timers(self):
+        # The stages are only measured if the calling thread collects metrics
+        model = self.model
+        model.encode = timed(model.encode, "encoder")
+        model.generate_with_fallback = timed(model.generate_with_fallback, "decoder")
+        model.add_word_timestamps = timed(model.add_word_timestamps, "word_alignment")
+        model.detect_language = timed(model.detect_language, "language_detection")
+
+    def _timed(self, function, stage: str):
+        return timed(function, stage) if self.metrics else function
 
     def inference(
         self,
@@ -138,11 +106,46 @@ class Transcribe:
         verbose: bool,
         live: bool,
         options: TranscriptionOptions,
+        speech_chunks: Optional[List[dict]] = None,
     ):
-        vad_parameters = self._get_vad_parameters_dictionary(options)
+        segments, language = self.transcribe_segments(
+            audio, task, language, verbose, live, options, speech_chunks
+        )
+        list_segments = list(segments)
+        return dict(
+            text="".join(segment["text"] for segment in list_segments),
+            segments=list_segments,
+            language=language,
+        )
 
-        if self.batched_model:
-            model = self.batched_model
+    def transcribe_segments(
+        self,
+        audio: Union[str, BinaryIO, np.ndarray],
+        task: str,
+        language: str,
+        verbose: bool,
+        live: bool,
+        options: TranscriptionOptions,
+        speech_chunks: Optional[List[dict]] = None,
+    ) -> Tuple[Iterator[dict], str]:
+        """
+        Returns the segments, which are transcribed as they are iterated, and the
+        language of the audio. Unlike inference, the segments are not kept in
+        memory then it can be used to transcribe long files as a stream.
+
+        speech_chunks are the VAD speech timestamps of the audio, when already
+        computed with the same VAD parameters, to not run the VAD again.
+        """
+        vad_parameters = get_vad_parameters(options)
+
+        if self.batched:
+            # The pipeline keeps state between batches, use one per call to allow
+            # transcribing several files concurrently with the same model
+            model = BatchedInferencePipeline(model=self.model)
+            # Decoding time, the encoder is accounted separately
+            model.generate_segment_batched = self._timed(
+                model.generate_segment_batched, "decoder"
+            )
             vad = True
         else:
             model = self.model
@@ -152,54 +155,95 @@ class Transcribe:
             {"batch_size": self.batch_size} if self.batch_size is not None else {}
         )
 
-        segments, info = model.transcribe(
-            audio=audio,
-            language=language,
-            task=task,
-            beam_size=options.beam_size,
-            best_of=options.best_of,
-            patience=options.patience,
-            length_penalty=options.length_penalty,
-            repetition_penalty=options.repetition_penalty,
-            no_repeat_ngram_size=options.no_repeat_ngram_size,
-            temperature=options.temperature,
-            compression_ratio_threshold=options.compression_ratio_threshold,
-            log_prob_threshold=options.log_prob_threshold,
-            no_speech_threshold=options.no_speech_threshold,
-            condition_on_previous_text=options.condition_on_previous_text,
-            prompt_reset_on_temperature=options.prompt_reset_on_temperature,
-            initial_prompt=options.initial_prompt,
-            prefix=options.prefix,
-            hotwords=options.hotwords,
-            suppress_blank=options.suppress_blank,
-            suppress_tokens=options.suppress_tokens,
-            word_timestamps=True if options.print_colors else options.word_timestamps,
-            prepend_punctuations=options.prepend_punctuations,
-            append_punctuations=options.append_punctuations,
-            hallucination_silence_threshold=options.hallucination_silence_threshold,
-            vad_filter=vad,
-            vad_parameters=vad_parameters,
-            **batch_size,
-            multilingual=options.multilingual,
+        if not isinstance(audio, np.ndarray):
+            with measure("decode"):
+                audio = decode_audio(
+                    audio, sampling_rate=self.model.feature_extractor.sampling_rate
+                )
+
+        duration = len(audio) / self.model.feature_extractor.sampling_rate
+        # The batched pipeline splits the speech in its own chunks. Otherwise the
+        # VAD is left to faster-whisper unless it is measured
+        use_speech_chunks = (
+            vad and not self.batched and (speech_chunks is not None or self.metrics)
         )
+        if use_speech_chunks:
+            if speech_chunks is None:
+                with measure("vad"):
+                    speech_chunks = get_speech_timestamps(
+                        audio, VadOptions(**vad_parameters)
+                    )
+            # As faster-whisper does with vad_filter
+            audio = np.concatenate(collect_chunks(audio, speech_chunks)[0])
+            vad = False
+
+        # The batched pipeline runs the VAD and extracts the features when called.
+        # Its VAD cannot be run apart, its chunks are merged differently
+        stage = (
+            measure("vad_and_features") if self.batched else contextlib.nullcontext()
+        )
+        with stage:
+            segments, info = model.transcribe(
+                audio=audio,
+                language=language,
+                task=task,
+                beam_size=options.beam_size,
+                best_of=options.best_of,
+                patience=options.patience,
+                length_penalty=options.length_penalty,
+                repetition_penalty=options.repetition_penalty,
+                no_repeat_ngram_size=options.no_repeat_ngram_size,
+                temperature=options.temperature,
+                compression_ratio_threshold=options.compression_ratio_threshold,
+                log_prob_threshold=options.log_prob_threshold,
+                no_speech_threshold=options.no_speech_threshold,
+                condition_on_previous_text=options.condition_on_previous_text,
+                prompt_reset_on_temperature=options.prompt_reset_on_temperature,
+                initial_prompt=options.initial_prompt,
+                prefix=options.prefix,
+                hotwords=options.hotwords,
+                suppress_blank=options.suppress_blank,
+                suppress_tokens=options.suppress_tokens,
+                word_timestamps=(
+                    True if options.print_colors else options.word_timestamps
+                ),
+                prepend_punctuations=options.prepend_punctuations,
+                append_punctuations=options.append_punctuations,
+                hallucination_silence_threshold=options.hallucination_silence_threshold,
+                vad_filter=vad,
+                vad_parameters=vad_parameters,
+                **batch_size,
+                multilingual=options.multilingual,
+            )
+
+        if use_speech_chunks:
+            sampling_rate = self.model.feature_extractor.sampling_rate
+            segments = restore_speech_timestamps(segments, speech_chunks, sampling_rate)
+            info.duration_after_vad = info.duration
+            info.duration = duration
+
+        metrics = get_current_metrics()
+        if metrics:
+            metrics.audio_duration = info.duration
 
-        language_name = LANGUAGES[info.language].title()
         if not live:
-            print(
-                "Detected language '%s' with probability %f"
-                % (language_name, info.language_probability)
-            )
+            self._print_language(info.language, info.language_probability)
+
+        return (
+            self._iterate_segments(segments, info, verbose, live, options),
+            info.language,
+        )
 
-        list_segments = []
+    def _iterate_segments(
+        self, segments, info, verbose: bool, live: bool, options: TranscriptionOptions
+    ) -> Iterator[dict]:
         last_pos = 0
         accumulated_inc = 0
-        all_text = ""
         with tqdm.tqdm(
             total=info.duration, unit="seconds", disable=verbose or live is not False
         ) as pbar:
             for segment in segments:
                 start, end, text = segment.start, segment.end, segment.text
-                all_text += segment.text
 
                 if verbose or options.print_colors:
                     if options.print_colors and segment.words:
@@ -215,7 +259,6 @@ class Transcribe:
                 if segment.words:
                     segment_dict["words"] = [word._asdict() for word in segment.words]
 
-                list_segments.append(segment_dict)
                 duration = segment.end - last_pos
                 increment = (
                     duration
@@ -225,9 +268,392 @@ class Transcribe:
                 accumulated_inc += increment
                 last_pos = segment.end
                 pbar.update(increment)
+                yield segment_dict
 
-        return dict(
-            text=all_text,
-            segments=list_segments,
-            language=info.language,
+    def inference_windows(
+        self,
+        audio: Union[str, BinaryIO, np.ndarray],
+        task: str,
+        language: str,
+        verbose: bool,
+        options: TranscriptionOptions,
+        windows: int,
+        min_duration: float,
+    ) -> dict:
+        """
+        Transcription of long files using several workers. Audio longer than
+        'min_duration' seconds is split into windows of similar length at the
+        silences found by the VAD, the windows are transcribed concurrently and
+        their segments are joined back with the timestamps of the whole file.
+        """
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        if not isinstance(audio, np.ndarray):
+            with measure("decode"):
+                audio = decode_audio(audio, sampling_rate=sampling_rate)
+
+        if windows < 2 or len(audio) < min_duration * sampling_rate:
+            return self.inference(audio, task, language, verbose, False, options)
+
+        # Shorter silences than the default ones are also valid places to cut
+        vad_parameters = {
+            "min_silence_duration_ms": 500,
+            **get_vad_parameters(options),
+        }
+        with measure("vad"):
+            speech_chunks = get_speech_timestamps(audio, VadOptions(**vad_parameters))
+        boundaries = get_window_boundaries(speech_chunks, len(audio), windows)
+
+        # All the windows are transcribed with the language of the file
+        if language is None:
+            language = self._detect_language(audio)
+
+        metrics = get_current_metrics()
+
+        def transcribe_window(boundary):
+            start, end = boundary
+            with collect_metrics() if metrics else contextlib.nullcontext() as window:
+                result = self.inference(
+                    audio[start:end], task, language, False, True, options
+                )
+
+            return result, window
+
+        with concurrent.futures.ThreadPoolExecutor(len(boundaries)) as executor:
+            window_results = list(executor.map(transcribe_window, boundaries))
+
+        if metrics:
+            metrics.audio_duration = len(audio) / sampling_rate
+            for _, window_metrics in window_results:
+                metrics.add_stages(window_metrics)
+
+        result = stitch_windows(
+            [result for result, _ in window_results],
+            [start / sampling_rate for start, _ in boundaries],
+            self.model.frames_per_second,
         )
+        result["language"] = language
+
+        if verbose:
+            for segment in result["segments"]:
+                start, end, text = segment["start"], segment["end"], segment["text"]
+                line = f"[{format_timestamp(start)} --> {format_timestamp(end)}] {text}"
+                print(make_safe(line))
+
+        return result
+
+    def _detect_language(self, audio: np.ndarray) -> str:
+        if self.model.model.is_multilingual:
+            language, language_probability, _ = self.model.detect_language(audio)
+        else:
+            language, language_probability = "en", 1
+
+        self._print_language(language, language_probability)
+        return language
+
+    def _print_language(self, language: str, language_probability: float):
+        print(
+            "Detected language '%s' with probability %f"
+            % (LANGUAGES[language].title(), language_probability)
+        )
+
+    def print_result(
+        self,
+        result: dict,
+        language_probability: float,
+        verbose: bool,
+        options: TranscriptionOptions,
+    ):
+        """
+        Prints the detected language and the segments of a result of
+        inference_packed, as transcribe_segments prints them while transcribing
+        """
+        self._print_language(result["language"], language_probability)
+        if not verbose and not options.print_colors:
+            return
+
+        for segment in result["segments"]:
+            text = segment["text"]
+            if options.print_colors and segment.get("words"):
+                text = self._get_colored_text(
+                    [Word(**word) for word in segment["words"]]
+                )
+
+            start, end = segment["start"], segment["end"]
+            line = f"[{format_timestamp(start)} --> {format_timestamp(end)}] {text}"
+            print(make_safe(line))
+
+    def transcribe_stream(
+        self,
+        chunks: Iterable[np.ndarray],
+        task: str,
+        language: str,
+        verbose: bool,
+        options: TranscriptionOptions,
+        window: float = STREAM_WINDOW,
+    ) -> Tuple[Iterator[dict], str]:
+        """
+        Transcription of audio that is still arriving (e.g. from a pipe), given as
+        chunks of 16 kHz samples. The audio is transcribed in windows of 'window'
+        seconds. The last segment of a window may be cut, then it is transcribed
+        again at the beginning of the next window and only the previous segments
+        are returned. The language is detected in the first window.
+        """
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        window_samples = int(window * sampling_rate)
+        chunks = iter(chunks)
+
+        def fill(buffer):
+            parts = [buffer]
+            size = len(buffer)
+            for chunk in chunks:
+                parts.append(chunk)
+                size += len(chunk)
+                if size >= window_samples:
+                    return np.concatenate(parts), False
+
+            return np.concatenate(parts), True
+
+        buffer, ended = fill(np.zeros(0, dtype=np.float32))
+        if language is None:
+            language = self._detect_language(buffer[:window_samples])
+
+        return (
+            self._iterate_stream(buffer, ended, fill, task, language, verbose, options),
+            language,
+        )
+
+    def _iterate_stream(
+        self, buffer, ended, fill, task, language, verbose, options
+    ) -> Iterator[dict]:
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        offset = 0.0
+        segment_id = 0
+        while len(buffer) > 0:
+            segments, _ = self.transcribe_segments(
+                buffer, task, language, False, True, options
+            )
+            segments = list(segments)
+            if ended or len(segments) < 2:
+                # A single segment is returned to always make progress
+                final, cut = segments, len(buffer) / sampling_rate
+                if segments and not ended:
+                    cut = segments[0]["end"]
+            else:
+                final, cut = segments[:-1], segments[-2]["end"]
+
+            for segment in final:
+                segment_id += 1
+                segment = shift_segment(
+                    segment, segment_id, offset, self.model.frames_per_second
+                )
+                if verbose:
+                    start, end = segment["start"], segment["end"]
+                    line = f"[{format_timestamp(start)} --> {format_timestamp(end)}] {segment['text']}"
+                    print(make_safe(line))
+
+                yield segment
+
+            if final and options.condition_on_previous_text:
+                # The next window continues the text of this one
+                options = options._replace(
+                    initial_prompt="".join(segment["text"] for segment in final)
+                )
+
+            cut_samples = max(1, min(len(buffer), int(cut * sampling_rate)))
+            offset += cut_samples / sampling_rate
+            buffer = buffer[cut_samples:]
+            if ended:
+                break
+
+            buffer, ended = fill(buffer)
+
+        metrics = get_current_metrics()
+        if metrics:
+            metrics.audio_duration = offset
+
+    def _get_packed_options(
+        self, tokenizer: Tokenizer, options: TranscriptionOptions
+    ) -> FasterWhisperTranscriptionOptions:
+        # Same options that BatchedInferencePipeline.transcribe uses
+        return FasterWhisperTranscriptionOptions(
+            beam_size=options.beam_size,
+            best_of=options.best_of,
+            patience=options.patience,
+            length_penalty=options.length_penalty,
+            repetition_penalty=options.repetition_penalty,
+            no_repeat_ngram_size=options.no_repeat_ngram_size,
+            log_prob_threshold=options.log_prob_threshold,
+            no_speech_threshold=options.no_speech_threshold,
+            compression_ratio_threshold=options.compression_ratio_threshold,
+            temperatures=options.temperature[:1],
+            initial_prompt=options.initial_prompt,
+            prefix=options.prefix,
+            suppress_blank=options.suppress_blank,
+            suppress_tokens=(
+                get_suppressed_tokens(tokenizer, options.suppress_tokens)
+                if options.suppress_tokens
+                else options.suppress_tokens
+            ),
+            prepend_punctuations=options.prepend_punctuations,
+            append_punctuations=options.append_punctuations,
+            max_new_tokens=None,
+            hotwords=options.hotwords,
+            word_timestamps=(True if options.print_colors else options.word_timestamps),
+            hallucination_silence_threshold=None,
+            condition_on_previous_text=False,
+            clip_timestamps=None,
+            prompt_reset_on_temperature=0.5,
+            multilingual=options.multilingual,
+            without_timestamps=True,
+            max_initial_timestamp=0.0,
+        )
+
+    def inference_packed(
+        self,
+        audios: List[Union[str, BinaryIO, np.ndarray]],
+        task: str,
+        language: str,
+        options: TranscriptionOptions,
+    ) -> List[Tuple[dict, float]]:
+        """
+        Batched transcription of several files at once. The VAD speech chunks of all
+        the files are packed into the same encoder and decoder batches, which fills
+        the batches when the files are short, and the segments are then returned
+        back to their source file with their original timestamps.
+
+        Returns the result and the language probability of each file. Nothing is
+        printed, see print_result.
+        """
+        pipeline = BatchedInferencePipeline(model=self.model)
+        pipeline.generate_segment_batched = self._timed(
+            pipeline.generate_segment_batched, "decoder"
+        )
+        feature_extractor = self.model.feature_extractor
+        sampling_rate = feature_extractor.sampling_rate
+        chunk_length = feature_extractor.chunk_length
+        batch_size = self.batch_size or 8
+
+        vad_parameters = get_vad_parameters(options)
+        vad_parameters.pop("max_speech_duration_s", None)
+        vad_parameters = VadOptions(
+            **vad_parameters, max_speech_duration_s=chunk_length
+        )
+
+        files = []
+        chunks_by_language: Dict[str, list] = {}
+        for file_index, audio in enumerate(audios):
+            if not isinstance(audio, np.ndarray):
+                with measure("decode"):
+                    audio = decode_audio(audio, sampling_rate=sampling_rate)
+
+            with measure("vad"):
+                speech_chunks = get_speech_timestamps(audio, vad_parameters)
+            audio_chunks, chunks_metadata = collect_chunks(
+                audio, speech_chunks, max_duration=chunk_length
+            )
+            features = (
+                [feature_extractor(chunk)[..., :-1] for chunk in audio_chunks]
+                if speech_chunks
+                else []
+            )
+
+            file_language, language_probability = language, 1
+            if file_language is None:
+                if not self.model.model.is_multilingual:
+                    file_language = "en"
+                else:
+                    file_language, language_probability, _ = self.model.detect_language(
+                        features=np.concatenate(
+                            features
+                            + [
+                                np.full(
+                                    (self.model.model.n_mels, 1), -1.5, dtype="float32"
+                                )
+                            ],
+                            axis=1,
+                        ),
+                        language_detection_segments=1,
+                        language_detection_threshold=0.5,
+                    )
+
+            files.append(
+                dict(
+                    language=file_language,
+                    language_probability=language_probability,
+                    speech_chunks=speech_chunks,
+                    outputs=[],
+                )
+            )
+            for feature, chunk_metadata in zip(features, chunks_metadata):
+                chunks_by_language.setdefault(file_language, []).append(
+                    (file_index, feature, chunk_metadata)
+                )
+
+        # Files with the same language share the tokenizer and can be batched together
+        for chunk_language, chunks in chunks_by_language.items():
+            tokenizer = Tokenizer(
+                self.model.hf_tokenizer,
+                self.model.model.is_multilingual,
+                task=task,
+                language=chunk_language,
+            )
+            packed_options = self._get_packed_options(tokenizer, options)
+            previous_file_index = None
+            for i in range(0, len(chunks), batch_size):
+                batch = chunks[i : i + batch_size]
+                # The word timestamps heuristics use the last speech timestamp of
+                # the previous batch, which is only meaningful for the same file
+                if batch[0][0] != previous_file_index:
+                    pipeline.last_speech_timestamp = 0.0
+                previous_file_index = batch[-1][0]
+                outputs = pipeline.forward(
+                    np.stack([pad_or_trim(feature) for _, feature, _ in batch]),
+                    tokenizer,
+                    [chunk_metadata for _, _, chunk_metadata in batch],
+                    packed_options,
+                )
+                for (file_index, _, _), output in zip(batch, outputs):
+                    files[file_index]["outputs"].append(output)
+
+        results = []
+        for file in files:
+            segments = []
+            for output in file["outputs"]:
+                for segment in output:
+                    segments.append(
+                        Segment(
+                            seek=segment["seek"],
+                            id=len(segments) + 1,
+                            text=segment["text"],
+                            start=round(segment["start"], 3),
+                            end=round(segment["end"], 3),
+                            words=(
+                                [Word(**word) for word in segment["words"]]
+                                if "words" in segment
+                                else None
+                            ),
+                            tokens=segment["tokens"],
+                            avg_logprob=segment["avg_logprob"],
+                            no_speech_prob=segment["no_speech_prob"],
+                            compression_ratio=segment["compression_ratio"],
+                            temperature=options.temperature[0],
+                        )
+                    )
+
+            list_segments = []
+            all_text = ""
+            for segment in restore_speech_timestamps(
+                segments, file["speech_chunks"], sampling_rate
+            ):
+                all_text += segment.text
+                segment_dict = segment._asdict()
+                if segment.words:
+                    segment_dict["words"] = [word._asdict() for word in segment.words]
+                list_segments.append(segment_dict)
+
+            result = dict(
+                text=all_text, segments=list_segments, language=file["language"]
+            )
+            results.append((result, file["language_probability"]))
+
+        return results
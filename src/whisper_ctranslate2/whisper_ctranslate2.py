@@ -1,30 +1,75 @@
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import itertools
+import math
 import os
 import sys
+import threading
+import time
 import traceback
 import warnings
 
 from typing import List, Union
 
-import numpy as np
-
+from .autotune import DEFAULT_PROFILE, AutoTuner, save_profile
+from .cache import (
+    AudioCache,
+    DiarizationCache,
+    ResultCache,
+    hash_file,
+    hash_settings,
+    prepare_audio_file,
+)
 from .commandline import CommandLine
 from .exit_code import ExitCode
+from .inputs import STDIN, is_stream, iterate_audio_files, shard
 from .languages import from_language_to_iso_code
-from .live import Live
-from .transcribe import Transcribe, TranscriptionOptions
-from .writers import get_writer
+from .manifest import Manifest
+from .metrics import RunSummary, collect_metrics, measure
+from .options import TranscriptionOptions, get_vad_parameters
+from .rttm import find_duplicate_file_id, get_file_id, read_rttm
+from .scheduling import EtaEstimator, get_durations, sort_longest_first
+from .writers import StreamingWriter, get_writer, get_writers
+
 
+def get_diarization(
+    audio,
+    diarize_model,
+    verbose,
+    load_audio,
+    diarization_cache=None,
+    vad_parameters=None,
+):
+    """Speaker turns and VAD speech chunks, if computed, by file"""
+    from .diarization import get_speech_chunks
 
-def get_diarization(audio, diarize_model, verbose):
     diarization_output = {}
     for audio_path in audio:
         if verbose and len(audio) > 1:
             print(f"\nFile: '{audio_path}' (diarization)")
 
         start_time = datetime.datetime.now()
-        diarize_segments = diarize_model.run_model(audio_path)
-        diarization_output[audio_path] = diarize_segments
+        diarize_segments = None
+        speech_chunks = None
+        if diarization_cache:
+            cache_key = diarization_cache.get_key(audio_path)
+            entry = diarization_cache.get_entry(cache_key)
+            if entry is not None:
+                # The speech chunks are cached too, the transcription reuses them
+                diarize_segments, speech_chunks = entry
+
+        if diarize_segments is None:
+            audio_input = load_audio(audio_path)
+            if vad_parameters is not None:
+                speech_chunks = get_speech_chunks(audio_input, vad_parameters)
+
+            diarize_segments = diarize_model.run_model(audio_input, speech_chunks)
+            if diarization_cache:
+                diarization_cache.put(cache_key, diarize_segments, speech_chunks)
+
+        diarization_output[audio_path] = (diarize_segments, speech_chunks)
         if verbose:
             print(f"Time used for diarization: {datetime.datetime.now() - start_time}")
 
@@ -32,11 +77,162 @@ def get_diarization(audio, diarize_model, verbose):
     return diarization_output
 
 
+def decode_audio(audio_path):
+    # Heavy modules are imported once the arguments are validated, then probes
+    # like --version, --help or argument errors start fast, and the thin client
+    # of --server_url only loads faster-whisper if it decodes the audio
+    from faster_whisper.audio import decode_audio
+
+    return decode_audio(audio_path)
+
+
+def get_transcription_device(device: str) -> str:
+    """Device used by CTranslate2, 'auto' is CUDA if there is any CUDA device"""
+    if device != "auto":
+        return device
+
+    import ctranslate2
+
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+def prefetch_audio(audio, prefetch, load_audio):
+    """Yields (audio_path, audio_input) pairs decoding up to 'prefetch' files ahead
+    in background. audio_input is a future with the decoded audio or the path itself
+    if prefetching is disabled."""
+    if prefetch < 1:
+        for audio_path in audio:
+            yield audio_path, audio_path
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = collections.deque()
+        for audio_path in audio:
+            if is_stream(audio_path):
+                # Transcribed as it arrives
+                pending.append((audio_path, audio_path))
+            else:
+                pending.append((audio_path, executor.submit(load_audio, audio_path)))
+            if len(pending) > prefetch:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
+
+
+def get_audio_input(audio_input, load_audio=None):
+    """The decoded audio of a prefetched file, or the file loaded with load_audio.
+    Without load_audio the path is returned and the transcription decodes it"""
+    if isinstance(audio_input, concurrent.futures.Future):
+        return audio_input.result()
+
+    if load_audio and isinstance(audio_input, str):
+        with measure("decode"):
+            return load_audio(audio_input)
+
+    return audio_input
+
+
+def prepare_audio(audio, audio_cache, workers, verbose):
+    # Decoding is CPU bound, then use processes. Files are submitted as the previous
+    # ones are decoded to not enumerate all the input files in advance
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        running = {}
+
+        def collect(return_when):
+            done, _ = concurrent.futures.wait(running, return_when=return_when)
+            for future in done:
+                audio_path = running.pop(future)
+                try:
+                    size = future.result()
+                except Exception as e:
+                    sys.stderr.write(f"Unable to decode '{audio_path}': {e}\n")
+                    continue
+
+                # Evicted here, the processes only store the entries
+                audio_cache.add_size(size)
+                if verbose:
+                    print(f"{'Decoded' if size else 'Already cached'} '{audio_path}'")
+
+        for audio_path in audio:
+            if len(running) >= 2 * workers:
+                collect(concurrent.futures.FIRST_COMPLETED)
+
+            future = executor.submit(
+                prepare_audio_file, audio_cache.directory, audio_cache.dtype, audio_path
+            )
+            running[future] = audio_path
+
+        collect(concurrent.futures.ALL_COMPLETED)
+
+
+def group_files(audio_inputs, size):
+    group = []
+    for audio_input in audio_inputs:
+        group.append(audio_input)
+        if len(group) == size:
+            yield group
+            group = []
+
+    if group:
+        yield group
+
+
+def skip_processed_files(audio, manifest, verbose):
+    for audio_path in audio:
+        if manifest.is_completed(audio_path):
+            if verbose:
+                print(f"Skipping '{audio_path}', already completed")
+        elif manifest.has_exhausted_retries(audio_path):
+            sys.stderr.write(
+                f"Skipping '{audio_path}', failed more than {manifest.max_retries} retries\n"
+            )
+        else:
+            yield audio_path
+
+
+def submit_to_diarization(audio, diarization_process):
+    for audio_path in audio:
+        diarization_process.submit(audio_path)
+        yield audio_path
+
+    diarization_process.close()
+
+
+def get_threads_per_worker(threads, workers):
+    if workers <= 1:
+        return threads
+
+    # Split the threads budget (all the cores if not specified) between workers
+    budget = threads if threads else os.cpu_count() or 1
+    return max(1, budget // workers)
+
+
+def get_model_identity(model_dir):
+    # For models loaded from a directory also use the model file metadata to
+    # distinguish between different versions of the model in the same directory
+    model_filename = os.path.join(model_dir, "model.bin")
+    if os.path.exists(model_filename):
+        stat = os.stat(model_filename)
+        return f"{os.path.abspath(model_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    return model_dir
+
+
+def get_temperatures(temperature, increment):
+    # Same values as numpy.arange(temperature, 1.0 + 1e-6, increment) without
+    # importing numpy at startup
+    stop = 1.0 + 1e-6
+    count = max(0, math.ceil((stop - temperature) / increment))
+    step = (temperature + increment) - temperature
+    return tuple(temperature + i * step for i in range(count))
+
+
 def get_transcription_options(args):
     temperature = args.pop("temperature")
 
     if (increment := args.pop("temperature_increment_on_fallback")) is not None:
-        temperature = tuple(np.arange(temperature, 1.0 + 1e-6, increment))
+        temperature = get_temperatures(temperature, increment)
     else:
         temperature = [temperature]
 
@@ -120,13 +316,47 @@ def main():
     hf_token = args.pop("hf_token")
     speaker_name = args.pop("speaker_name")
     speaker_num = args.pop("speaker_num")
+    word_speakers: bool = args.pop("word_speakers")
+    concurrent_diarization = args.pop("concurrent_diarization")
+    diarization_cache_dir: str = args.pop("diarization_cache_dir")
+    rttm_input: str = args.pop("rttm_input")
+    diarization_vad: bool = args.pop("diarization_vad")
     batched = args.pop("batched")
     batch_size = args.pop("batch_size")
+    batch_files: int = args.pop("batch_files")
+    workers: int = args.pop("workers")
+    prefetch: int = args.pop("prefetch")
+    result_cache_dir: str = args.pop("result_cache_dir")
+    result_cache_max_size: int = args.pop("result_cache_max_size")
+    resume: bool = args.pop("resume")
+    resume_max_retries: int = args.pop("resume_max_retries")
+    input_list: str = args.pop("input_list")
+    input_extensions: List[str] = args.pop("input_extensions")
+    input_format: str = args.pop("input_format")
+    input_sample_rate: int = args.pop("input_sample_rate")
+    shard_index_count = args.pop("shard")
+    serve: bool = args.pop("serve")
+    server_host: str = args.pop("server_host")
+    server_port: int = args.pop("server_port")
+    server_socket: str = args.pop("server_socket")
+    server_queue_size: int = args.pop("server_queue_size")
+    server_url: str = args.pop("server_url")
+    sort_by_duration: bool = args.pop("sort_by_duration")
+    show_eta: bool = args.pop("show_eta")
+    metrics: bool = args.pop("metrics")
+    stream_output: bool = args.pop("stream_output")
+    split_long_files: float = args.pop("split_long_files")
+    audio_cache_dir: str = args.pop("audio_cache_dir")
+    audio_cache_dtype: str = args.pop("audio_cache_dtype")
+    audio_cache_max_size: int = args.pop("audio_cache_max_size")
+    prepare: bool = args.pop("prepare_audio")
+    autotune: bool = args.pop("autotune")
+    perf_profile: str = args.pop("perf_profile")
 
     language = get_language(language, model_directory, model)
     options = get_transcription_options(args)
 
-    if not live_transcribe and len(audio) == 0:
+    if not live_transcribe and not serve and len(audio) == 0 and not input_list:
         sys.stderr.write("You need to specify one or more audio files\n")
         sys.stderr.write(
             "Use `whisper-ctranslate2 --help` to see the available options.\n"
@@ -155,6 +385,109 @@ def main():
         sys.stderr.write("--batched_size can only be used if --batched is True")
         return
 
+    if batch_files > 1 and not batched:
+        sys.stderr.write("--batch_files can only be used if --batched is True\n")
+        return
+
+    if batch_files < 1:
+        sys.stderr.write("--batch_files must be 1 or greater\n")
+        return
+
+    if batch_files > 1:
+        # The files are packed by the transcription model of this process
+        incompatible = dict(
+            server_url=server_url,
+            split_long_files=split_long_files > 0,
+        )
+        for option, value in incompatible.items():
+            if value:
+                sys.stderr.write(f"--batch_files cannot be used with --{option}\n")
+                return
+
+    if workers < 1:
+        sys.stderr.write("--workers must be 1 or greater\n")
+        return
+
+    if prefetch < 0:
+        sys.stderr.write("--prefetch cannot be negative\n")
+        return
+
+    if prepare and not audio_cache_dir:
+        sys.stderr.write("--prepare_audio requires --audio_cache_dir\n")
+        return
+
+    if split_long_files > 0 and workers < 2:
+        sys.stderr.write("--split_long_files requires --workers 2 or greater\n")
+        return
+
+    if split_long_files > 0 and server_url:
+        sys.stderr.write("--split_long_files cannot be used with --server_url\n")
+        return
+
+    if result_cache_dir and server_url:
+        # The server transcribes with its own options, unknown to the cache key
+        sys.stderr.write("--result_cache_dir cannot be used with --server_url\n")
+        return
+
+    if stream_output:
+        incompatible = dict(
+            server_url=server_url,
+            result_cache_dir=result_cache_dir,
+            batch_files=batch_files > 1,
+            split_long_files=split_long_files > 0,
+        )
+        for option, value in incompatible.items():
+            if value:
+                sys.stderr.write(f"--stream_output cannot be used with --{option}\n")
+                return
+
+    if any(is_stream(audio_path) for audio_path in audio):
+        # Streams can only be read once and their length is unknown
+        incompatible = dict(
+            hf_token=len(hf_token) > 0,
+            server_url=server_url,
+            result_cache_dir=result_cache_dir,
+            audio_cache_dir=audio_cache_dir,
+            diarization_cache_dir=diarization_cache_dir,
+            resume=resume,
+            sort_by_duration=sort_by_duration,
+            show_eta=show_eta,
+            batch_files=batch_files > 1,
+            split_long_files=split_long_files > 0,
+            autotune=autotune,
+        )
+        for option, value in incompatible.items():
+            if value:
+                sys.stderr.write(
+                    f"Audio from stdin or named pipes cannot be used with --{option}\n"
+                )
+                return
+
+    if STDIN in audio and input_list == STDIN:
+        sys.stderr.write("stdin cannot be used for both the audio and --input_list\n")
+        return
+
+    if input_sample_rate < 1:
+        sys.stderr.write("--input_sample_rate must be 1 or greater\n")
+        return
+
+    if diarization_vad and len(hf_token) == 0:
+        sys.stderr.write("--diarization_vad requires --hf_token\n")
+        return
+
+    if rttm_input and len(hf_token) > 0:
+        sys.stderr.write("--rttm_input cannot be used with --hf_token\n")
+        return
+
+    rttm_turns = None
+    if rttm_input:
+        try:
+            with open(rttm_input, "r", encoding="utf-8") as f:
+                rttm_turns = read_rttm(f)
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"Unable to read --rttm_input: {e}\n")
+            return
+
     if args["max_line_count"] and not args["max_line_width"]:
         warnings.warn("--max_line_count has no effect without --max_line_width")
 
@@ -169,8 +502,11 @@ def main():
         sys.stderr.write("You cannot disable verbose and enable print colors\n")
         return
 
-    if live_transcribe and not Live.is_available():
-        Live.force_not_available_exception()
+    if live_transcribe:
+        from .live import Live
+
+        if not Live.is_available():
+            Live.force_not_available_exception()
 
     if verbose and not language:
         if live_transcribe:
@@ -197,6 +533,129 @@ def main():
     else:
         model_dir = model
 
+    if autotune:
+        audio_path = next(
+            iterate_audio_files(audio, input_list, input_extensions), None
+        )
+        if audio_path is None:
+            sys.stderr.write("--autotune requires an audio file to measure\n")
+            return
+
+        tuner = AutoTuner(
+            model_dir, cache_directory, local_files_only, task, language, options
+        )
+        try:
+            profile = tuner.tune(audio_path, model_directory or model)
+        except RuntimeError as e:
+            print(f"error: {e}")
+            exit(ExitCode.RUNTIME_ERROR)
+
+        perf_profile = perf_profile or DEFAULT_PROFILE
+        save_profile(profile, perf_profile)
+        print(f"Performance profile written to '{perf_profile}'")
+        return
+
+    transcription_settings = dict(
+        model=get_model_identity(model_dir),
+        compute_type=compute_type,
+        batched=batched,
+        batch_size=batch_size,
+        task=task,
+        language=language,
+        options=options,
+    )
+
+    if split_long_files > 0:
+        # Windows are cut depending on the number of workers
+        transcription_settings["split_long_files"] = [split_long_files, workers]
+
+    if batch_files > 1:
+        # The packed results differ from the ones of the files transcribed alone
+        transcription_settings["batch_files"] = batch_files
+
+    # Input files are enumerated lazily as they are processed
+    multiple_files = (
+        input_list is not None
+        or len(audio) > 1
+        or any(os.path.isdir(audio_path) for audio_path in audio)
+    )
+    audio_files = iterate_audio_files(audio, input_list, input_extensions)
+    if shard_index_count:
+        audio_files = shard(audio_files, *shard_index_count)
+
+    # Speakers are assigned to words only if there are word timestamps
+    word_speakers = word_speakers and options.word_timestamps
+    # The server does not diarize
+    diarization = (len(hf_token) > 0 or rttm_turns is not None) and not serve
+    if diarization and rttm_turns is not None:
+        # The turns are matched by file name without extension
+        audio_files = list(audio_files)
+        duplicate = find_duplicate_file_id(audio_files)
+        if duplicate:
+            sys.stderr.write(
+                f"--rttm_input cannot tell apart '{duplicate[0]}' and '{duplicate[1]}', both are '{get_file_id(duplicate[0])}'\n"
+            )
+            return
+    # Only the speech found by the VAD is diarized
+    vad_parameters = get_vad_parameters(options) if diarization_vad else None
+
+    manifest = None
+    if resume and not live_transcribe:
+        diarization_settings = dict(
+            diarization=diarization,
+            speaker_name=speaker_name,
+            speaker_num=speaker_num,
+        )
+        if diarization and word_speakers:
+            diarization_settings["word_speakers"] = True
+        if rttm_input:
+            diarization_settings["rttm_input"] = hash_file(rttm_input)
+        if vad_parameters is not None:
+            diarization_settings["diarization_vad"] = vad_parameters
+
+        fingerprint = hash_settings(
+            **transcription_settings,
+            output_format=output_format,
+            writer_args=writer_args,
+            **diarization_settings,
+        )
+        manifest = Manifest(output_dir, fingerprint, resume_max_retries)
+        audio_files = skip_processed_files(audio_files, manifest, verbose)
+
+    eta_estimator = None
+    if not live_transcribe and not serve and (sort_by_duration or show_eta):
+        # Both need to know all the files in advance
+        audio_files = list(audio_files)
+        durations = get_durations(audio_files)
+        if sort_by_duration:
+            audio_files = sort_longest_first(audio_files, durations)
+        if show_eta:
+            eta_estimator = EtaEstimator(sum(durations.values()))
+
+    if not live_transcribe and not serve:
+        # Avoid loading the models if there is nothing to process
+        audio_files = iter(audio_files)
+        first_file = next(audio_files, None)
+        if first_file is None:
+            if verbose:
+                print("There are no audio files to process")
+            return
+        audio_files = itertools.chain([first_file], audio_files)
+
+    audio_cache = None
+    load_audio = decode_audio
+    # Loads the files that are not prefetched
+    load_input = None
+    if audio_cache_dir:
+        audio_cache = AudioCache(
+            audio_cache_dir, audio_cache_dtype, audio_cache_max_size
+        )
+        load_audio = load_input = audio_cache.load
+
+    if prepare:
+        prepare_audio(audio_files, audio_cache, workers, verbose)
+        return
+
     if live_transcribe:
         Live(
             model_dir,
@@ -217,67 +676,383 @@ def main():
 
         return
 
-    try:
-        transcribe = Transcribe(
-            model_dir,
-            device,
-            device_index,
-            compute_type,
-            threads,
-            cache_directory,
-            local_files_only,
-            batched,
-            batch_size,
-        )
-    except RuntimeError as e:
-        print(f"error: {e}")
-        exit(ExitCode.RUNTIME_ERROR)
-
-    diarization = len(hf_token) > 0
+    diarization_output = {}
+    diarization_process = None
+    diarization_lock = threading.Lock()
+    # Files diarized while they are transcribed, using the same decoded audio
+    diarize_inline = False
+    # Decoded audio shared with the diarization process by file
+    share_audio = False
+    shared_audio = {}
+    diarization_cache = None
+    if diarization and rttm_turns is not None:
+        from .speakers import SpeakerAssignment
 
-    if diarization:
+        # The turns are computed elsewhere, torch and pyannote are not needed
+        speaker_assignment = SpeakerAssignment()
+        if verbose:
+            print(f"Using the speaker turns from '{rttm_input}'")
+    elif diarization:
         # Import is done here then dependencies like torch are only imported if we really need diarization
-        from .diarization import Diarization
+        from .diarization import (
+            Diarization,
+            DiarizationProcess,
+            SharedAudio,
+            get_speech_chunks,
+        )
 
         diarization_device = "cpu" if device == "auto" else device
         diarize_model = Diarization(
             token=hf_token, device=diarization_device, num_speakers=speaker_num
         )
-        if threads > 0:
-            diarize_model.set_threads(threads)
+        speaker_assignment = diarize_model
+        if diarization_cache_dir:
+            diarization_cache = DiarizationCache(
+                diarization_cache_dir,
+                speaker_num,
+                Diarization.model_name,
+                vad_parameters,
+            )
 
-    diarization_output = {}
-    if diarization:
-        diarization_output = get_diarization(audio, diarize_model, verbose)
+        if concurrent_diarization:
+            # The diarization process has its own CUDA context then it can run
+            # at the same time that CTranslate2 transcribes the files
+            diarization_process = DiarizationProcess(
+                token=hf_token,
+                device=diarization_device,
+                num_speakers=speaker_num,
+                threads=threads,
+                verbose=verbose,
+                audio_cache_dir=audio_cache_dir,
+                audio_cache_dtype=audio_cache_dtype,
+                audio_cache_max_size=audio_cache_max_size,
+                diarization_cache_dir=diarization_cache_dir,
+                vad_parameters=vad_parameters,
+            )
+            if audio_cache or os.name != "posix":
+                # With the cache both processes map the same cached file. Files
+                # in use cannot be removed in Windows, then they are decoded twice
+                audio_files = submit_to_diarization(audio_files, diarization_process)
+            else:
+                # Files are submitted once decoded, the diarization process maps
+                # the same decoded audio that is transcribed
+                def load_shared_audio(audio_path):
+                    shared = SharedAudio(audio_path)
+                    with diarization_lock:
+                        shared_audio.setdefault(audio_path, []).append(shared)
+                    diarization_process.submit(audio_path, shared.filename)
+                    return shared.audio
 
-    # We need to do first the diarization of all files because CTranslate2 and torch
-    # use incompatible CUDA versions and once CTranslate2 is used torch will not work
-    for audio_path in audio:
-        try:
-            if verbose and len(audio) > 1:
-                print(f"\nFile: '{audio_path} ({task})'")
+                load_audio = load_input = load_shared_audio
+                share_audio = True
+        else:
+            if threads > 0:
+                diarize_model.set_threads(threads)
+
+            if server_url or get_transcription_device(device) == "cpu":
+                # Each file is diarized when transcribed with the same decoded audio.
+                # Only if CTranslate2 does not use CUDA, even if torch uses the CPU
+                diarize_inline = True
+                load_input = load_input or decode_audio
+            else:
+                # We need to do first the diarization of all files because CTranslate2 and torch
+                # use incompatible CUDA versions and once CTranslate2 is used torch will not work.
+                # The pipeline is released before the CTranslate2 model is loaded
+                audio_files = list(audio_files)
+                diarization_output = get_diarization(
+                    audio_files,
+                    diarize_model,
+                    verbose,
+                    load_audio,
+                    diarization_cache,
+                    vad_parameters,
+                )
+
+    try:
+        if server_url:
+            # Thin client, the server transcribes using its own model and options
+            from .server import Client
+
+            transcribe = Client(server_url)
+        else:
+            from .transcribe import Transcribe
+
+            transcribe = Transcribe(
+                model_dir,
+                device,
+                device_index,
+                compute_type,
+                get_threads_per_worker(threads, workers),
+                cache_directory,
+                local_files_only,
+                batched,
+                batch_size,
+                workers,
+                metrics=metrics,
+            )
+    except RuntimeError as e:
+        print(f"error: {e}")
+        exit(ExitCode.RUNTIME_ERROR)
+
+    if serve:
+        from .server import Server
+
+        Server(
+            transcribe,
+            task,
+            language,
+            options,
+            writer_args,
+            workers,
+            server_queue_size,
+            verbose,
+        ).serve(server_host, server_port, server_socket)
+        return
+
+    run_summary = RunSummary() if metrics else None
+
+    result_cache = None
+    if result_cache_dir:
+        result_cache = ResultCache(result_cache_dir, result_cache_max_size)
+
+    def get_cached_result(audio_path):
+        cache_key = result_cache.get_key(audio_path, **transcription_settings)
+        result = result_cache.get(cache_key)
+        if result and verbose:
+            print(f"Using cached transcription result for '{audio_path}'")
+
+        return cache_key, result
+
+    def get_cached_turns(audio_path):
+        cache_key = diarization_cache.get_key(audio_path)
+        turns = diarization_cache.get(cache_key)
+        if turns is not None and verbose:
+            print(f"Using cached diarization for '{audio_path}'")
+
+        return cache_key, turns
+
+    def get_speech_chunks_once(audio_path, audio_input):
+        """VAD speech chunks of the file computed for the diarization, which the
+        transcription reuses if it runs the VAD with the same parameters"""
+        if vad_parameters is None:
+            return None
+
+        if diarize_inline:
+            with measure("vad"):
+                return get_speech_chunks(audio_input, vad_parameters)
+
+        if audio_path in diarization_output:
+            return diarization_output[audio_path][1]
+
+        return None
+
+    def get_turns(audio_path, audio_input, speech_chunks=None):
+        if rttm_turns is not None:
+            file_id = get_file_id(audio_path)
+            if file_id not in rttm_turns:
+                sys.stderr.write(
+                    f"No speaker turns for '{file_id}' in '{rttm_input}'\n"
+                )
+            return rttm_turns.get(file_id, [])
+
+        if diarization_process:
+            if share_audio:
+                with diarization_lock:
+                    submitted = audio_path in shared_audio
+                if not submitted:
+                    if diarization_cache:
+                        _, turns = get_cached_turns(audio_path)
+                        if turns is not None:
+                            return turns
+                    # Cached results are not transcribed, decode only to diarize
+                    get_audio_input(audio_input, load_input)
+            with measure("diarization_wait"):
+                return diarization_process.get_turns(audio_path)
+
+        if diarize_inline:
+            if diarization_cache:
+                cache_key, turns = get_cached_turns(audio_path)
+                if turns is not None:
+                    return turns
+
+            audio = get_audio_input(audio_input, load_input)
+            if speech_chunks is None:
+                speech_chunks = get_speech_chunks_once(audio_path, audio)
+            # The pipeline is not thread safe
+            with diarization_lock, measure("diarization"):
+                turns = diarize_model.run_model(audio, speech_chunks)
+
+            if diarization_cache:
+                diarization_cache.put(cache_key, turns, speech_chunks)
+            return turns
+
+        return diarization_output[audio_path][0]
+
+    def write_audio(audio_path, audio_input, packed, file_metrics):
+        start_time = datetime.datetime.now()
+        result, language_probability, packed_metrics = packed
+        if language_probability is not None:
+            # Transcribed with other files, printed now as if transcribed alone
+            transcribe.print_result(result, language_probability, verbose, options)
+        if file_metrics and packed_metrics:
+            file_metrics.add_part(packed_metrics)
+
+        if result is None and result_cache:
+            cache_key, result = get_cached_result(audio_path)
+
+        speech_chunks = None
+        if result is None:
+            # Decoded once for both the transcription and the diarization
+            audio_input = get_audio_input(audio_input, load_input)
+            speech_chunks = get_speech_chunks_once(audio_path, audio_input)
+            if split_long_files > 0:
+                result = transcribe.inference_windows(
+                    audio_input,
+                    task,
+                    language,
+                    verbose,
+                    options,
+                    workers,
+                    split_long_files,
+                )
+            else:
+                result = transcribe.inference(
+                    audio_input,
+                    task,
+                    language,
+                    verbose,
+                    False,
+                    options,
+                    speech_chunks,
+                )
+
+            if result_cache:
+                result_cache.put(cache_key, result)
+
+        if diarization:
+            if verbose:
+                print(
+                    f"Time used for transcription: {datetime.datetime.now() - start_time}"
+                )
+            turns = get_turns(audio_path, audio_input, speech_chunks)
+            with measure("speaker_assignment"):
+                if word_speakers:
+                    result = speaker_assignment.assign_speakers_to_words(
+                        turns, result, speaker_name
+                    )
+                else:
+                    result = speaker_assignment.assign_speakers_to_segments(
+                        turns, result, speaker_name
+                    )
+
+        if file_metrics:
+            result = dict(result, metrics=file_metrics.as_dict())
+
+        with measure("writing"):
+            writer = get_writer(output_format, output_dir)
+            return writer(result, audio_path, writer_args)
 
-            start_time = datetime.datetime.now()
-            result = transcribe.inference(
-                audio_path,
+    def stream_audio(audio_path, audio_input, file_metrics):
+        # Segments are written as they are transcribed, then only the text of the
+        # transcription is kept in memory
+        speech_chunks = None
+        if is_stream(audio_path):
+            from .stream import read_audio_stream
+
+            segments, detected_language = transcribe.transcribe_stream(
+                read_audio_stream(audio_path, input_format, input_sample_rate),
+                task,
+                language,
+                verbose,
+                options,
+            )
+        else:
+            audio_input = get_audio_input(audio_input, load_input)
+            speech_chunks = get_speech_chunks_once(audio_path, audio_input)
+            segments, detected_language = transcribe.transcribe_segments(
+                audio_input,
                 task,
                 language,
                 verbose,
                 False,
                 options,
+                speech_chunks,
             )
+        turns = (
+            get_turns(audio_path, audio_input, speech_chunks) if diarization else None
+        )
 
-            if diarization:
-                if verbose:
-                    print(
-                        f"Time used for transcription: {datetime.datetime.now() - start_time}"
-                    )
-                result = diarize_model.assign_speakers_to_segments(
-                    diarization_output[audio_path], result, speaker_name
-                )
+        texts = []
+        writers = get_writers(output_format, output_dir)
+        with StreamingWriter(writers, audio_path, writer_args) as writer:
+            segment_id = 0
+            for segment in segments:
+                parts = [segment]
+                if turns is not None:
+                    with measure("speaker_assignment"):
+                        if word_speakers:
+                            parts = speaker_assignment.assign_speakers_to_words(
+                                turns, dict(segments=[segment]), speaker_name
+                            )["segments"]
+                        else:
+                            speaker_assignment.assign_speakers_to_segments(
+                                turns, dict(segments=[segment]), speaker_name
+                            )
 
-            writer = get_writer(output_format, output_dir)
-            writer(result, audio_path, writer_args)
+                texts.append(segment["text"])
+                for part in parts:
+                    if turns is not None and word_speakers:
+                        # Numbered again since the segments may be split
+                        segment_id += 1
+                        part["id"] = segment_id
+                    with measure("writing"):
+                        writer.write_segment(part)
+
+            result = dict(text="".join(texts), language=detected_language)
+            if file_metrics:
+                result["metrics"] = file_metrics.as_dict()
+
+            with measure("writing"):
+                return writer.finish(result)
+
+    def release_shared_audio(audio_path):
+        with diarization_lock:
+            files = shared_audio.get(audio_path)
+            if not files:
+                return
+
+            shared = files.pop(0)
+            if not files:
+                del shared_audio[audio_path]
+
+        shared.release()
+
+    def process_audio(audio_path, audio_input, packed=(None, None, None)):
+        try:
+            if verbose and multiple_files:
+                print(f"\nFile: '{audio_path} ({task})'")
+
+            with (
+                collect_metrics() if metrics else contextlib.nullcontext()
+            ) as file_metrics:
+                if file_metrics:
+                    # Decoded in a prefetch thread, out of the metrics of this one
+                    audio_input = get_audio_input(audio_input)
+                    if prefetch_decode_times.get(audio_path):
+                        decode_time = prefetch_decode_times[audio_path].popleft()
+                        file_metrics.add_time("decode", decode_time)
+                if stream_output or is_stream(audio_path):
+                    outputs = stream_audio(audio_path, audio_input, file_metrics)
+                else:
+                    outputs = write_audio(audio_path, audio_input, packed, file_metrics)
+
+            if run_summary:
+                run_summary.add(file_metrics)
+
+            if manifest:
+                manifest.record_done(
+                    audio_path, outputs if isinstance(outputs, list) else [outputs]
+                )
 
         except Exception as e:
             error_details = traceback.format_exc()
@@ -287,7 +1062,158 @@ def main():
                 f"Exception Message: {e}\n"
                 f"Traceback:\n{error_details}\n"
             )
-            continue
+            if manifest:
+                manifest.record_failed(audio_path, f"{type(e).__name__}: {e}")
+
+        finally:
+            # Both the transcription and the diarization are done with the audio
+            if share_audio:
+                release_shared_audio(audio_path)
+
+        if eta_estimator:
+            print(eta_estimator.update(durations[audio_path]))
+
+    def transcribe_packed(files):
+        """
+        Transcribes together the files that are not in the result cache. Returns the
+        files with their decoded audio, which is reused to diarize them, and for
+        each file its result, the language probability if it was transcribed and
+        its part of the metrics of the transcription
+        """
+        files = list(files)
+        packed = [(None, None, None)] * len(files)
+        cache_keys = [None] * len(files)
+        pending = []
+        for i, (audio_path, _) in enumerate(files):
+            result = None
+            if result_cache:
+                cache_keys[i], result = get_cached_result(audio_path)
+            if result is None:
+                pending.append(i)
+            else:
+                packed[i] = (result, None, None)
+
+        if len(pending) == 0:
+            return files, packed
+
+        with (
+            collect_metrics() if metrics else contextlib.nullcontext()
+        ) as group_metrics:
+            try:
+                for i in pending:
+                    audio_path, audio_input = files[i]
+                    files[i] = (audio_path, get_audio_input(audio_input, load_audio))
+
+                packed_results = transcribe.inference_packed(
+                    [files[i][1] for i in pending], task, language, options
+                )
+            except Exception as e:
+                # Transcribing the files one by one reports the errors of each file
+                sys.stderr.write(
+                    f"Unable to transcribe the files together, transcribing them one by one: {e}\n"
+                )
+                return files, packed
+
+        sampling_rate = transcribe.model.feature_extractor.sampling_rate
+        total_samples = sum(len(files[i][1]) for i in pending)
+        for i, (result, language_probability) in zip(pending, packed_results):
+            file_metrics = None
+            if group_metrics:
+                # The batches mix the files, the time is split by their duration
+                samples = len(files[i][1])
+                file_metrics = group_metrics.get_part(
+                    samples / total_samples if total_samples else 0,
+                    samples / sampling_rate,
+                )
+
+            packed[i] = (result, language_probability, file_metrics)
+            if result_cache:
+                result_cache.put(cache_keys[i], result)
+
+        return files, packed
+
+    def process_files(files):
+        if batch_files > 1:
+            files, packed = transcribe_packed(files)
+            for (audio_path, audio_input), file_packed in zip(files, packed):
+                process_audio(audio_path, audio_input, file_packed)
+        else:
+            for audio_path, audio_input in files:
+                process_audio(audio_path, audio_input)
+
+    # The prefetched files are decoded in other threads, out of their metrics
+    prefetch_decode_times = collections.defaultdict(collections.deque)
+
+    def load_prefetched(audio_path):
+        start_time = time.perf_counter()
+        audio_input = load_audio(audio_path)
+        prefetch_decode_times[audio_path].append(time.perf_counter() - start_time)
+        return audio_input
+
+    file_groups = group_files(
+        prefetch_audio(
+            audio_files, prefetch, load_prefetched if metrics else load_audio
+        ),
+        batch_files,
+    )
+    try:
+        if workers > 1:
+            # Files are written as soon as they are completed. New files are only
+            # submitted when a worker is free to keep the prefetched audio bounded
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                running = set()
+                for files in file_groups:
+                    if len(running) >= workers:
+                        done, running = concurrent.futures.wait(
+                            running, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            future.result()
+
+                    running.add(executor.submit(process_files, files))
+
+                for future in concurrent.futures.as_completed(running):
+                    future.result()
+        else:
+            for files in file_groups:
+                process_files(files)
+
+        if diarization_process:
+            if share_audio:
+                # Submitted while decoding the files instead of when enumerating them
+                diarization_process.close()
+            diarization_process.join()
+    finally:
+        if share_audio:
+            # The prefetched files finish decoding once the generators are closed
+            file_groups.close()
+            # Decoded files that were not transcribed, e.g. on errors or Ctrl+C
+            with diarization_lock:
+                pending = [
+                    shared for files in shared_audio.values() for shared in files
+                ]
+                shared_audio.clear()
+            for shared in pending:
+                shared.release()
+
+    if run_summary:
+        print(run_summary.get_summary())
+
+    if result_cache and verbose:
+        print(
+            f"Transcription results cache: {result_cache.hits} hits, {result_cache.misses} misses"
+        )
+
+    if audio_cache and verbose:
+        print(
+            f"Decoded audio cache: {audio_cache.hits} hits, {audio_cache.misses} misses"
+        )
+
+    if diarization_cache and verbose and not diarization_process:
+        # The diarization process uses its own cache
+        print(
+            f"Diarization cache: {diarization_cache.hits} hits, {diarization_cache.misses} misses"
+        )
 
     if verbose:
         print(f"Transcription results written to '{output_dir}' directory")
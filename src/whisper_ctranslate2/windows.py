@@ -0,0 +1,73 @@
+from typing import List, Tuple
+
+
+def get_window_boundaries(
+    speech_chunks: List[dict], num_samples: int, windows: int
+) -> List[Tuple[int, int]]:
+    """
+    Splits the audio into up to 'windows' parts of similar length. The audio is only
+    cut in the middle of the silences between the speech chunks detected by the VAD,
+    then no speech is split between two windows. Returns the (start, end) samples.
+    """
+    silences = [
+        (previous["end"] + current["start"]) // 2
+        for previous, current in zip(speech_chunks, speech_chunks[1:])
+    ]
+
+    cuts = []
+    for i in range(1, windows):
+        target = num_samples * i // windows
+        candidates = [silence for silence in silences if not cuts or silence > cuts[-1]]
+        if not candidates:
+            break
+
+        cuts.append(min(candidates, key=lambda silence: abs(silence - target)))
+
+    points = [0] + cuts + [num_samples]
+    return list(zip(points, points[1:]))
+
+
+def shift_segment(
+    segment: dict, segment_id: int, offset: float, frames_per_second: int
+) -> dict:
+    """Copy of a segment of audio that starts at 'offset' seconds with the
+    timestamps relative to the beginning of the whole audio"""
+    segment = dict(
+        segment,
+        id=segment_id,
+        seek=segment["seek"] + round(offset * frames_per_second),
+        start=round(segment["start"] + offset, 3),
+        end=round(segment["end"] + offset, 3),
+    )
+    if segment.get("words"):
+        segment["words"] = [
+            dict(
+                word,
+                start=round(word["start"] + offset, 3),
+                end=round(word["end"] + offset, 3),
+            )
+            for word in segment["words"]
+        ]
+
+    return segment
+
+
+def stitch_windows(
+    results: List[dict], offsets: List[float], frames_per_second: int
+) -> dict:
+    """
+    Joins the transcription of consecutive windows moving the timestamps of every
+    window by its offset (in seconds) and numbering the segments again
+    """
+    segments = []
+    for result, offset in zip(results, offsets):
+        for segment in result["segments"]:
+            segments.append(
+                shift_segment(segment, len(segments) + 1, offset, frames_per_second)
+            )
+
+    return dict(
+        text="".join(segment["text"] for segment in segments),
+        segments=segments,
+        language=results[0]["language"] if results else None,
+    )
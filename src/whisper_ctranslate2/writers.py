@@ -5,8 +5,29 @@
 import json
 import os
 import re
+import shutil
+import sys
+import tempfile
+import textwrap
+import threading
 
-from typing import Callable, Optional, TextIO
+from typing import Callable, List, Optional, TextIO, Tuple, Union
+
+# Output files are written with few system calls and flushed once
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+HIGHLIGHT_PATTERN = re.compile(r"^(\s*)(.*)$")
+
+system_encoding = sys.getdefaultencoding()
+
+if system_encoding != "utf-8":
+
+    def make_safe(string):
+        return string.encode(system_encoding, errors="replace").decode(system_encoding)
+
+else:
+
+    def make_safe(string):
+        return string
 
 
 def format_timestamp(
@@ -30,140 +51,225 @@ def format_timestamp(
     )
 
 
+def _get_temp_path(output_path: str) -> str:
+    return f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _get_milliseconds(seconds: float) -> int:
+    # As rounded by format_timestamp
+    return round(seconds * 1000.0)
+
+
 class ResultWriter:
+    """
+    Writes the transcription of a file. The result can be written at once with
+    write_result or segment by segment, as they are transcribed, calling start,
+    write_segment for each segment and finish with the rest of the result. Writers
+    keep the state of the file being written, use one instance for each file.
+    """
+
     extension: str
+    # False if the segments cannot be written until the rest of the result is known
+    streams_segments: bool = True
 
     def __init__(self, output_dir: str):
         self.output_dir = output_dir
 
-    def __call__(self, result: dict, audio_path: str, options: dict):
-        audio_basename = os.path.basename(audio_path)
+    def get_output_path(self, audio_path: str) -> str:
+        # Audio read from stdin ('-')
+        audio_basename = "stdin" if audio_path == "-" else os.path.basename(audio_path)
         audio_basename = os.path.splitext(audio_basename)[0]
-        output_path = os.path.join(
-            self.output_dir, audio_basename + "." + self.extension
-        )
+        return os.path.join(self.output_dir, audio_basename + "." + self.extension)
+
+    def __call__(self, result: dict, audio_path: str, options: dict) -> str:
+        output_path = self.get_output_path(audio_path)
+
+        # Write to a temporary file and rename it to never leave a partially
+        # written output file if the process is interrupted
+        temp_path = _get_temp_path(output_path)
+        try:
+            with open(
+                temp_path, "w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE
+            ) as f:
+                self.write_result(result, f, options)
 
-        with open(output_path, "w", encoding="utf-8") as f:
-            self.write_result(result, f, options)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return output_path
 
     def write_result(self, result: dict, file: TextIO, options: dict):
+        self.start(file, options)
+        for segment in result["segments"]:
+            self.write_segment(segment, file, options)
+        self.finish(result, file, options)
+
+    def start(self, file: TextIO, options: dict):
+        pass
+
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
         raise NotImplementedError
 
+    def finish(self, result: dict, file: TextIO, options: dict):
+        pass
 
-class SubtitlesWriter(ResultWriter):
-    always_include_hours: bool
-    decimal_marker: str
 
-    def iterate_result(self, result: dict, options: dict):
+class SubtitleLayout:
+    """
+    Splits the transcription into subtitles as segments are added, returning the
+    subtitles (start, end, text) once they are complete, with the times in seconds.
+    If the segments have word timestamps the words are laid out according to the
+    line width, words per line and line count options, otherwise there is a subtitle
+    for each segment. The layout does not depend on the subtitles format, then it is
+    computed once for all of them.
+    """
+
+    def __init__(self, options: dict):
         raw_max_line_width: Optional[int] = options.get("max_line_width", None)
         raw_max_words_per_line: Optional[int] = options.get("max_words_per_line", None)
-        max_line_count: Optional[int] = options.get("max_line_count", None)
-        highlight_words = options.get("highlight_words", False)
-        max_line_width = 1000 if raw_max_line_width is None else raw_max_line_width
-        max_words_per_line = (
+        self.max_line_count: Optional[int] = options.get("max_line_count", None)
+        self.highlight_words = options.get("highlight_words", False)
+        self.max_line_width = 1000 if raw_max_line_width is None else raw_max_line_width
+        self.max_words_per_line = (
             1000 if raw_max_words_per_line is None else raw_max_words_per_line
         )
-        preserve_segments = (
-            max_line_count is None
+        self.preserve_segments = (
+            self.max_line_count is None
             or raw_max_line_width is None
             or raw_max_words_per_line is None
         )
 
-        def iterate_subtitles():
-            line_len = 0
-            line_count = 1
-            # the next subtitle to yield (a list of word timings with whitespace)
-            subtitle: list[dict] = []
-            last = result["segments"][0]["words"][0]["start"]
-            for segment in result["segments"]:
-                speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
-                chunk_index = 0
-                words_count = max_words_per_line
-                while chunk_index < len(segment["words"]):
-                    remaining_words = len(segment["words"]) - chunk_index
-                    if max_words_per_line > len(segment["words"]) - chunk_index:
-                        words_count = remaining_words
-                    for i, original_timing in enumerate(
-                        segment["words"][chunk_index : chunk_index + words_count]
-                    ):
-                        timing = original_timing.copy()
-                        long_pause = (
-                            not preserve_segments and timing["start"] - last > 3.0
-                        )
-                        has_room = line_len + len(timing["word"]) <= max_line_width
-                        seg_break = i == 0 and len(subtitle) > 0 and preserve_segments
-                        if (
-                            line_len > 0
-                            and has_room
-                            and not long_pause
-                            and not seg_break
-                        ):
-                            # line continuation
-                            line_len += len(timing["word"])
-                        else:
-                            # new line
-                            timing["word"] = speaker + timing["word"].strip()
-                            speaker = ""
-                            if (
-                                len(subtitle) > 0
-                                and max_line_count is not None
-                                and (long_pause or line_count >= max_line_count)
-                                or seg_break
-                            ):
-                                # subtitle break
-                                yield subtitle
-                                subtitle = []
-                                line_count = 1
-                            elif line_len > 0:
-                                # line break
-                                line_count += 1
-                                timing["word"] = "\n" + timing["word"]
-                            line_len = len(timing["word"].strip())
-                        subtitle.append(timing)
-                        last = timing["start"]
-                    chunk_index += max_words_per_line
-            if len(subtitle) > 0:
-                yield subtitle
-
-        if (
-            len(result["segments"]) > 0
-            and "words" in result["segments"][0]
-            and result["segments"][0]["words"] is not None
-            and len(result["segments"][0]["words"]) > 0
-        ):
-            for subtitle in iterate_subtitles():
-                subtitle_start = self.format_timestamp(subtitle[0]["start"])
-                subtitle_end = self.format_timestamp(subtitle[-1]["end"])
-                subtitle_text = "".join([word["word"] for word in subtitle])
-                if highlight_words:
-                    last = subtitle_start
-                    all_words = [timing["word"] for timing in subtitle]
-                    for i, this_word in enumerate(subtitle):
-                        start = self.format_timestamp(this_word["start"])
-                        end = self.format_timestamp(this_word["end"])
-                        if last != start:
-                            yield last, start, subtitle_text
-
-                        yield start, end, "".join(
-                            [
-                                (
-                                    re.sub(r"^(\s*)(.*)$", r"\1<u>\2</u>", word)
-                                    if j == i
-                                    else word
-                                )
-                                for j, word in enumerate(all_words)
-                            ]
-                        )
-                        last = end
+        # Decided with the first segment
+        self.use_words: Optional[bool] = None
+        self.line_len = 0
+        self.line_count = 1
+        # the next subtitle to complete (start, end and word with whitespace)
+        self.subtitle: List[Tuple[float, float, str]] = []
+        self.last = 0.0
+        # A new subtitle starts when the speaker of the words changes
+        self.speaker: Optional[str] = None
+
+    def add_segment(self, segment: dict) -> List[Tuple[float, float, str]]:
+        if self.use_words is None:
+            self.use_words = bool(segment.get("words"))
+            if self.use_words:
+                self.last = segment["words"][0]["start"]
+
+        if not self.use_words:
+            speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
+            segment_text = speaker + segment["text"].strip().replace("-->", "->")
+            return [(segment["start"], segment["end"], segment_text)]
+
+        subtitles = []
+        for subtitle in self._split_segment(segment):
+            subtitles += self._format_subtitle(subtitle)
+
+        return subtitles
+
+    def close(self) -> List[Tuple[float, float, str]]:
+        if len(self.subtitle) == 0:
+            return []
+
+        subtitle, self.subtitle = self.subtitle, []
+        return self._format_subtitle(subtitle)
+
+    def _split_segment(self, segment: dict) -> List[List[Tuple[float, float, str]]]:
+        completed = []
+        speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
+        words = segment["words"] or []
+        chunk_index = 0
+        words_count = self.max_words_per_line
+        while chunk_index < len(words):
+            remaining_words = len(words) - chunk_index
+            if self.max_words_per_line > remaining_words:
+                words_count = remaining_words
+            for i, timing in enumerate(words[chunk_index : chunk_index + words_count]):
+                start, word = timing["start"], timing["word"]
+                long_pause = not self.preserve_segments and start - self.last > 3.0
+                has_room = self.line_len + len(word) <= self.max_line_width
+                # Only the segments split by word speakers start a new subtitle
+                speaker_change = (
+                    chunk_index == 0
+                    and "speaker" in timing
+                    and segment.get("speaker") != self.speaker
+                )
+                seg_break = (
+                    i == 0
+                    and len(self.subtitle) > 0
+                    and (self.preserve_segments or speaker_change)
+                )
+                if self.line_len > 0 and has_room and not long_pause and not seg_break:
+                    # line continuation
+                    self.line_len += len(word)
                 else:
-                    yield subtitle_start, subtitle_end, subtitle_text
-        else:
-            for segment in result["segments"]:
-                speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
-                segment_start = self.format_timestamp(segment["start"])
-                segment_end = self.format_timestamp(segment["end"])
-                segment_text = speaker + segment["text"].strip().replace("-->", "->")
-                yield segment_start, segment_end, segment_text
+                    # new line
+                    word = speaker + word.strip()
+                    speaker = ""
+                    if (
+                        len(self.subtitle) > 0
+                        and self.max_line_count is not None
+                        and (long_pause or self.line_count >= self.max_line_count)
+                        or seg_break
+                    ):
+                        # subtitle break
+                        completed.append(self.subtitle)
+                        self.subtitle = []
+                        self.line_count = 1
+                    elif self.line_len > 0:
+                        # line break
+                        self.line_count += 1
+                        word = "\n" + word
+                    self.line_len = len(word.strip())
+                self.subtitle.append((start, timing["end"], word))
+                self.last = start
+            chunk_index += self.max_words_per_line
+
+        self.speaker = segment.get("speaker")
+        return completed
+
+    def _format_subtitle(
+        self, subtitle: List[Tuple[float, float, str]]
+    ) -> List[Tuple[float, float, str]]:
+        subtitle_start = subtitle[0][0]
+        subtitle_end = subtitle[-1][1]
+        all_words = [word for _, _, word in subtitle]
+        subtitle_text = "".join(all_words)
+        if not self.highlight_words:
+            return [(subtitle_start, subtitle_end, subtitle_text)]
+
+        lines = []
+        last = subtitle_start
+        for i, (start, end, word) in enumerate(subtitle):
+            if _get_milliseconds(last) != _get_milliseconds(start):
+                lines.append((last, start, subtitle_text))
+
+            highlighted = HIGHLIGHT_PATTERN.sub(r"\1<u>\2</u>", word)
+            text = "".join(all_words[:i]) + highlighted + "".join(all_words[i + 1 :])
+            lines.append((start, end, text))
+            last = end
+
+        return lines
+
+
+class SubtitlesWriter(ResultWriter):
+    """
+    Writes the subtitles of its own layout, or the subtitles of a layout shared with
+    other formats passed to write_subtitles.
+    """
+
+    always_include_hours: bool
+    decimal_marker: str
+
+    def iterate_result(self, result: dict, options: dict):
+        layout = SubtitleLayout(options)
+        for segment in result["segments"]:
+            for start, end, text in layout.add_segment(segment):
+                yield self.format_timestamp(start), self.format_timestamp(end), text
+        for start, end, text in layout.close():
+            yield self.format_timestamp(start), self.format_timestamp(end), text
 
     def format_timestamp(self, seconds: float):
         return format_timestamp(
@@ -172,14 +278,31 @@ class SubtitlesWriter(ResultWriter):
             decimal_marker=self.decimal_marker,
         )
 
+    def start(self, file: TextIO, options: dict):
+        self.layout = SubtitleLayout(options)
+
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
+        self.write_subtitles(self.layout.add_segment(segment), file)
+
+    def finish(self, result: dict, file: TextIO, options: dict):
+        self.write_subtitles(self.layout.close(), file)
+
+    def write_subtitles(self, subtitles: List[Tuple[float, float, str]], file: TextIO):
+        for start, end, text in subtitles:
+            self.write_subtitle(
+                self.format_timestamp(start), self.format_timestamp(end), text, file
+            )
+
+    def write_subtitle(self, start: str, end: str, text: str, file: TextIO):
+        raise NotImplementedError
+
 
 class WriteTXT(ResultWriter):
     extension: str = "txt"
 
-    def write_result(self, result: dict, file: TextIO, options: dict):
-        for segment in result["segments"]:
-            speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
-            print(speaker + segment["text"].strip(), file=file, flush=True)
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
+        speaker = f"[{segment['speaker']}]: " if "speaker" in segment else ""
+        file.write(speaker + segment["text"].strip() + "\n")
 
 
 class WriteSRT(SubtitlesWriter):
@@ -187,11 +310,13 @@ class WriteSRT(SubtitlesWriter):
     always_include_hours: bool = True
     decimal_marker: str = ","
 
-    def write_result(self, result: dict, file: TextIO, options: dict):
-        for i, (start, end, text) in enumerate(
-            self.iterate_result(result, options), start=1
-        ):
-            print(f"{i}\n{start} --> {end}\n{text}\n", file=file, flush=True)
+    def start(self, file: TextIO, options: dict):
+        super().start(file, options)
+        self.index = 0
+
+    def write_subtitle(self, start: str, end: str, text: str, file: TextIO):
+        self.index += 1
+        file.write(f"{self.index}\n{start} --> {end}\n{text}\n\n")
 
 
 class WriteVTT(SubtitlesWriter):
@@ -199,10 +324,12 @@ class WriteVTT(SubtitlesWriter):
     always_include_hours: bool = False
     decimal_marker: str = "."
 
-    def write_result(self, result: dict, file: TextIO, options: dict):
-        print("WEBVTT\n", file=file)
-        for start, end, text in self.iterate_result(result, options):
-            print(f"{start} --> {end}\n{text}\n", file=file, flush=True)
+    def start(self, file: TextIO, options: dict):
+        super().start(file, options)
+        file.write("WEBVTT\n\n")
+
+    def write_subtitle(self, start: str, end: str, text: str, file: TextIO):
+        file.write(f"{start} --> {end}\n{text}\n\n")
 
 
 class WriteTSV(ResultWriter):
@@ -217,16 +344,19 @@ class WriteTSV(ResultWriter):
 
     extension: str = "tsv"
 
-    def write_result(self, result: dict, file: TextIO, options: dict):
-        print("start", "end", "text", sep="\t", file=file)
-        for segment in result["segments"]:
-            print(round(1000 * segment["start"]), file=file, end="\t")
-            print(round(1000 * segment["end"]), file=file, end="\t")
-            print(segment["text"].strip().replace("\t", " "), file=file, flush=True)
+    def start(self, file: TextIO, options: dict):
+        file.write("start\tend\ttext\n")
+
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
+        start = round(1000 * segment["start"])
+        end = round(1000 * segment["end"])
+        text = segment["text"].strip().replace("\t", " ")
+        file.write(f"{start}\t{end}\t{text}\n")
 
 
 class WriteJSON(ResultWriter):
     extension: str = "json"
+    streams_segments: bool = False
 
     def write_result(self, result: dict, file: TextIO, options: dict):
         pretty_json: bool = options.get("pretty_json", False)
@@ -236,25 +366,195 @@ class WriteJSON(ResultWriter):
         else:
             json.dump(result, file)
 
+    def _dumps(self, data, options: dict) -> str:
+        if options.get("pretty_json", False):
+            return json.dumps(data, indent=4, ensure_ascii=False)
+
+        return json.dumps(data)
+
+    def start(self, file: TextIO, options: dict):
+        self.segments = None
+        self.segments_count = 0
+
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
+        pretty_json: bool = options.get("pretty_json", False)
+        if self.segments is None:
+            # The segments go after the text, which is only known at the end, then
+            # they are kept in a temporary file until the result is complete
+            self.segments = tempfile.TemporaryFile("w+", encoding="utf-8")
+        else:
+            self.segments.write(",\n" if pretty_json else ", ")
+
+        data = self._dumps(segment, options)
+        self.segments.write(textwrap.indent(data, " " * 8) if pretty_json else data)
+        self.segments_count += 1
+
+    def finish(self, result: dict, file: TextIO, options: dict):
+        pretty_json: bool = options.get("pretty_json", False)
+        # Same keys order than the result written at once
+        result = dict(
+            text=result["text"],
+            segments=[],
+            **{
+                key: value
+                for key, value in result.items()
+                if key not in ["text", "segments"]
+            },
+        )
+        before, after = self._dumps(result, options).split('"segments": []', 1)
+        file.write(before)
+        if self.segments_count == 0:
+            file.write('"segments": []')
+        else:
+            file.write('"segments": [\n' if pretty_json else '"segments": [')
+            self.segments.seek(0)
+            shutil.copyfileobj(self.segments, file)
+            file.write("\n    ]" if pretty_json else "]")
+            self.segments.close()
+        file.write(after)
+
+
+class WriteJSONL(ResultWriter):
+    """Writes a JSON object for each segment per line"""
+
+    extension: str = "jsonl"
+
+    def write_segment(self, segment: dict, file: TextIO, options: dict):
+        file.write(json.dumps(segment, ensure_ascii=False) + "\n")
+
+
+class StreamingWriter:
+    """
+    Writes the segments to the output files of several writers in a single pass.
+    The subtitles are laid out once for all the subtitle formats.
+
+    By default the files are flushed after each segment, then the partial output
+    can be followed while a file is being transcribed (JSON is only completed at
+    the end), and the output files are removed if the transcription does not
+    finish. With atomic the outputs are written to temporary files that are renamed
+    once all of them are complete, as ResultWriter does.
+    """
+
+    def __init__(
+        self,
+        writers: List[ResultWriter],
+        audio_path: str,
+        options: dict,
+        atomic: bool = False,
+    ):
+        self.writers = writers
+        self.options = options
+        self.atomic = atomic
+        self.output_paths = [writer.get_output_path(audio_path) for writer in writers]
+        self.paths = [
+            _get_temp_path(output_path) if atomic else output_path
+            for output_path in self.output_paths
+        ]
+        self.layout = None
+        if any(isinstance(writer, SubtitlesWriter) for writer in writers):
+            self.layout = SubtitleLayout(options)
+        self.files: List[TextIO] = []
+        # Writers that get the segments one by one, the rest the complete result
+        self.streaming = [True] * len(writers)
+        self.finished = False
+
+    def __enter__(self):
+        try:
+            for writer, path in zip(self.writers, self.paths):
+                self.files.append(
+                    open(path, "w", encoding="utf-8", buffering=OUTPUT_BUFFER_SIZE)
+                )
+                writer.start(self.files[-1], self.options)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+
+        return self
+
+    def write_result(self, result: dict) -> List[str]:
+        """Writes a complete result. The writers that cannot stream the segments,
+        like JSON, write it at once instead of keeping the segments until the end"""
+        self.streaming = [writer.streams_segments for writer in self.writers]
+        for writer, file, streaming in zip(self.writers, self.files, self.streaming):
+            if not streaming:
+                writer.write_result(result, file, self.options)
+
+        for segment in result["segments"]:
+            self.write_segment(segment)
+        return self.finish(result)
+
+    def write_segment(self, segment: dict):
+        subtitles = self.layout.add_segment(segment) if self.layout else None
+        for writer, file, streaming in zip(self.writers, self.files, self.streaming):
+            if not streaming:
+                continue
+            if isinstance(writer, SubtitlesWriter):
+                writer.write_subtitles(subtitles, file)
+            else:
+                writer.write_segment(segment, file, self.options)
+
+            if not self.atomic:
+                file.flush()
+
+    def finish(self, result: dict) -> List[str]:
+        """Completes the outputs with the rest of the result (text, language...)"""
+        subtitles = self.layout.close() if self.layout else None
+        for writer, file, streaming in zip(self.writers, self.files, self.streaming):
+            if not streaming:
+                continue
+            if isinstance(writer, SubtitlesWriter):
+                writer.write_subtitles(subtitles, file)
+            else:
+                writer.finish(result, file, self.options)
+
+        if self.atomic:
+            for file in self.files:
+                file.close()
+
+            for path, output_path in zip(self.paths, self.output_paths):
+                os.replace(path, output_path)
+
+        self.finished = True
+        return self.output_paths
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for file in self.files:
+            file.close()
+
+        if not self.finished:
+            for path in self.paths[: len(self.files)]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+WRITERS = {
+    "txt": WriteTXT,
+    "vtt": WriteVTT,
+    "srt": WriteSRT,
+    "tsv": WriteTSV,
+    "json": WriteJSON,
+    "jsonl": WriteJSONL,
+}
+
+# JSON lines is not included in 'all' since it has the same content than JSON
+ALL_FORMATS = ["txt", "vtt", "srt", "tsv", "json"]
+
+
+def get_writers(output_format: str, output_dir: str) -> List[ResultWriter]:
+    output_formats = ALL_FORMATS if output_format == "all" else [output_format]
+    return [WRITERS[output_format](output_dir) for output_format in output_formats]
+
 
 def get_writer(
     output_format: str, output_dir: str
-) -> Callable[[dict, str, dict], None]:
-    writers = {
-        "txt": WriteTXT,
-        "vtt": WriteVTT,
-        "srt": WriteSRT,
-        "tsv": WriteTSV,
-        "json": WriteJSON,
-    }
-
+) -> Callable[[dict, str, dict], Union[str, List[str]]]:
     if output_format == "all":
-        all_writers = [writer(output_dir) for writer in writers.values()]
+        all_writers = get_writers(output_format, output_dir)
 
         def write_all(result: dict, file: str, options: dict):
-            for writer in all_writers:
-                writer(result, file, options)
+            with StreamingWriter(all_writers, file, options, atomic=True) as writer:
+                return writer.write_result(result)
 
         return write_all
 
-    return writers[output_format](output_dir)
+    return WRITERS[output_format](output_dir)
@@ -0,0 +1,138 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import warnings
+
+from unittest import mock
+
+import numpy as np
+
+from whisper_ctranslate2.autotune import (
+    AutoTuner,
+    get_cpu_info,
+    get_profile_defaults,
+    load_profile,
+    save_profile,
+)
+from whisper_ctranslate2.commandline import CommandLine
+
+
+def get_profile(**kwargs):
+    profile = dict(
+        get_cpu_info(),
+        model="small",
+        latency=dict(compute_type="int8", threads=8, workers=1, batch_size=8),
+        throughput=dict(compute_type="int8", threads=8, workers=4, batch_size=0),
+    )
+    profile.update(kwargs)
+    return profile
+
+
+class TestAutotune(unittest.TestCase):
+    def test_save_load_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            save_profile(get_profile(), path)
+            self.assertEqual(get_profile(), load_profile(path))
+
+    def test_get_profile_defaults(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            latency = get_profile_defaults(get_profile(), "latency", "small")
+            throughput = get_profile_defaults(get_profile(), "throughput", "small")
+
+        self.assertEqual(
+            dict(compute_type="int8", threads=8, workers=1, batched=True, batch_size=8),
+            latency,
+        )
+        self.assertEqual(
+            dict(
+                compute_type="int8",
+                threads=8,
+                workers=4,
+                batched=False,
+                batch_size=None,
+            ),
+            throughput,
+        )
+
+    def test_get_profile_defaults_other_host(self):
+        profile = get_profile(cpu_model="Other CPU")
+        with self.assertWarnsRegex(UserWarning, "Other CPU"):
+            get_profile_defaults(profile, "latency", "small")
+
+    def test_get_profile_defaults_other_model(self):
+        with self.assertWarnsRegex(UserWarning, "medium"):
+            get_profile_defaults(get_profile(), "latency", "medium")
+
+    def test_command_line_perf_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            save_profile(get_profile(), path)
+
+            args = CommandLine.read_command_line(["a.mp3", "--perf_profile", path])
+            self.assertEqual(8, args["batch_size"])
+            self.assertTrue(args["batched"])
+
+            args = CommandLine.read_command_line(
+                ["a.mp3", "b.mp3", "--perf_profile", path, "--workers", "2"]
+            )
+            self.assertEqual(2, args["workers"])
+            self.assertFalse(args["batched"])
+
+            args = CommandLine.read_command_line(
+                ["a.mp3", "--perf_profile", path, "--batched", "False"]
+            )
+            self.assertFalse(args["batched"])
+            self.assertIsNone(args["batch_size"])
+            self.assertEqual("int8", args["compute_type"])
+
+    def test_tune_without_supported_compute_types(self):
+        tuner = AutoTuner("small", None, True, "transcribe", "en", None)
+        with mock.patch(
+            "faster_whisper.audio.decode_audio", return_value=np.zeros(16000)
+        ), mock.patch(
+            "ctranslate2.get_supported_compute_types", return_value={"float16"}
+        ):
+            with self.assertRaisesRegex(RuntimeError, "is supported in this CPU"):
+                tuner.tune("a.mp3", "small")
+
+    def _get_command_line_error(self, path):
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(stderr):
+            CommandLine.read_command_line(["a.mp3", "--perf_profile", path])
+
+        return stderr.getvalue()
+
+    def test_command_line_perf_profile_not_found(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            error = self._get_command_line_error(path)
+
+        self.assertIn(f"Unable to read --perf_profile '{path}'", error)
+        self.assertNotIn("Traceback", error)
+
+    def test_command_line_perf_profile_incomplete(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            with open(path, "w") as f:
+                json.dump({}, f)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                error = self._get_command_line_error(path)
+
+            self.assertIn(f"--perf_profile '{path}' has no 'latency' setting", error)
+
+            with open(path, "w") as f:
+                f.write("{")
+
+            error = self._get_command_line_error(path)
+            self.assertIn(f"Unable to read --perf_profile '{path}'", error)
+
+
+if __name__ == "__main__":
+    unittest.main()
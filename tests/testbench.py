@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import sys
+import unittest
+
+from unittest import mock
+
+from whisper_ctranslate2.bench import get_configurations, main, write_csv, write_json
+
+
+class TestBench(unittest.TestCase):
+    def test_get_configurations(self):
+        configurations = get_configurations(
+            ["int8", "float32"], [2, 4], [5], [0, 8], [False], [False, True]
+        )
+
+        self.assertEqual(16, len(configurations))
+        self.assertEqual(
+            dict(
+                compute_type="int8",
+                threads=2,
+                beam_size=5,
+                batch_size=0,
+                vad_filter=False,
+                word_timestamps=False,
+            ),
+            configurations[0],
+        )
+
+    def test_write_csv(self):
+        results = [
+            dict(compute_type="int8", wall_time=2.0, stages={"encoder": 1.0}),
+            dict(compute_type="float16", error="ValueError: not supported"),
+        ]
+        output = io.StringIO()
+
+        write_csv(results, output)
+
+        self.assertEqual(
+            "compute_type,wall_time,stage_encoder,error\n"
+            "int8,2.0,1.0,\n"
+            "float16,,,ValueError: not supported\n",
+            output.getvalue(),
+        )
+
+    def test_write_json(self):
+        output = io.StringIO()
+
+        write_json({"cpu_count": 4}, [dict(compute_type="int8")], output)
+
+        data = json.loads(output.getvalue())
+        self.assertEqual(4, data["host"]["cpu_count"])
+        self.assertEqual("int8", data["results"][0]["compute_type"])
+
+    def test_audio_required(self):
+        stderr = io.StringIO()
+        with mock.patch.object(
+            sys, "argv", ["whisper-ctranslate2-bench"]
+        ), contextlib.redirect_stderr(stderr), self.assertRaises(SystemExit):
+            main()
+        self.assertIn("the following arguments are required: audio", stderr.getvalue())
+
+        stderr = io.StringIO()
+        with mock.patch.object(
+            sys, "argv", ["whisper-ctranslate2-bench", "missing"]
+        ), contextlib.redirect_stderr(stderr):
+            main()
+        self.assertEqual("'missing' does not exist\n", stderr.getvalue())
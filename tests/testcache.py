@@ -0,0 +1,315 @@
+import concurrent.futures
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from faster_whisper.audio import decode_audio
+
+from whisper_ctranslate2.cache import (
+    AudioCache,
+    DiarizationCache,
+    ResultCache,
+    hash_file,
+)
+from whisper_ctranslate2.rttm import Turn
+from whisper_ctranslate2.whisper_ctranslate2 import main, prepare_audio
+
+E2E_AUDIO = os.path.join(os.path.dirname(__file__), "..", "e2e-tests", "gossos.mp3")
+
+
+class TestResultCache(unittest.TestCase):
+    def _write_audio(self, directory, name, content):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(content)
+
+        return path
+
+    def test_hash_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = self._write_audio(directory, "a.mp3", b"audio")
+            second = self._write_audio(directory, "b.mp3", b"audio")
+            third = self._write_audio(directory, "c.mp3", b"other audio")
+
+            self.assertEqual(hash_file(first), hash_file(second))
+            self.assertNotEqual(hash_file(first), hash_file(third))
+
+    def test_hash_file_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            audio = self._write_audio(directory, "a.mp3", b"audio")
+            with mock.patch("builtins.open", wraps=open) as opened:
+                digest = hash_file(audio)
+                ResultCache(os.path.join(directory, "results"), 10).get_key(audio)
+                DiarizationCache(os.path.join(directory, "turns"), 2, "p").get_key(
+                    audio
+                )
+            self.assertEqual(1, opened.call_count)
+
+            # Hashed again once the file changes
+            self._write_audio(directory, "a.mp3", b"other audio")
+            os.utime(audio, ns=(0, 0))
+            self.assertNotEqual(digest, hash_file(audio))
+
+    def test_key_depends_on_settings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(os.path.join(directory, "cache"), 10)
+            audio = self._write_audio(directory, "a.mp3", b"audio")
+
+            key = cache.get_key(audio, model="small", task="transcribe")
+            self.assertEqual(
+                key, cache.get_key(audio, task="transcribe", model="small")
+            )
+            self.assertNotEqual(
+                key, cache.get_key(audio, model="small", task="translate")
+            )
+
+    def test_get_put(self):
+        result = {"text": "Hello", "segments": [], "language": "en"}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, 10)
+
+            self.assertIsNone(cache.get("key"))
+            cache.put("key", result)
+            self.assertEqual(result, cache.get("key"))
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(1, cache.misses)
+            self.assertEqual(["key.json"], os.listdir(directory))
+
+    def test_evict_least_recently_used(self):
+        result = {"text": "x" * 1000, "segments": [], "language": "en"}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, 0)
+            cache.size_limit.max_size = 2500
+
+            cache.put("first", result)
+            cache.put("second", result)
+            old = time.time() - 60
+            os.utime(os.path.join(directory, "second.json"), (old, old))
+            cache.put("third", result)
+
+            self.assertIsNotNone(cache.get("first"))
+            self.assertIsNone(cache.get("second"))
+            self.assertIsNotNone(cache.get("third"))
+
+    def test_remove_stale_temporary_files(self):
+        result = {"text": "Hello", "segments": [], "language": "en"}
+        with tempfile.TemporaryDirectory() as directory:
+            stale = os.path.join(directory, "stale.tmp")
+            writing = os.path.join(directory, "writing.tmp")
+            for path in [stale, writing]:
+                with open(path, "w") as f:
+                    f.write("partial")
+            old = time.time() - 2 * 3600
+            os.utime(stale, (old, old))
+
+            ResultCache(directory, 10).put("key", result)
+
+            self.assertFalse(os.path.exists(stale))
+            self.assertTrue(os.path.exists(writing))
+
+    def test_put_scans_directory_only_to_evict(self):
+        result = {"text": "x" * 1000, "segments": [], "language": "en"}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, 0)
+            cache.size_limit.max_size = 20000
+
+            with mock.patch(
+                "whisper_ctranslate2.cache.os.scandir", wraps=os.scandir
+            ) as scandir:
+                for i in range(30):
+                    cache.put(f"entry{i}", result)
+
+            # Scanned when the first entry is written and when the maximum is
+            # exceeded, instead of after every write
+            self.assertEqual(5, scandir.call_count)
+            self.assertLessEqual(cache.size_limit.size, cache.size_limit.max_size)
+            self.assertEqual(
+                cache.size_limit.size,
+                sum(
+                    os.path.getsize(os.path.join(directory, name))
+                    for name in os.listdir(directory)
+                ),
+            )
+
+    def test_get_read_only(self):
+        result = {"text": "Hello", "segments": [], "language": "en"}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, 10)
+            cache.put("key", result)
+
+            with mock.patch(
+                "whisper_ctranslate2.cache.os.utime", side_effect=PermissionError
+            ):
+                self.assertEqual(result, cache.get("key"))
+
+            self.assertEqual(1, cache.hits)
+
+    def test_not_used_with_server_url(self):
+        stderr = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            argv = [
+                "whisper-ctranslate2",
+                E2E_AUDIO,
+                "--server_url",
+                "http://127.0.0.1:1",
+                "--result_cache_dir",
+                directory,
+            ]
+            with mock.patch.object(sys, "argv", argv), contextlib.redirect_stderr(
+                stderr
+            ):
+                main()
+
+            self.assertEqual([], os.listdir(directory))
+
+        self.assertIn(
+            "--result_cache_dir cannot be used with --server_url", stderr.getvalue()
+        )
+
+
+class TestDiarizationCache(unittest.TestCase):
+    def test_get_put(self):
+        turns = [Turn(0.5, 2.25, "SPEAKER_00"), Turn(1.75, 7.1, "SPEAKER_01")]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiarizationCache(directory, 2, "pipeline")
+            key = cache.get_key(E2E_AUDIO)
+
+            self.assertIsNone(cache.get(key))
+            cache.put(key, turns)
+            self.assertEqual(turns, cache.get(key))
+            self.assertEqual([key + ".rttm"], os.listdir(directory))
+
+            cache.put(key, [])
+            self.assertEqual([], cache.get(key))
+
+    def test_speech_chunks(self):
+        turns = [Turn(0.5, 2.25, "SPEAKER_00")]
+        speech_chunks = [{"start": 8000, "end": 36000}]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiarizationCache(directory, 2, "pipeline", {})
+            key = cache.get_key(E2E_AUDIO)
+
+            cache.put(key, turns, speech_chunks)
+            self.assertEqual((turns, speech_chunks), cache.get_entry(key))
+            self.assertEqual(turns, cache.get(key))
+
+            cache.put(key, turns)
+            self.assertEqual((turns, None), cache.get_entry(key))
+
+    def test_key_depends_on_speakers_and_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            key = DiarizationCache(directory, 2, "pipeline").get_key(E2E_AUDIO)
+
+            self.assertEqual(
+                key, DiarizationCache(directory, 2, "pipeline").get_key(E2E_AUDIO)
+            )
+            self.assertNotEqual(
+                key, DiarizationCache(directory, 3, "pipeline").get_key(E2E_AUDIO)
+            )
+            self.assertNotEqual(
+                key, DiarizationCache(directory, 2, "other").get_key(E2E_AUDIO)
+            )
+            self.assertNotEqual(
+                key,
+                DiarizationCache(directory, 2, "pipeline", {}).get_key(E2E_AUDIO),
+            )
+
+
+class TestAudioCache(unittest.TestCase):
+    def test_load(self):
+        expected = decode_audio(E2E_AUDIO)
+
+        for dtype in ["float32", "int16"]:
+            with tempfile.TemporaryDirectory() as directory:
+                cache = AudioCache(directory, dtype)
+
+                first = cache.load(E2E_AUDIO)
+                second = cache.load(E2E_AUDIO)
+
+                self.assertEqual(1, cache.misses)
+                self.assertEqual(1, cache.hits)
+                self.assertEqual(np.float32, second.dtype)
+                np.testing.assert_array_equal(expected, first)
+                np.testing.assert_array_equal(expected, second)
+
+    def test_load_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AudioCache(directory)
+            cache.load(E2E_AUDIO)
+
+            audio = cache.load(E2E_AUDIO)
+            audio[0] = 1
+
+            self.assertIsInstance(audio, np.memmap)
+            self.assertNotEqual(1, cache.load(E2E_AUDIO)[0])
+
+    def test_prepare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AudioCache(directory, "int16")
+
+            self.assertTrue(cache.prepare(E2E_AUDIO))
+            self.assertFalse(cache.prepare(E2E_AUDIO))
+            self.assertEqual(1, len(os.listdir(directory)))
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AudioCache(directory, "int16", 1)
+            old = time.time() - 60
+            for name in ["first.npy", "second.npy"]:
+                with open(os.path.join(directory, name), "wb") as f:
+                    f.write(b"0" * 300 * 1024)
+                os.utime(os.path.join(directory, name), (old, old))
+
+            # 1 MB with the entry of 1 MB, then the others are removed
+            cache.load(E2E_AUDIO)
+            self.assertEqual(1, len(os.listdir(directory)))
+
+    def test_prepare_audio(self):
+        executor_workers = []
+        finished = []
+        pending = []
+
+        class FakeExecutor(concurrent.futures.ThreadPoolExecutor):
+            def __init__(self, max_workers=None):
+                executor_workers.append(max_workers)
+                super().__init__(max_workers)
+
+        def prepare_audio_file(directory, dtype, audio_path):
+            time.sleep(0.01)
+            finished.append(audio_path)
+            if audio_path == "bad.mp3":
+                raise ValueError("Invalid data")
+            return 1024
+
+        def audio():
+            for i in range(20):
+                # Files pulled from the input and not decoded yet
+                pending.append(i - len(finished))
+                yield "bad.mp3" if i == 5 else f"{i}.mp3"
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch(
+            "concurrent.futures.ProcessPoolExecutor", FakeExecutor
+        ), mock.patch(
+            "whisper_ctranslate2.whisper_ctranslate2.prepare_audio_file",
+            prepare_audio_file,
+        ):
+            cache = AudioCache(directory, max_size_mb=1)
+            with mock.patch.object(cache, "add_size") as add_size:
+                prepare_audio(audio(), cache, 2, False)
+
+        self.assertEqual([2], executor_workers)
+        self.assertEqual(20, len(finished))
+        self.assertEqual(19, add_size.call_count)
+        self.assertLessEqual(max(pending), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,29 @@
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
 import unittest
 
-from whisper_ctranslate2.diarization import Diarization
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from faster_whisper.audio import decode_audio
+
+from whisper_ctranslate2.diarization import (
+    Diarization,
+    SharedAudio,
+    Turn,
+    restore_turn_timestamps,
+)
+from whisper_ctranslate2.whisper_ctranslate2 import main
+
+E2E_AUDIO = os.path.join(os.path.dirname(__file__), "..", "e2e-tests", "gossos.mp3")
 
 
 class TestDiarization(unittest.TestCase):
@@ -64,6 +87,408 @@ class TestDiarization(unittest.TestCase):
 
         self.assertEqual("PARLANT_00", segment["speaker"])
 
+    def test_assign_speakers_from_turns(self):
+        turns = [Turn(1, 5, "SPEAKER_00"), Turn(5, 7, "SPEAKER_01")]
+
+        segment = {"start": 4, "end": 10}
+        segments = [segment]
+
+        Diarization().assign_speakers_to_segments(turns, {"segments": segments}, None)
+
+        self.assertEqual("SPEAKER_01", segment["speaker"])
+
+    def test_tie_uses_first_overlapping_turn(self):
+        turns = [
+            Turn(6, 8, "SPEAKER_01"),
+            Turn(0, 2, "SPEAKER_00"),
+            Turn(20, 30, "SPEAKER_02"),
+        ]
+
+        segment = {"start": 0, "end": 10}
+        segments = [segment, {"start": 40, "end": 50}]
+
+        Diarization().assign_speakers_to_segments(turns, {"segments": segments}, None)
+
+        self.assertEqual("SPEAKER_01", segment["speaker"])
+        self.assertNotIn("speaker", segments[1])
+
+    def test_assign_speakers_to_words(self):
+        turns = [Turn(0, 3, "SPEAKER_00"), Turn(3, 10, "SPEAKER_01")]
+
+        words = [
+            {"start": 0, "end": 1, "word": " Hello"},
+            {"start": 1, "end": 2.5, "word": " there."},
+            {"start": 3.2, "end": 4, "word": " Hi"},
+            {"start": 4, "end": 4.5, "word": " you."},
+        ]
+        segments = [
+            {"id": 1, "start": 0, "end": 5, "tokens": [1, 2], "words": words},
+            {"id": 2, "start": 6, "end": 7, "tokens": [3], "words": None},
+        ]
+        result = Diarization().assign_speakers_to_words(
+            turns, {"segments": segments}, None
+        )
+        segments = result["segments"]
+
+        self.assertEqual([1, 2, 3], [segment["id"] for segment in segments])
+        self.assertEqual(
+            ["SPEAKER_00", "SPEAKER_01", "SPEAKER_01"],
+            [segment["speaker"] for segment in segments],
+        )
+        self.assertEqual([0, 3.2, 6], [segment["start"] for segment in segments])
+        self.assertEqual([2.5, 5, 7], [segment["end"] for segment in segments])
+        self.assertEqual(" Hello there.", segments[0]["text"])
+        self.assertEqual(" Hi you.", segments[1]["text"])
+        self.assertEqual([[1, 2], [], [3]], [s["tokens"] for s in segments])
+        self.assertEqual(
+            ["SPEAKER_00", "SPEAKER_00", "SPEAKER_01", "SPEAKER_01"],
+            [word["speaker"] for word in words],
+        )
+
+    def test_same_speakers_as_intersecting_all_turns(self):
+        for seed in range(50):
+            rng = random.Random(seed)
+            turns = []
+            for _ in range(rng.randint(0, 40)):
+                start = rng.uniform(0, 60)
+                speaker = f"SPEAKER_0{rng.randrange(4)}"
+                turns.append(Turn(start, start + rng.uniform(-1, 10), speaker))
+
+            segments = []
+            for _ in range(rng.randint(0, 40)):
+                start = rng.randint(0, 60)
+                segments.append({"start": start, "end": start + rng.randint(0, 8)})
+
+            expected = [_get_speaker_by_intersecting_all(turns, s) for s in segments]
+            Diarization().assign_speakers_to_segments(
+                turns, {"segments": segments}, None
+            )
+
+            self.assertEqual(expected, [s.get("speaker") for s in segments])
+
+    def test_assign_speakers_performance(self):
+        # A long meeting: 100k segments and 20k turns
+        rng = random.Random(0)
+        turns = []
+        for i in range(20000):
+            # Turns cover the whole meeting with some overlaps
+            start = i * 1.08
+            turns.append(Turn(start, start + rng.uniform(1.08, 3), f"SPEAKER_0{i % 8}"))
+
+        segments = []
+        for i in range(100000):
+            start = i * 0.216
+            segments.append({"start": start, "end": start + rng.uniform(0.2, 5)})
+
+        start_time = time.perf_counter()
+        Diarization().assign_speakers_to_segments(turns, {"segments": segments}, None)
+        elapsed = time.perf_counter() - start_time
+
+        self.assertTrue(all("speaker" in segment for segment in segments))
+        # Intersecting every segment with every turn took more than 30 seconds
+        self.assertLess(elapsed, 5)
+
+    def test_assign_speakers_spanning_turn(self):
+        # A turn that spans the whole meeting overlaps every segment and turn
+        rng = random.Random(0)
+        turns = [Turn(0, 5000, "SPEAKER_09")]
+        for i in range(4000):
+            start = i * 1.2
+            turns.append(Turn(start, start + rng.uniform(0.5, 3), f"SPEAKER_0{i % 8}"))
+
+        segments = []
+        for i in range(20000):
+            start = i * 0.24
+            segments.append({"start": start, "end": start + rng.uniform(0.2, 5)})
+
+        tracemalloc.start()
+        try:
+            Diarization().assign_speakers_to_segments(
+                turns, {"segments": segments}, None
+            )
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # Pairing every segment with every turn used more than 2 GB
+        self.assertLess(peak, 200 * 1024 * 1024)
+        for segment in segments[::500]:
+            self.assertEqual(
+                _get_speaker_by_intersecting_all(turns, segment), segment["speaker"]
+            )
+
+
+def _get_speaker_by_intersecting_all(turns, segment):
+    speakers = {}
+    for turn in turns:
+        intersection = min(turn.end, segment["end"]) - max(turn.start, segment["start"])
+        if intersection > 0:
+            speakers[turn.speaker] = speakers.get(turn.speaker, 0) + intersection
+
+    if not speakers:
+        return None
+
+    return sorted(speakers.items(), key=lambda x: x[1], reverse=True)[0][0]
+
+
+class TestDiarizationModel(unittest.TestCase):
+    def _get_pipeline(self):
+        pipeline = mock.MagicMock()
+        pipeline.from_pretrained.return_value.to.return_value.return_value = (
+            SimpleNamespace(speaker_diarization=[(Turn(0, 1, None), "SPEAKER_00")])
+        )
+        return pipeline
+
+    def test_model_loaded_once(self):
+        pipeline = self._get_pipeline()
+        with mock.patch(
+            "whisper_ctranslate2.diarization.Pipeline", pipeline, create=True
+        ), mock.patch("whisper_ctranslate2.diarization.torch", create=True):
+            diarization = Diarization()
+            for _ in range(3):
+                turns = diarization.run_model(np.zeros(16000, dtype=np.float32))
+
+            self.assertEqual([Turn(0, 1, "SPEAKER_00")], turns)
+            self.assertEqual(1, pipeline.from_pretrained.call_count)
+
+            diarization.unload_model()
+            self.assertIsNone(diarization.model)
+            diarization.unload_model()
+
+            diarization.run_model(np.zeros(16000, dtype=np.float32))
+            self.assertEqual(2, pipeline.from_pretrained.call_count)
+
+    def test_run_model_speech_chunks(self):
+        pipeline = self._get_pipeline()
+        model = pipeline.from_pretrained.return_value.to.return_value
+        audio = np.arange(10 * 16000, dtype=np.float32)
+        speech_chunks = [{"start": 16000, "end": 24000}, {"start": 64000, "end": 72000}]
+        with mock.patch(
+            "whisper_ctranslate2.diarization.Pipeline", pipeline, create=True
+        ), mock.patch("whisper_ctranslate2.diarization.torch", create=True) as torch:
+            torch.from_numpy = lambda array: array
+            turns = Diarization().run_model(audio, speech_chunks)
+
+            waveform = model.call_args[0][0]["waveform"][0]
+            np.testing.assert_array_equal(
+                np.concatenate([audio[16000:24000], audio[64000:72000]]), waveform
+            )
+            # The turn of the first second of speech spans both chunks
+            self.assertEqual(
+                [Turn(1.0, 1.5, "SPEAKER_00"), Turn(4.0, 4.5, "SPEAKER_00")], turns
+            )
+
+            self.assertEqual([], Diarization().run_model(audio, []))
+            self.assertEqual(1, model.call_count)
+
+    def test_restore_turn_timestamps(self):
+        speech_chunks = [
+            {"start": 16000, "end": 48000},
+            {"start": 80000, "end": 96000},
+            {"start": 160000, "end": 176000},
+        ]
+        turns = [
+            Turn(0.5, 1.5, "A"),
+            Turn(1.5, 3.5, "B"),
+            Turn(3.5, 4.0, "A"),
+        ]
+
+        self.assertEqual(
+            [
+                Turn(1.5, 2.5, "A"),
+                Turn(2.5, 3.0, "B"),
+                Turn(5.0, 6.0, "B"),
+                Turn(10.0, 10.5, "B"),
+                Turn(10.5, 11.0, "A"),
+            ],
+            restore_turn_timestamps(turns, speech_chunks),
+        )
+
+
+class TestSharedAudio(unittest.TestCase):
+    def test_shared_audio(self):
+        shared = SharedAudio(E2E_AUDIO)
+        filename = shared.filename
+
+        try:
+            audio = SharedAudio.open(filename)
+            np.testing.assert_array_equal(decode_audio(E2E_AUDIO), shared.audio)
+            np.testing.assert_array_equal(shared.audio, audio)
+        finally:
+            shared.release()
+
+        self.assertFalse(os.path.exists(filename))
+        self.assertIsNone(shared.audio)
+
+    def test_released_on_interrupt(self):
+        created = []
+
+        class TrackedSharedAudio(SharedAudio):
+            def __init__(self, audio_path):
+                super().__init__(audio_path)
+                created.append(self.filename)
+
+        class FakeDiarizationProcess:
+            def __init__(self, **kwargs):
+                pass
+
+            def submit(self, audio_path, audio_file=None):
+                pass
+
+        class FakeTranscribe:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def inference(self, audio, *args):
+                raise KeyboardInterrupt()
+
+        argv = [
+            "whisper-ctranslate2",
+            *[E2E_AUDIO] * 3,
+            "--hf_token",
+            "token",
+            "--concurrent_diarization",
+            "True",
+            "--prefetch",
+            "2",
+        ]
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch(
+            "whisper_ctranslate2.transcribe.Transcribe", FakeTranscribe
+        ), mock.patch(
+            "whisper_ctranslate2.diarization.DiarizationProcess",
+            FakeDiarizationProcess,
+        ), mock.patch(
+            "whisper_ctranslate2.diarization.SharedAudio", TrackedSharedAudio
+        ), mock.patch.object(
+            sys, "argv", argv + ["--output_dir", output_dir]
+        ), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                main()
+
+        # The files decoded ahead are removed although they were never transcribed
+        self.assertEqual(3, len(created))
+        self.assertFalse(any(os.path.exists(filename) for filename in created))
+
+
+class TestDiarizationOrder(unittest.TestCase):
+    def _run(self, device, cuda_devices=0, args=()):
+        events = []
+
+        def decode_audio(audio_path):
+            events.append("decode")
+            return np.zeros(16000, dtype=np.float32)
+
+        class FakeTranscribe:
+            def __init__(self, *args, **kwargs):
+                events.append("transcription model")
+
+            def inference(self, audio, *args):
+                # Last argument are the speech chunks of the diarization VAD
+                events.append("transcribe" if args[-1] is None else "transcribe speech")
+                segment = dict(id=1, start=0.0, end=1.0, text=" Hola.")
+                return dict(text=" Hola.", segments=[segment], language="ca")
+
+        def run_model(self, audio, speech_chunks=None):
+            events.append("diarize")
+            return [Turn(0, 1, "SPEAKER_00")]
+
+        def get_speech_chunks(audio, vad_parameters):
+            events.append("vad")
+            return [{"start": 0, "end": 16000}]
+
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch(
+            "whisper_ctranslate2.transcribe.Transcribe", FakeTranscribe
+        ), mock.patch.object(Diarization, "run_model", run_model), mock.patch.object(
+            Diarization, "unload_model"
+        ), mock.patch.object(
+            Diarization, "set_threads"
+        ), mock.patch(
+            "ctranslate2.get_cuda_device_count", return_value=cuda_devices
+        ), mock.patch(
+            "whisper_ctranslate2.whisper_ctranslate2.decode_audio", decode_audio
+        ), mock.patch(
+            "whisper_ctranslate2.diarization.get_speech_chunks", get_speech_chunks
+        ), mock.patch.object(
+            sys,
+            "argv",
+            [
+                "whisper-ctranslate2",
+                E2E_AUDIO,
+                E2E_AUDIO,
+                "--output_dir",
+                output_dir,
+                "--hf_token",
+                "token",
+                "--device",
+                device,
+                *args,
+            ],
+        ), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            main()
+
+        return events
+
+    def test_cuda_device_diarizes_before_transcribing(self):
+        # CTranslate2 uses CUDA, then torch cannot run after it
+        self.assertEqual(
+            [
+                "decode",
+                "diarize",
+                "decode",
+                "diarize",
+                "transcription model",
+                "transcribe",
+                "transcribe",
+            ],
+            self._run("auto", cuda_devices=1),
+        )
+
+    def test_cpu_device_diarizes_inline(self):
+        # Each file is decoded once for the transcription and the diarization
+        inline = [
+            "transcription model",
+            "decode",
+            "transcribe",
+            "diarize",
+            "decode",
+            "transcribe",
+            "diarize",
+        ]
+        self.assertEqual(inline, self._run("cpu"))
+        self.assertEqual(inline, self._run("auto"))
+
+    def test_cached_speech_chunks(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            args = [
+                "--diarization_vad",
+                "True",
+                "--vad_filter",
+                "True",
+                "--diarization_cache_dir",
+                cache_dir,
+            ]
+            # The second file has the same content, the speaker turns and the
+            # speech chunks come from the cache and the VAD does not run again
+            self.assertEqual(
+                [
+                    "decode",
+                    "vad",
+                    "diarize",
+                    "transcription model",
+                    "transcribe speech",
+                    "transcribe speech",
+                ],
+                self._run("cuda", cuda_devices=1, args=args),
+            )
+            self.assertEqual(
+                ["transcription model", "transcribe speech", "transcribe speech"],
+                self._run("cuda", cuda_devices=1, args=args),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from whisper_ctranslate2.inputs import iterate_audio_files, shard
+
+
+class TestInputs(unittest.TestCase):
+    def _touch(self, *paths):
+        for path in paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._touch(
+                os.path.join(directory, "b.mp3"),
+                os.path.join(directory, "a.WAV"),
+                os.path.join(directory, "notes.txt"),
+                os.path.join(directory, "sub", "c.mp3"),
+            )
+
+            files = list(iterate_audio_files([directory]))
+
+            self.assertEqual(
+                [
+                    os.path.join(directory, "a.WAV"),
+                    os.path.join(directory, "b.mp3"),
+                    os.path.join(directory, "sub", "c.mp3"),
+                ],
+                files,
+            )
+
+    def test_directory_extensions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._touch(
+                os.path.join(directory, "a.wav"), os.path.join(directory, "b.mp3")
+            )
+
+            files = list(iterate_audio_files([directory], extensions=["mp3"]))
+
+            self.assertEqual([os.path.join(directory, "b.mp3")], files)
+
+    def test_input_list(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_list = os.path.join(directory, "list.txt")
+            with open(input_list, "w") as f:
+                f.write("first.mp3\n\n  second.mp3\n")
+
+            files = list(iterate_audio_files(["arg.mp3"], input_list))
+
+            self.assertEqual(["arg.mp3", "first.mp3", "second.mp3"], files)
+
+    def test_shard(self):
+        paths = [f"{i}.mp3" for i in range(7)]
+
+        shards = [list(shard(iter(paths), index, 3)) for index in range(3)]
+
+        self.assertEqual(["0.mp3", "3.mp3", "6.mp3"], shards[0])
+        self.assertEqual(["1.mp3", "4.mp3"], shards[1])
+        self.assertEqual(paths, sorted(sum(shards, [])))
+
+
+if __name__ == "__main__":
+    unittest.main()
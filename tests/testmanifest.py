@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from whisper_ctranslate2.manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    def _write_output(self, directory, name):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write("text")
+
+        return path
+
+    def test_completed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = self._write_output(directory, "a.txt")
+            Manifest(directory, "fingerprint", 2).record_done("a.mp3", [output])
+
+            manifest = Manifest(directory, "fingerprint", 2)
+            self.assertTrue(manifest.is_completed("a.mp3"))
+            self.assertFalse(manifest.is_completed("b.mp3"))
+
+    def test_completed_different_fingerprint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = self._write_output(directory, "a.txt")
+            Manifest(directory, "fingerprint", 2).record_done("a.mp3", [output])
+
+            manifest = Manifest(directory, "other", 2)
+            self.assertFalse(manifest.is_completed("a.mp3"))
+
+    def test_completed_missing_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = self._write_output(directory, "a.txt")
+            Manifest(directory, "fingerprint", 2).record_done("a.mp3", [output])
+            os.remove(output)
+
+            manifest = Manifest(directory, "fingerprint", 2)
+            self.assertFalse(manifest.is_completed("a.mp3"))
+
+    def test_retries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = Manifest(directory, "fingerprint", 1)
+            manifest.record_failed("a.mp3", "error")
+            self.assertFalse(
+                Manifest(directory, "fingerprint", 1).has_exhausted_retries("a.mp3")
+            )
+
+            manifest.record_failed("a.mp3", "error")
+            self.assertTrue(
+                Manifest(directory, "fingerprint", 1).has_exhausted_retries("a.mp3")
+            )
+
+    def test_incomplete_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = self._write_output(directory, "a.txt")
+            Manifest(directory, "fingerprint", 2).record_done("a.mp3", [output])
+            with open(os.path.join(directory, Manifest.filename), "a") as f:
+                f.write('{"audio": "b.mp3", "sta')
+
+            manifest = Manifest(directory, "fingerprint", 2)
+            self.assertTrue(manifest.is_completed("a.mp3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
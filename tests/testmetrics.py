@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from whisper_ctranslate2.metrics import (
+    FileMetrics,
+    RunSummary,
+    collect_metrics,
+    get_current_metrics,
+    measure,
+    timed,
+)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_measure_without_collecting(self):
+        with measure("encoder"):
+            pass
+
+        self.assertIsNone(get_current_metrics())
+
+    def test_nested_stages(self):
+        encode = timed(lambda: time.sleep(0.05), "encoder")
+
+        def detect_language():
+            time.sleep(0.05)
+            encode()
+
+        with collect_metrics() as metrics:
+            timed(detect_language, "language_detection")()
+            encode()
+
+        self.assertEqual({"language_detection", "encoder"}, set(metrics.stages))
+        self.assertGreaterEqual(metrics.stages["encoder"], 0.1)
+        self.assertLess(metrics.stages["language_detection"], 0.1)
+        self.assertGreaterEqual(metrics.total_time, sum(metrics.stages.values()) - 1e-6)
+
+    def test_as_dict(self):
+        with collect_metrics() as metrics:
+            metrics.audio_duration = 10.0
+            with measure("decoder"):
+                pass
+
+        result = metrics.as_dict()
+        self.assertEqual(10.0, result["audio_duration"])
+        self.assertIn("decoder", result["stages"])
+        self.assertAlmostEqual(
+            result["total_time"] / 10.0, result["real_time_factor"], places=6
+        )
+
+    def test_run_summary(self):
+        summary = RunSummary()
+        for duration, total_time in [(10.0, 1.0), (20.0, 4.0), (30.0, 3.0)]:
+            metrics = FileMetrics()
+            metrics.audio_duration = duration
+            metrics.total_time = total_time
+            metrics.stages = {"encoder": total_time}
+            summary.add(metrics)
+
+        text = summary.get_summary()
+        self.assertIn("Files processed: 3", text)
+        self.assertIn("Total audio: 0.017 hours", text)
+        self.assertIn("p50 0.100, p95 0.200", text)
+        self.assertIn("encoder: 8.00 s", text)
@@ -0,0 +1,156 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+from whisper_ctranslate2.rttm import (
+    Turn,
+    find_duplicate_file_id,
+    get_file_id,
+    read_rttm,
+    write_rttm,
+)
+from whisper_ctranslate2.whisper_ctranslate2 import main
+
+
+class TestRttm(unittest.TestCase):
+    def test_write_read(self):
+        turns = [Turn(0.5, 2.25, "SPEAKER_00"), Turn(1.75, 7.125, "SPEAKER_01")]
+        f = io.StringIO()
+        write_rttm(turns, "meeting", f)
+
+        self.assertEqual(
+            "SPEAKER meeting 1 0.5 1.75 <NA> <NA> SPEAKER_00 <NA> <NA>\n",
+            f.getvalue().splitlines(True)[0],
+        )
+        f.seek(0)
+        self.assertEqual({"meeting": turns}, read_rttm(f))
+
+    def test_read_several_files(self):
+        rttm = (
+            ";; comment\n"
+            "SPEAKER a 1 0.000 1.500 <NA> <NA> spk1 <NA> <NA>\n"
+            "\n"
+            "SPEAKER b 1 2.000 1.000 <NA> <NA> spk2 <NA> <NA>\n"
+            "SPEAKER a 1 3.000 0.500 <NA> <NA> spk2 <NA> <NA>\n"
+        )
+
+        turns = read_rttm(io.StringIO(rttm))
+
+        self.assertEqual([Turn(0.0, 1.5, "spk1"), Turn(3.0, 3.5, "spk2")], turns["a"])
+        self.assertEqual([Turn(2.0, 3.0, "spk2")], turns["b"])
+
+    def test_read_invalid_line(self):
+        with self.assertRaises(ValueError):
+            read_rttm(io.StringIO("SPEAKER a 1 zero 1.500\n"))
+
+    def test_get_file_id(self):
+        self.assertEqual("meeting", get_file_id("/data/meeting.mp3"))
+        self.assertEqual("stdin", get_file_id("-"))
+
+    def test_find_duplicate_file_id(self):
+        self.assertIsNone(find_duplicate_file_id(["a/talk.mp3", "a/other.mp3"]))
+        # The same file given twice
+        self.assertIsNone(find_duplicate_file_id(["a/talk.mp3", "a/../a/talk.mp3"]))
+        self.assertEqual(
+            ("a/talk.mp3", "b/talk.wav"),
+            find_duplicate_file_id(["a/talk.mp3", "c/x.mp3", "b/talk.wav"]),
+        )
+
+
+# Transcribes with a fake model in a new interpreter to see what main imports
+RTTM_MAIN = """
+import sys
+from unittest import mock
+
+from whisper_ctranslate2.whisper_ctranslate2 import main
+
+
+class FakeTranscribe:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def inference(self, audio, *args):
+        segments = [
+            dict(id=1, start=0.0, end=2.0, text=" Hola."),
+            dict(id=2, start=2.0, end=4.0, text=" Adeu."),
+        ]
+        return dict(text=" Hola. Adeu.", segments=segments, language="ca")
+
+
+sys.argv = ["whisper-ctranslate2", *sys.argv[1:]]
+with mock.patch("whisper_ctranslate2.transcribe.Transcribe", FakeTranscribe):
+    main()
+print("Imported: " + ",".join(m for m in ["torch", "pyannote"] if m in sys.modules))
+"""
+
+
+class TestRttmMain(unittest.TestCase):
+    def test_duplicate_file_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name in ["a", "b"]:
+                os.makedirs(os.path.join(directory, name))
+                paths.append(os.path.join(directory, name, "talk.mp3"))
+                open(paths[-1], "w").close()
+            rttm_input = os.path.join(directory, "turns.rttm")
+            with open(rttm_input, "w") as f:
+                write_rttm([Turn(0.0, 2.0, "SPEAKER_00")], "talk", f)
+
+            argv = ["whisper-ctranslate2", directory, "--rttm_input", rttm_input]
+            stderr = io.StringIO()
+            with mock.patch.object(sys, "argv", argv), contextlib.redirect_stderr(
+                stderr
+            ), contextlib.redirect_stdout(io.StringIO()):
+                main()
+
+        self.assertIn("--rttm_input cannot tell apart", stderr.getvalue())
+        self.assertIn("both are 'talk'", stderr.getvalue())
+
+    def test_rttm_input_without_pyannote(self):
+        audio = os.path.join(os.path.dirname(__file__), "..", "e2e-tests", "gossos.mp3")
+        with tempfile.TemporaryDirectory() as directory:
+            rttm_input = os.path.join(directory, "turns.rttm")
+            with open(rttm_input, "w") as f:
+                write_rttm(
+                    [Turn(0.0, 2.0, "SPEAKER_00"), Turn(2.0, 4.0, "SPEAKER_01")],
+                    "gossos",
+                    f,
+                )
+
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    RTTM_MAIN,
+                    audio,
+                    "--rttm_input",
+                    rttm_input,
+                    "--output_dir",
+                    directory,
+                    "--output_format",
+                    "json",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+
+            with open(os.path.join(directory, "gossos.json")) as f:
+                segments = json.load(f)["segments"]
+
+        self.assertEqual(
+            ["SPEAKER_00", "SPEAKER_01"], [segment["speaker"] for segment in segments]
+        )
+        self.assertNotIn("Unable to import", process.stdout)
+        self.assertEqual("Imported:", process.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+from whisper_ctranslate2.scheduling import (
+    EtaEstimator,
+    get_duration,
+    get_durations,
+    sort_longest_first,
+)
+from whisper_ctranslate2.whisper_ctranslate2 import main
+
+E2E_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "e2e-tests")
+
+
+class TestScheduling(unittest.TestCase):
+    def test_get_duration(self):
+        duration = get_duration(os.path.join(E2E_DIRECTORY, "gossos.mp3"))
+        self.assertAlmostEqual(32.3, duration, places=1)
+
+    def test_get_duration_not_found(self):
+        self.assertEqual(0, get_duration("does-not-exist.mp3"))
+
+    def test_sort_longest_first(self):
+        audio = [
+            os.path.join(E2E_DIRECTORY, "gossos.mp3"),
+            os.path.join(E2E_DIRECTORY, "dosparlants.mp3"),
+            "does-not-exist.mp3",
+        ]
+
+        sorted_audio = sort_longest_first(audio, get_durations(audio))
+
+        self.assertEqual([audio[1], audio[0], audio[2]], sorted_audio)
+
+    def test_eta(self):
+        estimator = EtaEstimator(100)
+        message = estimator.update(50)
+
+        self.assertIn("Processed 0:00:50 of 0:01:40 of audio", message)
+        self.assertIn("estimated completion at", message)
+
+
+class FakeTranscribe:
+    transcribed = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def inference(self, audio, task, language, verbose, live, options, *args):
+        FakeTranscribe.transcribed.append(os.path.basename(audio))
+        segment = dict(id=1, start=0.0, end=1.0, text=" Hola.")
+        return dict(text=" Hola.", segments=[segment], language="ca")
+
+
+class TestSchedulingMain(unittest.TestCase):
+    def test_sort_by_duration_and_show_eta(self):
+        FakeTranscribe.transcribed = []
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch(
+            "whisper_ctranslate2.transcribe.Transcribe", FakeTranscribe
+        ), mock.patch.object(
+            sys,
+            "argv",
+            [
+                "whisper-ctranslate2",
+                os.path.join(E2E_DIRECTORY, "gossos.mp3"),
+                os.path.join(E2E_DIRECTORY, "dosparlants.mp3"),
+                "--output_dir",
+                output_dir,
+                "--output_format",
+                "txt",
+                "--sort_by_duration",
+                "True",
+                "--show_eta",
+                "True",
+            ],
+        ), contextlib.redirect_stdout(
+            io.StringIO()
+        ) as stdout:
+            main()
+
+            self.assertEqual(
+                ["dosparlants.txt", "gossos.txt"], sorted(os.listdir(output_dir))
+            )
+
+        self.assertEqual(["dosparlants.mp3", "gossos.mp3"], FakeTranscribe.transcribed)
+        self.assertEqual(2, stdout.getvalue().count("estimated completion at"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from whisper_ctranslate2.server import Client, Server
+
+
+class FakeTranscribe:
+    def __init__(self):
+        self.calls = []
+
+    def inference(self, audio, task, language, verbose, live, options):
+        self.calls.append((audio, task, language))
+        return {
+            "text": " Hello",
+            "segments": [{"start": 0.0, "end": 1.5, "text": " Hello"}],
+            "language": language or "en",
+        }
+
+
+class TestServer(unittest.TestCase):
+    def _start(self, socket_path=None):
+        transcribe = FakeTranscribe()
+        server = Server(transcribe, "transcribe", None, None, {}, 1, 1, False)
+        httpd = server.create_http_server("127.0.0.1", 0, socket_path)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        return transcribe, httpd
+
+    def test_client_file(self):
+        transcribe, httpd = self._start()
+        url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+            f.write(b"audio")
+        self.addCleanup(os.remove, f.name)
+
+        result = Client(url).inference(f.name, "translate", "ca", False, False, None)
+
+        self.assertEqual(" Hello", result["text"])
+        self.assertEqual("ca", result["language"])
+        audio, task, language = transcribe.calls[0]
+        self.assertEqual(b"audio", audio.read())
+        self.assertEqual("translate", task)
+        self.assertEqual("ca", language)
+
+    def test_client_pcm(self):
+        transcribe, httpd = self._start()
+        url = f"http://127.0.0.1:{httpd.server_address[1]}"
+        pcm = np.array([0.5, -0.5], dtype=np.float32)
+
+        Client(url).inference(pcm, "transcribe", None, False, False, None)
+
+        audio, task, language = transcribe.calls[0]
+        np.testing.assert_array_equal(pcm, audio)
+        self.assertIsNone(language)
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires Unix sockets")
+    def test_client_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = os.path.join(directory, "server.sock")
+            self._start(socket_path)
+            pcm = np.zeros(16, dtype=np.float32)
+
+            result = Client(f"unix://{socket_path}").inference(
+                pcm, "transcribe", None, False, False, None
+            )
+
+            self.assertEqual(" Hello", result["text"])
+
+    def _post(self, httpd, path, body, headers):
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1])
+        self.addCleanup(connection.close)
+        connection.putrequest("POST", path)
+        for header, value in headers.items():
+            connection.putheader(header, value)
+        connection.endheaders(body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_invalid_requests(self):
+        transcribe, httpd = self._start()
+
+        status, data = self._post(
+            httpd, "/transcribe", b"audio", {"Content-Length": "five"}
+        )
+        self.assertEqual(400, status)
+        self.assertEqual("Invalid Content-Length", data["error"])
+
+        status, data = self._post(
+            httpd,
+            "/transcribe?audio_format=f32le",
+            b"12345",
+            {"Content-Length": "5"},
+        )
+        self.assertEqual(400, status)
+        self.assertIn("whole number of samples", data["error"])
+        self.assertEqual([], transcribe.calls)
+
+    def test_render(self):
+        server = Server(FakeTranscribe(), "transcribe", None, None, {}, 1, 1, False)
+        result = FakeTranscribe().inference(None, "transcribe", None, False, True, None)
+
+        self.assertEqual(
+            "1\n00:00:00,000 --> 00:00:01,500\nHello\n\n", server.render(result, "srt")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from whisper_ctranslate2.server import Server
+
+# Only imported when transcribing, diarizing or in live mode
+HEAVY_MODULES = ["numpy", "faster_whisper", "ctranslate2", "av", "tqdm", "torch"]
+# Generous to avoid failures in slow machines, the import takes a few tens of
+# milliseconds while importing the heavy modules takes several hundreds
+IMPORT_TIME_BUDGET_MS = 250
+
+
+def _run_python(code):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _get_import_times(stderr):
+    """Cumulative import time in microseconds by module"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_time(self):
+        process = _run_python("import whisper_ctranslate2.whisper_ctranslate2")
+        times = _get_import_times(process.stderr)
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+        self.assertLess(
+            times["whisper_ctranslate2.whisper_ctranslate2"] / 1000,
+            IMPORT_TIME_BUDGET_MS,
+        )
+
+    def test_validation_error_without_heavy_imports(self):
+        with tempfile.TemporaryDirectory() as directory:
+            process = _run_python(
+                "import sys\n"
+                "from whisper_ctranslate2.whisper_ctranslate2 import main\n"
+                f"sys.argv = ['whisper-ctranslate2', 'file.mp3', '--workers', '0', '--output_dir', {directory!r}]\n"
+                "main()\n"
+                f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+            )
+
+        self.assertIn("--workers must be 1 or greater", process.stderr)
+        self.assertEqual("", process.stdout.strip())
+
+    def test_client_without_heavy_imports(self):
+        transcribe = FakeTranscribe()
+        server = Server(transcribe, "transcribe", None, None, {}, 1, 1, False)
+        httpd = server.create_http_server("127.0.0.1", 0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        audio = os.path.join(os.path.dirname(__file__), "..", "e2e-tests", "gossos.mp3")
+
+        with tempfile.TemporaryDirectory() as directory:
+            process = _run_python(
+                "import sys\n"
+                "from whisper_ctranslate2.whisper_ctranslate2 import main\n"
+                f"sys.argv = ['whisper-ctranslate2', {audio!r}, '--server_url', 'http://127.0.0.1:{httpd.server_address[1]}', '--output_dir', {directory!r}]\n"
+                "main()\n"
+                f"print('Imported: ' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+            )
+
+            self.assertTrue(os.path.exists(os.path.join(directory, "gossos.txt")))
+
+        self.assertEqual(1, len(transcribe.calls))
+        self.assertEqual("Imported:", process.stdout.strip().splitlines()[-1])
+
+
+class FakeTranscribe:
+    def __init__(self):
+        self.calls = []
+
+    def inference(self, audio, task, language, verbose, live, options):
+        self.calls.append(audio)
+        return {
+            "text": " Hello",
+            "segments": [{"start": 0.0, "end": 1.5, "text": " Hello"}],
+            "language": "en",
+        }
+
+
+if __name__ == "__main__":
+    unittest.main()
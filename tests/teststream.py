@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from whisper_ctranslate2.inputs import is_stream
+from whisper_ctranslate2.stream import read_audio_stream
+from whisper_ctranslate2.transcribe import Transcribe, TranscriptionOptions
+
+SAMPLING_RATE = 16000
+
+
+class FakeTranscribe(Transcribe):
+    """Returns a segment every 8 seconds of audio with the second where it
+    starts, which is the value of the samples of the test audio"""
+
+    def __init__(self):
+        self.model = SimpleNamespace(
+            feature_extractor=SimpleNamespace(sampling_rate=SAMPLING_RATE),
+            frames_per_second=100,
+        )
+        self.windows = []
+
+    def transcribe_segments(self, audio, task, language, verbose, live, options):
+        self.windows.append(len(audio) / SAMPLING_RATE)
+        duration = len(audio) / SAMPLING_RATE
+        segments = []
+        for start in range(0, int(np.ceil(duration)), 8):
+            segments.append(
+                dict(
+                    id=len(segments) + 1,
+                    seek=0,
+                    start=float(start),
+                    end=min(start + 8.0, duration),
+                    text=f" {int(audio[start * SAMPLING_RATE])}",
+                    words=None,
+                )
+            )
+
+        return iter(segments), language
+
+
+class TestStream(unittest.TestCase):
+    def _get_chunks(self, duration):
+        for second in range(duration):
+            yield np.full(SAMPLING_RATE, second, dtype=np.float32)
+
+    def test_transcribe_stream(self):
+        transcribe = FakeTranscribe()
+        options = SimpleNamespace(condition_on_previous_text=False)
+
+        segments, language = transcribe.transcribe_stream(
+            self._get_chunks(70), "transcribe", "en", False, options
+        )
+        segments = list(segments)
+
+        self.assertEqual("en", language)
+        self.assertEqual([30, 30, 22], transcribe.windows)
+        self.assertEqual(list(range(1, 10)), [segment["id"] for segment in segments])
+        self.assertEqual(
+            [0, 8, 16, 24, 32, 40, 48, 56, 64],
+            [segment["start"] for segment in segments],
+        )
+        self.assertEqual(
+            [8, 16, 24, 32, 40, 48, 56, 64, 70],
+            [segment["end"] for segment in segments],
+        )
+        self.assertEqual(
+            [f" {second}" for second in range(0, 70, 8)],
+            [segment["text"] for segment in segments],
+        )
+
+    def test_transcribe_stream_conditions_on_previous_window(self):
+        transcribe = FakeTranscribe()
+        prompts = []
+
+        def transcribe_segments(audio, task, language, verbose, live, options):
+            prompts.append(options.initial_prompt)
+            return FakeTranscribe.transcribe_segments(
+                transcribe, audio, task, language, verbose, live, options
+            )
+
+        transcribe.transcribe_segments = transcribe_segments
+        options = TranscriptionOptions(
+            *([None] * len(TranscriptionOptions._fields))
+        )._replace(condition_on_previous_text=True)
+
+        segments, _ = transcribe.transcribe_stream(
+            self._get_chunks(40), "transcribe", "en", False, options
+        )
+        list(segments)
+
+        self.assertEqual([None, " 0 8 16"], prompts)
+
+    def test_read_audio_stream_raw(self):
+        samples = np.arange(-20000, 20000, dtype=np.int16)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "audio.raw")
+            samples.tofile(path)
+
+            chunks = list(read_audio_stream(path, "s16le"))
+
+        self.assertEqual(3, len(chunks))
+        np.testing.assert_array_equal(
+            samples.astype(np.float32) / 32768.0, np.concatenate(chunks)
+        )
+
+    def test_is_stream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "audio.mp3")
+            open(path, "wb").close()
+
+            self.assertTrue(is_stream("-"))
+            self.assertFalse(is_stream(path))
+            self.assertFalse(is_stream(os.path.join(directory, "missing.mp3")))
+
+            if hasattr(os, "mkfifo"):
+                fifo = os.path.join(directory, "fifo")
+                os.mkfifo(fifo)
+                self.assertTrue(is_stream(fifo))
+
+
+if __name__ == "__main__":
+    unittest.main()
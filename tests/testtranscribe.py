@@ -0,0 +1,461 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from types import SimpleNamespace
+from unittest import mock
+
+import faster_whisper.transcribe
+import numpy as np
+
+from faster_whisper.audio import decode_audio
+from faster_whisper.feature_extractor import FeatureExtractor
+from faster_whisper.transcribe import Segment, TranscriptionInfo
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from whisper_ctranslate2.metrics import collect_metrics
+from whisper_ctranslate2.options import TranscriptionOptions
+from whisper_ctranslate2.transcribe import Transcribe
+from whisper_ctranslate2.whisper_ctranslate2 import get_threads_per_worker, main
+
+E2E_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "e2e-tests")
+
+
+def get_transcription(audio):
+    segment = Segment(
+        id=1,
+        seek=0,
+        start=0.0,
+        end=1.0,
+        text=" Hello",
+        tokens=[],
+        avg_logprob=0,
+        compression_ratio=0,
+        no_speech_prob=0,
+        words=None,
+        temperature=0,
+    )
+    info = TranscriptionInfo(
+        language="en",
+        language_probability=1,
+        duration=len(audio) / 16000,
+        duration_after_vad=len(audio) / 16000,
+        all_language_probs=None,
+        transcription_options=None,
+        vad_options=None,
+    )
+    return iter([segment]), info
+
+
+class FakeWhisperModel:
+    instances = []
+    barrier = None
+
+    def __init__(self, model_path, **kwargs):
+        self.kwargs = kwargs
+        self.feature_extractor = SimpleNamespace(sampling_rate=16000)
+        self.callers = set()
+        self.lock = threading.Lock()
+        FakeWhisperModel.instances.append(self)
+
+    def encode(self, *args):
+        pass
+
+    generate_with_fallback = add_word_timestamps = detect_language = encode
+
+    def transcribe(self, audio, **kwargs):
+        with self.lock:
+            self.callers.add(threading.get_ident())
+        if FakeWhisperModel.barrier:
+            # Only passes if all the workers are transcribing at the same time
+            FakeWhisperModel.barrier.wait(timeout=10)
+        return get_transcription(audio)
+
+
+class FakePipeline:
+    batches = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate_segment_batched(self, *args):
+        pass
+
+    def forward(self, features, tokenizer, chunks_metadata, options):
+        FakePipeline.batches.append(len(features))
+        # One segment for each chunk, in the timeline of the concatenated speech
+        return [
+            [
+                dict(
+                    seek=0,
+                    start=chunk["offset"],
+                    end=chunk["offset"] + chunk["duration"],
+                    text=" text",
+                    tokens=[],
+                    avg_logprob=0,
+                    no_speech_prob=0,
+                    compression_ratio=0,
+                )
+            ]
+            for chunk in chunks_metadata
+        ]
+
+
+class TestTranscribe(unittest.TestCase):
+    def setUp(self):
+        FakeWhisperModel.instances = []
+
+    def test_workers_share_one_model(self):
+        FakeWhisperModel.barrier = threading.Barrier(4)
+        audio = os.path.join(E2E_DIRECTORY, "gossos.mp3")
+        with tempfile.TemporaryDirectory() as output_dir:
+            audio_files = []
+            for i in range(4):
+                audio_files.append(os.path.join(output_dir, f"{i}.mp3"))
+                shutil.copyfile(audio, audio_files[-1])
+
+            argv = [
+                "whisper-ctranslate2",
+                *audio_files,
+                "--output_dir",
+                output_dir,
+                "--output_format",
+                "json",
+                "--language",
+                "en",
+                "--threads",
+                "16",
+                "--workers",
+                "4",
+            ]
+            try:
+                with mock.patch(
+                    "whisper_ctranslate2.transcribe.WhisperModel", FakeWhisperModel
+                ), mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(
+                    io.StringIO()
+                ):
+                    main()
+            finally:
+                FakeWhisperModel.barrier = None
+
+            self.assertTrue(
+                all(os.path.exists(f"{path[:-4]}.json") for path in audio_files)
+            )
+
+        self.assertEqual(1, len(FakeWhisperModel.instances))
+        model = FakeWhisperModel.instances[0]
+        self.assertEqual(4, model.kwargs["num_workers"])
+        self.assertEqual(4, model.kwargs["cpu_threads"])
+        # The four workers transcribed at the same time with the same model
+        self.assertEqual(4, len(model.callers))
+
+    def test_stage_timers_only_with_metrics(self):
+        arguments = ["small", "cpu", 0, "int8", 4, None, False, False, None]
+        with mock.patch(
+            "whisper_ctranslate2.transcribe.WhisperModel", FakeWhisperModel
+        ):
+            transcribe = Transcribe(*arguments)
+            measured = Transcribe(*arguments, metrics=True)
+
+        self.assertFalse(hasattr(transcribe.model.encode, "__wrapped__"))
+        self.assertTrue(hasattr(measured.model.encode, "__wrapped__"))
+        # Only the instance is timed, not faster-whisper
+        self.assertFalse(hasattr(FakeWhisperModel.encode, "__wrapped__"))
+        self.assertFalse(
+            hasattr(faster_whisper.transcribe.get_speech_timestamps, "__wrapped__")
+        )
+
+        with collect_metrics() as metrics:
+            measured.model.encode()
+            transcribe.model.encode()
+        self.assertEqual(["encoder"], list(metrics.stages))
+
+    def test_reuse_speech_chunks(self):
+        calls = []
+
+        def transcribe(audio, **kwargs):
+            calls.append((audio, kwargs["vad_filter"]))
+            return get_transcription(audio)
+
+        transcribe_model = Transcribe.__new__(Transcribe)
+        transcribe_model.batched = False
+        transcribe_model.batch_size = None
+        transcribe_model.metrics = False
+        transcribe_model.model = SimpleNamespace(
+            feature_extractor=SimpleNamespace(sampling_rate=16000),
+            transcribe=transcribe,
+        )
+        options = TranscriptionOptions(
+            *([None] * len(TranscriptionOptions._fields))
+        )._replace(vad_filter=True, print_colors=False, word_timestamps=False)
+        audio = np.arange(5 * 16000, dtype=np.float32)
+        speech_chunks = [{"start": 32000, "end": 48000}]
+
+        result = transcribe_model.inference(
+            audio, "transcribe", "en", False, True, options, speech_chunks
+        )
+
+        np.testing.assert_array_equal(audio[32000:48000], calls[0][0])
+        self.assertFalse(calls[0][1])
+        self.assertEqual(2.0, result["segments"][0]["start"])
+        self.assertEqual(3.0, result["segments"][0]["end"])
+
+        # Without them faster-whisper runs the VAD
+        transcribe_model.inference(audio, "transcribe", "en", False, True, options)
+        self.assertEqual(len(audio), len(calls[1][0]))
+        self.assertTrue(calls[1][1])
+
+        # Unless it is measured as its own stage
+        transcribe_model.metrics = True
+        with mock.patch(
+            "whisper_ctranslate2.transcribe.get_speech_timestamps",
+            return_value=[{"start": 16000, "end": 48000}],
+        ), collect_metrics() as metrics:
+            transcribe_model.inference(audio, "transcribe", "en", False, True, options)
+        np.testing.assert_array_equal(audio[16000:48000], calls[2][0])
+        self.assertFalse(calls[2][1])
+        self.assertIn("vad", metrics.stages)
+
+    def test_batched_stages(self):
+        class FakeBatchedPipeline:
+            def __init__(self, model):
+                pass
+
+            def generate_segment_batched(self, *args):
+                pass
+
+            def transcribe(self, audio, **kwargs):
+                return get_transcription(audio)
+
+        with mock.patch(
+            "whisper_ctranslate2.transcribe.WhisperModel", FakeWhisperModel
+        ), mock.patch(
+            "whisper_ctranslate2.transcribe.BatchedInferencePipeline",
+            FakeBatchedPipeline,
+        ):
+            transcribe_model = Transcribe(
+                "small", "cpu", 0, "int8", 4, None, False, True, 8, metrics=True
+            )
+            options = TranscriptionOptions(
+                *([None] * len(TranscriptionOptions._fields))
+            )._replace(print_colors=False, word_timestamps=False)
+            with collect_metrics() as metrics:
+                transcribe_model.inference(
+                    np.zeros(16000, dtype=np.float32),
+                    "transcribe",
+                    "en",
+                    False,
+                    True,
+                    options,
+                )
+
+        # The pipeline extracts the features when it runs the VAD
+        self.assertIn("vad_and_features", metrics.stages)
+        self.assertNotIn("vad", metrics.stages)
+
+    def test_inference_packed(self):
+        FakePipeline.batches = []
+        transcribe_model = Transcribe.__new__(Transcribe)
+        transcribe_model.batch_size = 16
+        transcribe_model.metrics = False
+        transcribe_model.model = SimpleNamespace(
+            feature_extractor=FeatureExtractor(),
+            model=SimpleNamespace(is_multilingual=False),
+            hf_tokenizer=None,
+        )
+        options = TranscriptionOptions(
+            *([None] * len(TranscriptionOptions._fields))
+        )._replace(
+            temperature=[0.0],
+            suppress_tokens=[],
+            print_colors=False,
+            word_timestamps=False,
+        )
+        audios = [
+            decode_audio(os.path.join(E2E_DIRECTORY, "gossos.mp3")),
+            decode_audio(os.path.join(E2E_DIRECTORY, "dosparlants.mp3")),
+        ]
+
+        with mock.patch(
+            "whisper_ctranslate2.transcribe.BatchedInferencePipeline", FakePipeline
+        ), mock.patch("whisper_ctranslate2.transcribe.Tokenizer"):
+            results = transcribe_model.inference_packed(
+                audios, "transcribe", None, options
+            )
+
+        # The chunks of both files are packed in the same batch
+        self.assertEqual(1, len(FakePipeline.batches))
+        self.assertEqual(2, len(results))
+        chunks = 0
+        for audio, (result, language_probability) in zip(audios, results):
+            speech_chunks = get_speech_timestamps(
+                audio, VadOptions(max_speech_duration_s=30)
+            )
+            segments = result["segments"]
+            chunks += len(segments)
+            self.assertEqual("en", result["language"])
+            self.assertEqual(1, language_probability)
+            self.assertEqual(
+                list(range(1, len(segments) + 1)), [s["id"] for s in segments]
+            )
+            # Segments are back in the timeline of their own file
+            self.assertAlmostEqual(
+                speech_chunks[0]["start"] / 16000, segments[0]["start"], places=2
+            )
+            self.assertAlmostEqual(
+                speech_chunks[-1]["end"] / 16000, segments[-1]["end"], places=2
+            )
+
+        self.assertEqual(FakePipeline.batches[0], chunks)
+
+    def test_get_threads_per_worker(self):
+        self.assertEqual(0, get_threads_per_worker(0, 1))
+        self.assertEqual(8, get_threads_per_worker(16, 2))
+        self.assertEqual(1, get_threads_per_worker(2, 4))
+
+
+class FakePackedTranscribe:
+    packed = []
+    single = []
+    fail = False
+
+    print_result = Transcribe.print_result
+    _print_language = Transcribe._print_language
+
+    def __init__(self, *args, **kwargs):
+        self.model = SimpleNamespace(
+            feature_extractor=SimpleNamespace(sampling_rate=16000)
+        )
+
+    def _get_result(self):
+        segment = dict(id=1, start=0.0, end=1.0, text=" Hola.")
+        return dict(text=" Hola.", segments=[segment], language="ca")
+
+    def inference_packed(self, audios, task, language, options):
+        if FakePackedTranscribe.fail:
+            raise RuntimeError("Out of memory")
+
+        FakePackedTranscribe.packed.append(audios)
+        return [(self._get_result(), 0.75) for _ in audios]
+
+    def inference(self, audio, task, language, verbose, live, options, *args):
+        FakePackedTranscribe.single.append(audio)
+        return self._get_result()
+
+
+class TestPackedMain(unittest.TestCase):
+    def setUp(self):
+        FakePackedTranscribe.packed = []
+        FakePackedTranscribe.single = []
+        FakePackedTranscribe.fail = False
+
+    def _run(self, output_dir, *args):
+        argv = [
+            "whisper-ctranslate2",
+            os.path.join(E2E_DIRECTORY, "gossos.mp3"),
+            os.path.join(E2E_DIRECTORY, "dosparlants.mp3"),
+            "--output_dir",
+            output_dir,
+            "--output_format",
+            "json",
+            "--batched",
+            "True",
+            "--batch_files",
+            "2",
+            *args,
+        ]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch(
+            "whisper_ctranslate2.transcribe.Transcribe", FakePackedTranscribe
+        ), mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(
+            stdout
+        ), contextlib.redirect_stderr(
+            stderr
+        ):
+            main()
+
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_packed(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            stdout, _ = self._run(output_dir, "--metrics", "True")
+
+            with open(os.path.join(output_dir, "gossos.json")) as f:
+                metrics = json.load(f)["metrics"]
+
+        self.assertEqual(1, len(FakePackedTranscribe.packed))
+        self.assertTrue(
+            all(isinstance(a, np.ndarray) for a in FakePackedTranscribe.packed[0])
+        )
+        self.assertEqual([], FakePackedTranscribe.single)
+        # The same output as when the files are transcribed one by one
+        self.assertEqual(
+            2, stdout.count("Detected language 'Catalan' with probability 0.750000")
+        )
+        self.assertEqual(2, stdout.count("[00:00.000 --> 00:01.000]  Hola."))
+        self.assertAlmostEqual(32.3, metrics["audio_duration"], places=1)
+        self.assertIn("decode", metrics["stages"])
+
+    def test_prefetch_metrics(self):
+        for batch_files in ["1", "2"]:
+            with tempfile.TemporaryDirectory() as output_dir:
+                self._run(
+                    output_dir,
+                    "--metrics",
+                    "True",
+                    "--prefetch",
+                    "2",
+                    "--batch_files",
+                    batch_files,
+                )
+
+                with open(os.path.join(output_dir, "gossos.json")) as f:
+                    metrics = json.load(f)["metrics"]
+
+            # Decoded in the prefetch threads
+            self.assertGreater(metrics["stages"]["decode"], 0)
+
+    def test_packed_results_cached_apart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ["--result_cache_dir", os.path.join(directory, "cache")]
+            self._run(directory, *cache)
+            self._run(directory, *cache)
+            self.assertEqual(1, len(FakePackedTranscribe.packed))
+            self.assertEqual([], FakePackedTranscribe.single)
+
+            # Not served to the files transcribed one by one
+            self._run(directory, *cache, "--batch_files", "1")
+            self.assertEqual(2, len(FakePackedTranscribe.single))
+
+    def test_packed_fallback(self):
+        FakePackedTranscribe.fail = True
+        with tempfile.TemporaryDirectory() as output_dir:
+            _, stderr = self._run(output_dir)
+
+            self.assertEqual(
+                ["dosparlants.json", "gossos.json"], sorted(os.listdir(output_dir))
+            )
+
+        self.assertIn("transcribing them one by one: Out of memory", stderr)
+        # The audio decoded to pack the files is not decoded again
+        self.assertEqual(2, len(FakePackedTranscribe.single))
+        self.assertTrue(
+            all(isinstance(a, np.ndarray) for a in FakePackedTranscribe.single)
+        )
+
+    def test_packed_server_url(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            _, stderr = self._run(output_dir, "--server_url", "http://localhost:1")
+
+        self.assertIn("--batch_files cannot be used with --server_url", stderr)
+        self.assertEqual([], FakePackedTranscribe.packed)
+
+
+if __name__ == "__main__":
+    unittest.main()
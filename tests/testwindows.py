@@ -0,0 +1,67 @@
+import unittest
+
+from whisper_ctranslate2.windows import get_window_boundaries, stitch_windows
+
+
+class TestWindows(unittest.TestCase):
+    def test_get_window_boundaries(self):
+        speech_chunks = [
+            {"start": 0, "end": 100},
+            {"start": 200, "end": 480},
+            {"start": 520, "end": 700},
+            {"start": 760, "end": 1000},
+        ]
+
+        boundaries = get_window_boundaries(speech_chunks, 1000, 2)
+
+        self.assertEqual([(0, 500), (500, 1000)], boundaries)
+
+    def test_get_window_boundaries_cuts_at_silences(self):
+        speech_chunks = [
+            {"start": 0, "end": 100},
+            {"start": 200, "end": 480},
+            {"start": 520, "end": 700},
+            {"start": 760, "end": 1000},
+        ]
+
+        boundaries = get_window_boundaries(speech_chunks, 1000, 3)
+
+        self.assertEqual([(0, 500), (500, 730), (730, 1000)], boundaries)
+
+    def test_get_window_boundaries_not_enough_silences(self):
+        speech_chunks = [{"start": 0, "end": 400}, {"start": 600, "end": 1000}]
+
+        boundaries = get_window_boundaries(speech_chunks, 1000, 4)
+
+        self.assertEqual([(0, 500), (500, 1000)], boundaries)
+        self.assertEqual([(0, 1000)], get_window_boundaries([], 1000, 4))
+
+    def test_stitch_windows(self):
+        def segment(start, end, text):
+            return dict(
+                id=1,
+                seek=0,
+                start=start,
+                end=end,
+                text=text,
+                words=[dict(start=start, end=end, word=text, probability=1)],
+            )
+
+        results = [
+            dict(text=" Hello", segments=[segment(0.5, 1.5, " Hello")], language="en"),
+            dict(
+                text=" friends", segments=[segment(0.2, 2, " friends")], language="en"
+            ),
+        ]
+
+        result = stitch_windows(results, [0, 10.5], 100)
+
+        self.assertEqual(" Hello friends", result["text"])
+        self.assertEqual("en", result["language"])
+        second = result["segments"][1]
+        self.assertEqual(2, second["id"])
+        self.assertEqual(1050, second["seek"])
+        self.assertEqual(10.7, second["start"])
+        self.assertEqual(12.5, second["end"])
+        self.assertEqual(10.7, second["words"][0]["start"])
+        self.assertEqual(0.5, result["segments"][0]["start"])
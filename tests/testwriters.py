@@ -2,16 +2,22 @@ import json
 import os
 import unittest
 
+from io import StringIO
 from tempfile import NamedTemporaryFile
+from unittest import mock
 
 from faster_whisper.transcribe import Segment, Word
 
 from whisper_ctranslate2.writers import (
+    StreamingWriter,
     WriteJSON,
+    WriteJSONL,
     WriteSRT,
     WriteTSV,
     WriteTXT,
     WriteVTT,
+    get_writer,
+    get_writers,
 )
 
 
@@ -165,6 +171,44 @@ class TestWriters(unittest.TestCase):
         self.assertEqual("00:00:01,000 --> 00:00:05,000\n", r[1], "text")
         self.assertEqual("[John]: Hello\n", r[2], "text")
 
+    def test_write_srt_speaker_change(self):
+        segments = [
+            self._get_segment("Hello", start=1, end=2),
+            self._get_segment("friends", start=2, end=3),
+        ]
+        segments[0]["speaker"] = "John"
+        segments[0]["words"] = [
+            dict(
+                Word(start=1, end=2, word="Hello", probability=0)._asdict(),
+                speaker="John",
+            ),
+        ]
+        segments[1]["speaker"] = "Mary"
+        segments[1]["words"] = [
+            dict(
+                Word(start=2, end=3, word=" friends", probability=0)._asdict(),
+                speaker="Mary",
+            ),
+        ]
+
+        results = {"text": "all text", "segments": segments}
+
+        filename, dirname = self._get_temp_file_name_dir()
+        subtitlesWriter = WriteSRT(output_dir=dirname)
+        subtitlesWriter(
+            results,
+            filename,
+            {"max_line_width": 40, "max_line_count": 2, "max_words_per_line": 5},
+        )
+        r = self._read_subtitles(filename + ".srt")
+
+        self.assertEqual(8, len(r), "text")
+        self.assertEqual("00:00:01,000 --> 00:00:02,000\n", r[1], "text")
+        self.assertEqual("[John]: Hello\n", r[2], "text")
+        self.assertEqual("2\n", r[4], "text")
+        self.assertEqual("00:00:02,000 --> 00:00:03,000\n", r[5], "text")
+        self.assertEqual("[Mary]: friends\n", r[6], "text")
+
     def test_write_srt_words_max_line_width(self):
         segment = self._get_segment("Hello friends", start=1, end=5)
         segments = [segment]
@@ -240,6 +284,20 @@ class TestWriters(unittest.TestCase):
         self.assertEqual("friends\n", r[6], "text")
         self.assertEqual("\n", r[7], "text")
 
+    def test_write_returns_output_path(self):
+        segments = [self._get_segment("Hello my friends.")]
+        results = {"text": "all text", "segments": segments}
+
+        filename, dirname = self._get_temp_file_name_dir()
+        output_path = WriteTXT(output_dir=dirname)(results, filename, dict())
+
+        self.assertEqual(filename + ".txt", output_path)
+        basename = os.path.basename(filename)
+        self.assertEqual(
+            [basename + ".txt"],
+            [name for name in os.listdir(dirname) if name.startswith(basename)],
+        )
+
     def test_write_json(self):
         segment = self._get_segment("Hello", start=0, end=0)
         segments = [segment]
@@ -285,6 +343,137 @@ class TestWriters(unittest.TestCase):
         self.assertEqual(WORD_START, word_dict["start"])
         self.assertEqual(WORD_END, word_dict["end"])
 
+    def _write_streaming(self, writer, results, options):
+        output = StringIO()
+        writer.start(output, options)
+        for segment in results["segments"]:
+            writer.write_segment(segment, output, options)
+        writer.finish({"text": results["text"], "language": "ca"}, output, options)
+        return output.getvalue()
+
+    def test_write_streaming_same_output(self):
+        segments = [
+            self._get_segment("Hello my friends.", start=1, end=5),
+            self._get_segment("How are you?", start=6.5, end=8),
+        ]
+        segments[1]["words"] = [
+            Word(start=6.5, end=7, word=" How", probability=0)._asdict(),
+            Word(start=7, end=8, word=" are you?", probability=0)._asdict(),
+        ]
+        results = {"text": "all text", "segments": segments, "language": "ca"}
+
+        for writer in [WriteTXT, WriteSRT, WriteVTT, WriteTSV, WriteJSON, WriteJSONL]:
+            for options in [{}, {"pretty_json": True, "max_words_per_line": 1}]:
+                expected = StringIO()
+                writer(None).write_result(results, expected, options)
+
+                streamed = self._write_streaming(writer(None), results, options)
+
+                self.assertEqual(expected.getvalue(), streamed, writer.extension)
+
+    def test_write_streaming_json_no_segments(self):
+        results = {"text": "", "segments": [], "language": "ca"}
+
+        for options in [{}, {"pretty_json": True}]:
+            streamed = self._write_streaming(WriteJSON(None), results, options)
+            self.assertEqual(results, json.loads(streamed))
+
+    def test_write_jsonl(self):
+        segments = [
+            self._get_segment("Hello my friends.", start=1, end=5),
+            self._get_segment("How are you?", start=6.5, end=8),
+        ]
+        results = {"text": "all text", "segments": segments}
+
+        filename, dirname = self._get_temp_file_name_dir()
+        WriteJSONL(output_dir=dirname)(results, filename, {})
+        r = self._read_subtitles(filename + ".jsonl")
+
+        self.assertEqual(2, len(r))
+        self.assertEqual(segments[1], json.loads(r[1]))
+
+    def test_streaming_writer(self):
+        filename, dirname = self._get_temp_file_name_dir()
+        writers = get_writers("all", dirname)
+
+        with StreamingWriter(writers, filename, {}) as writer:
+            writer.write_segment(self._get_segment("Hello my friends."))
+            with open(filename + ".txt") as f:
+                self.assertEqual("Hello my friends.\n", f.read())
+
+            outputs = writer.finish({"text": "Hello my friends.", "language": "en"})
+
+        self.assertEqual(5, len(outputs))
+        for output in outputs:
+            self.assertTrue(os.path.exists(output))
+            os.remove(output)
+
+    def test_write_all_formats(self):
+        segments = [
+            self._get_segment("Hello my friends.", start=1, end=2.5),
+            self._get_segment("How are you?", start=3, end=4),
+        ]
+        segments[0]["words"] = [
+            Word(start=1, end=1.5, word=" Hello", probability=0)._asdict(),
+            Word(start=1.5, end=2, word=" my", probability=0)._asdict(),
+            Word(start=2, end=2.5, word=" friends.", probability=0)._asdict(),
+        ]
+        segments[1]["words"] = [
+            Word(start=3, end=3.5, word=" How are", probability=0)._asdict(),
+            Word(start=3.5, end=4, word=" you?", probability=0)._asdict(),
+        ]
+        segments[1]["speaker"] = "John"
+        results = {"text": "all text", "segments": segments, "language": "en"}
+        options = {"max_line_width": 10, "max_line_count": 1, "highlight_words": True}
+
+        filename, dirname = self._get_temp_file_name_dir()
+        with mock.patch("tempfile.TemporaryFile") as temporary_file:
+            outputs = get_writer("all", dirname)(results, filename, options)
+
+        # The complete result is written as JSON without keeping the segments
+        temporary_file.assert_not_called()
+        self.assertEqual(5, len(outputs))
+        for writer, output in zip(get_writers("all", dirname), outputs):
+            expected = StringIO()
+            writer.write_result(results, expected, options)
+            with open(output, encoding="utf-8") as f:
+                self.assertEqual(expected.getvalue(), f.read())
+            os.remove(output)
+
+        self.assertFalse(
+            any(
+                name.startswith(os.path.basename(filename))
+                for name in os.listdir(dirname)
+            )
+        )
+
+    def test_atomic_writer_keeps_no_outputs(self):
+        filename, dirname = self._get_temp_file_name_dir()
+
+        with self.assertRaises(RuntimeError):
+            with StreamingWriter(
+                get_writers("all", dirname), filename, {}, atomic=True
+            ) as writer:
+                writer.write_segment(self._get_segment("Hello my friends."))
+                raise RuntimeError()
+
+        self.assertFalse(
+            any(
+                name.startswith(os.path.basename(filename))
+                for name in os.listdir(dirname)
+            )
+        )
+
+    def test_streaming_writer_removes_partial_outputs(self):
+        filename, dirname = self._get_temp_file_name_dir()
+
+        with self.assertRaises(RuntimeError):
+            with StreamingWriter(get_writers("txt", dirname), filename, {}) as writer:
+                writer.write_segment(self._get_segment("Hello my friends."))
+                raise RuntimeError()
+
+        self.assertFalse(os.path.exists(filename + ".txt"))
+
 
 if __name__ == "__main__":
     unittest.main()